@@ -0,0 +1,3 @@
+from src.app import main
+
+main()
@@ -0,0 +1,150 @@
+from rich.console import Console
+
+import os
+
+from src.runner import PREDICTOR_TYPES, COMPARE_ALL, run_cells, trace_files
+from src.utils.utils import load_results_table, saved_predictors, empty_table, export_results
+import inquirer
+
+csvFolder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Data', 'csv'))
+console = Console()
+
+
+def get_user_selections():
+    questions = [
+        inquirer.List('action',
+                      message="Select an action",
+                      choices=['View Saved Data', 'Export Saved Data', 'Test All', 'Select Files', 'Exit']),
+    ]
+
+    action = inquirer.prompt(questions)['action']
+
+    if action == 'Exit':
+        return 'exit', None
+
+    if action == 'View Saved Data':
+        predictors = saved_predictors()
+        if not predictors:
+            console.print("[red]No saved data found.[/red]")
+            return None, None
+
+        predictor_choice = inquirer.prompt([
+            inquirer.List('predictor',
+                          message="Select the results to view",
+                          choices=predictors + ['All Predictors'])
+        ])['predictor']
+
+        predictor = None if predictor_choice == 'All Predictors' else predictor_choice
+        return 'view', load_results_table(predictor)
+
+    if action == 'Export Saved Data':
+        # The CSV files in Data/csv are only written on request, not on every save or view
+        predictors = saved_predictors()
+        if not predictors:
+            console.print("[red]No saved data found.[/red]")
+            return None, None
+        return 'export', predictors
+
+    elif action == 'Test All' or action == 'Select Files':
+        predictor_question = [
+            inquirer.List('predictor',
+                          message="Select the predictor type",
+                          choices=list(PREDICTOR_TYPES) + [COMPARE_ALL])
+        ]
+        predictor_type = inquirer.prompt(predictor_question)['predictor']
+
+        if action == 'Test All':
+            return 'test_all', predictor_type
+
+        else:  # Select Files
+            size_question = [
+                inquirer.List('size',
+                              message="Select the size for the predictor",
+                              choices=['1', '2', '4', '8', '16', '64', '256', '1024', '4096', '16384', '65536',
+                                       '262144', '1048576'])
+            ]
+
+            file_question = [
+                inquirer.Checkbox('files',
+                                  message="Select files to process (Press -> To select and Enter to confirm)",
+                                  choices=trace_files()),
+            ]
+
+            size = inquirer.prompt(size_question)['size']
+            files = inquirer.prompt(file_question)['files']
+
+            return 'select', (files, int(size), predictor_type)
+
+    else:
+        console.print("[red]Invalid action. Please try again.[/red]")
+        return None, None
+
+
+def process_selected_files(selected_files, sizes, predictor_type, streaming=False, processes=False, max_workers=None, use_cache=True,
+                           checkpoints=False, shards=1, instrument=False, profile=False, show_progress=True, branch_stats=0,
+                           window=0, half_life=None, plot=False):
+
+
+    if not selected_files:
+        print("No files selected. Exiting.")
+        return
+
+    # One result per (file, predictor type, size), in table order
+    predictor_types = list(PREDICTOR_TYPES) if predictor_type == COMPARE_ALL else [predictor_type]
+    cells = [(file, name, size) for file in selected_files for name in predictor_types for size in sizes]
+    accuracies, approximate = run_cells(cells, streaming, processes, max_workers, use_cache, checkpoints, shards, show_progress,
+                           instrument=instrument, profile=profile, branch_stats=branch_stats,
+                           window=window, half_life=half_life, plot=plot)
+
+    # Create and display the results table, with a predictor column when several types were run
+    table = empty_table(predictor_column=len(predictor_types) > 1)
+
+    for cell in cells:
+        file, name, size = cell
+        # Approximate sharded results are marked with a ~
+        mark = '~' if cell in approximate else ''
+        pred_accuracy, total_accuracy, prediction_percentage = accuracies[cell]
+        row = (file, str(size), f"{mark}{pred_accuracy:.2f}%", f"{mark}{total_accuracy:.2f}%",
+               f"{mark}{prediction_percentage:.2f}%")
+        table.add_row(*(row[:1] + (name,) + row[1:] if len(predictor_types) > 1 else row))
+    if approximate:
+        table.caption = "~ approximate: sharded results reconciliation could only bound"
+
+
+
+    console.print("\n")
+    console.print(table)
+
+def main():
+    while True:
+        console.print("\n[bold cyan]Branch Prediction Analysis[/bold cyan]")
+        action, data = get_user_selections()
+
+        if action == 'exit':
+            console.print("[yellow]Exiting the program. Goodbye![/yellow]")
+            break
+
+        if action == 'view':
+            if data:
+                console.print(data)
+            else:
+                console.print("[red]No data to display.[/red]")
+        elif action == 'export':
+            export_results(data)
+        elif action == 'test_all':
+            sizes = [1, 2, 4, 8, 16]
+            process_selected_files(trace_files(), sizes, data, processes=True)
+
+        elif action == 'select':
+            selected_files, size, predictor_type = data
+            process_selected_files(selected_files, [size], predictor_type)
+        else:
+            console.print("[red]Invalid action. Please try again.[/red]")
+
+        # Ask if the user wants to continue
+        if not inquirer.confirm("Do you want to perform another action?"):
+            console.print("[yellow]Exiting the program. Goodbye![/yellow]")
+            break
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,251 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import re
+import sys
+import time
+
+# Headless batch runner: simulates traces x predictors x sizes and writes the results as JSON or CSV, to
+# stdout by default, with progress and messages on stderr. Options can also come from a JSON config file
+# holding the same keys as the long options (traces, predictors, sizes, workers, ...); command line options
+# take precedence. The engine is only imported once the arguments are parsed, and nothing of the
+# interactive menu is, so a run pays for what it simulates and little else.
+#
+#   python -m src.cli --traces s10k.txt --predictors two-bit improved --sizes 4 16 --format csv
+#
+# --history-bits turns every gshare and tournament predictor into one per history length, named for
+# instance 'Gshare Predictor 8 History Bits' in the results, the result cache and the results store:
+#
+#   python -m src.cli --traces gcc-16M.txt --predictors gshare --sizes 65536 --history-bits 4 8 12 16
+#
+# A sweep can also be spread over several processes or hosts: one run listens as the coordinator and any
+# number of workers connect to it, for instance all on this host:
+#
+#   python -m src.cli --coordinator 127.0.0.1:0 --local-workers 4 --format csv
+#   python -m src.cli --coordinator 0.0.0.0:7000 ...    and on every other host:    python -m src.cli --worker HOST:7000
+#
+# Workers need the coordinator's key in BP_AUTHKEY: set it on every host, or let the coordinator draw one
+# and copy the value it prints.
+
+# exact is false for sharded results that reconciliation could only bound
+RESULT_FIELDS = ('trace', 'predictor', 'size', 'pred_accuracy', 'total_accuracy', 'prediction_percentage', 'exact')
+DEFAULTS = {
+    'traces': None,
+    'predictors': ['all'],
+    'sizes': [1, 2, 4, 8, 16],
+    'history_bits': None,
+    'workers': None,
+    'processes': False,
+    'streaming': False,
+    'shards': 1,
+    'checkpoints': False,
+    'cache': True,
+    'save': False,
+    'export_csv': False,
+    'progress': False,
+    'instrument': False,
+    'profile': False,
+    'branch_stats': 0,
+    'window': 0,
+    'half_life': None,
+    'plot': False,
+    'coordinator': None,
+    'local_workers': 0,
+    'format': 'json',
+    'output': '-',
+}
+
+
+def predictor_key(name: str) -> str:
+    # 'two-bit', 'Two Bit Predictor' and 'TwoBitPredictor' all name the same predictor type
+    return re.sub(r'[^a-z0-9]', '', name.lower()).removesuffix('predictor')
+
+
+def resolve_predictors(names, predictor_types):
+    by_key = {predictor_key(name): name for name in predictor_types}
+    # Class names are looked up by name, so resolving does not import every predictor module
+    by_key.update({predictor_key(predictor_types.class_name(name)): name for name in predictor_types})
+
+    resolved = []
+    for name in names:
+        if predictor_key(name) == 'all':
+            resolved.extend(predictor_types)
+        elif predictor_key(name) in by_key:
+            resolved.append(by_key[predictor_key(name)])
+        else:
+            raise ValueError(f"unknown predictor {name!r}, expected one of "
+                             f"{', '.join(predictor_key(name) for name in predictor_types)} or all")
+    return list(dict.fromkeys(resolved))
+
+
+def resolve_history_bits(names, history_lengths, predictor_types):
+    # Every global-history predictor type once per history length, named as runner.history_name does
+    from src.runner import history_name
+
+    if any(history_bits < 0 for history_bits in history_lengths):
+        raise ValueError(f"history lengths are at least 0, not {min(history_lengths)}")
+    if not any(hasattr(predictor_types[name], 'with_history') for name in names):
+        raise ValueError("--history-bits needs a predictor with a global history, such as gshare or tournament")
+    resolved = []
+    for name in names:
+        if hasattr(predictor_types[name], 'with_history'):
+            resolved.extend(history_name(name, history_bits) for history_bits in history_lengths)
+        else:
+            resolved.append(name)
+    return list(dict.fromkeys(resolved))
+
+
+def resolve_traces(names, filesFolder, trace_files):
+    # Names of files in Data/txt, or paths to trace files anywhere else
+    if not names:
+        return trace_files()
+
+    traces = []
+    for name in names:
+        if os.path.exists(os.path.join(filesFolder, name)):
+            traces.append(name)
+        elif os.path.isfile(name):
+            path = os.path.abspath(name)
+            traces.append(os.path.basename(path) if os.path.dirname(path) == filesFolder else path)
+        else:
+            raise ValueError(f"trace {name!r} not found in {filesFolder} or as a path")
+    return traces
+
+
+def parse_address(address: str):
+    # 'host:port' -> (host, port)
+    host, separator, port = address.rpartition(':')
+    if not separator or not port.isdigit():
+        raise ValueError(f"expected an address as host:port, not {address!r}")
+    return host or '127.0.0.1', int(port)
+
+
+def load_config(path: str) -> dict:
+    with open(path, 'r') as file:
+        config = json.load(file)
+    unknown = set(config) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"unknown keys in {path}: {', '.join(sorted(unknown))}")
+    return config
+
+
+def write_results(rows, wall_time, output_format, output):
+    file = sys.stdout if output == '-' else open(output, 'w', newline='')
+    try:
+        if output_format == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(RESULT_FIELDS)
+            writer.writerows(rows)
+        else:
+            json.dump({'wall_time': wall_time, 'results': [dict(zip(RESULT_FIELDS, row)) for row in rows]}, file, indent=2)
+            file.write('\n')
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate branch predictors on traces without the interactive menu")
+    parser.add_argument('--config', help="JSON file with default values for the options below")
+    parser.add_argument('--traces', nargs='+', help="trace names in Data/txt or paths (default: every trace in Data/txt)")
+    parser.add_argument('--predictors', nargs='+', help="predictor types such as one-bit, two-bit, improved, or all (default)")
+    parser.add_argument('--sizes', type=int, nargs='+', help="predictor table sizes (default: 1 2 4 8 16)")
+    parser.add_argument('--history-bits', type=int, nargs='+', metavar='N',
+                        help="global history lengths of the gshare and tournament predictors, each a predictor "
+                             "of its own (default: log2 of the size)")
+    parser.add_argument('--workers', type=int, help="parallel jobs (default: one per CPU)")
+    parser.add_argument('--processes', action='store_true', default=None, help="run jobs in worker processes instead of threads")
+    parser.add_argument('--streaming', action='store_true', default=None, help="read the text traces while simulating them")
+    parser.add_argument('--shards', type=int, help="split every trace into this many shards")
+    parser.add_argument('--checkpoints', action='store_true', default=None, help="snapshot and resume long simulations")
+    parser.add_argument('--no-cache', dest='cache', action='store_false', default=None, help="simulate every result again")
+    parser.add_argument('--save', action='store_true', default=None, help="also record the results in the results store")
+    parser.add_argument('--export-csv', action='store_true', default=None,
+                        help="write the stored results of the simulated predictor types to Data/csv")
+    parser.add_argument('--progress', action='store_true', default=None, help="show progress bars on stderr")
+    parser.add_argument('--instrument', action='store_true', default=None, help="record per-phase timings to Data/profiles")
+    parser.add_argument('--profile', action='store_true', default=None, help="like --instrument, with cProfile")
+    parser.add_argument('--branch-stats', type=int, metavar='N',
+                        help="print the N hardest to predict branches of every result on stderr and write "
+                             "per-branch tables to Data/csv/branches")
+    parser.add_argument('--window', type=int, metavar='N',
+                        help="record coverage and accuracy per window of N branches to Data/csv/windows")
+    parser.add_argument('--half-life', type=float, metavar='N',
+                        help="also record them exponentially decayed, halving the weight every N branches")
+    parser.add_argument('--plot', action='store_true', default=None,
+                        help="plot the windows of every trace to Data/plots")
+    parser.add_argument('--coordinator', metavar='HOST:PORT',
+                        help="listen on HOST:PORT and run the sweep on the workers that connect to it (port 0 picks one)")
+    parser.add_argument('--local-workers', type=int, metavar='N', help="with --coordinator, also start N workers on this host")
+    parser.add_argument('--worker', metavar='HOST:PORT', help="run jobs for the coordinator at HOST:PORT until it is done, "
+                                                                 "with its key in BP_AUTHKEY")
+    parser.add_argument('--format', choices=('json', 'csv'), help="output format (default: json)")
+    parser.add_argument('--output', help="output file, - for stdout (default)")
+    args = parser.parse_args(argv)
+
+    try:
+        config = load_config(args.config) if args.config else {}
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    options = dict(DEFAULTS, **config)
+    options.update({key: value for key, value in vars(args).items() if key in DEFAULTS and value is not None})
+
+    try:
+        coordinator = parse_address(options['coordinator']) if options['coordinator'] else None
+        worker = parse_address(args.worker) if args.worker else None
+    except ValueError as error:
+        parser.error(str(error))
+    if worker is not None:
+        # A worker simulates whatever its coordinator sends and writes no results of its own
+        from src.utils.distributed import run_worker, authkey
+        try:
+            key = authkey()
+        except ValueError as error:
+            parser.error(str(error))
+        run_worker(worker, key)
+        return 0
+    if coordinator is not None and (options['branch_stats'] or options['streaming'] or options['checkpoints']
+                                    or options['shards'] > 1):
+        parser.error("--coordinator runs every cell as one whole-trace job, without streaming, checkpoints, "
+                     "shards or branch statistics")
+
+    from src.runner import PREDICTOR_TYPES, filesFolder, trace_files, run_cells
+
+    try:
+        predictors = resolve_predictors(options['predictors'], PREDICTOR_TYPES)
+        traces = resolve_traces(options['traces'], filesFolder, trace_files)
+        if options['history_bits']:
+            predictors = resolve_history_bits(predictors, options['history_bits'], PREDICTOR_TYPES)
+    except ValueError as error:
+        parser.error(str(error))
+    if not traces:
+        parser.error(f"no traces to simulate in {filesFolder}")
+    for name in predictors:
+        for size in options['sizes']:
+            try:
+                PREDICTOR_TYPES[name].check_size(size)
+            except ValueError as error:
+                parser.error(f"{name} of size {size}: {error}")
+
+    cells = [(trace, name, size) for trace in traces for name in predictors for size in options['sizes']]
+    started = time.perf_counter()
+    # Whatever the engine prints goes to stderr, stdout only carries the results
+    with contextlib.redirect_stdout(sys.stderr):
+        accuracies, approximate = run_cells(cells, options['streaming'], options['processes'], options['workers'], options['cache'],
+                               options['checkpoints'], options['shards'], options['progress'], options['save'],
+                               options['instrument'], options['profile'], options['branch_stats'], options['window'],
+                               options['half_life'], options['plot'], coordinator, options['local_workers'])
+    wall_time = time.perf_counter() - started
+    if options['export_csv']:
+        with contextlib.redirect_stdout(sys.stderr):
+            from src.utils.utils import export_results
+            export_results(predictors)
+
+    write_results([cell + accuracies[cell] + (cell not in approximate,) for cell in cells], wall_time, options['format'], options['output'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,51 +1,142 @@
-from typing import List, Tuple
-from rich.progress import Progress, TaskID
-from rich.console import Console
+from __future__ import annotations
 
-console = Console()
+import os
+from typing import TYPE_CHECKING, Iterator, Tuple
 
-class Branch(List[Tuple[str, str]]):
-    def __init__(self, filePath: str, percentage: float = 100.0, progress_toggle: bool = True, external_progress: Progress = None, external_task_id: TaskID = None):
-        super().__init__()
-        percentage = max(0.0, min(100.0, percentage))
+import numpy as np
+
+from src.utils.trace import open_trace
+from src.utils.instrumentation import timed
+from src.utils.progress import ProgressCounter, reporter
+
+if TYPE_CHECKING:
+    from rich.progress import Progress, TaskID
 
-        with open(filePath, 'r') as file:
-            lines = file.readlines()
+OUTCOMES = ('N', 'T')
+ITER_CHUNK_SIZE = 1 << 18
 
-        total_lines = len(lines)
-        lines_to_read = int(total_lines * (percentage / 100))
-        update_interval = max(1, lines_to_read // 100)
+class Branch:
+    @timed('load')
+    def __init__(self, filePath: str, percentage: float = 100.0, progress_toggle: bool = True, external_progress: Progress = None, external_task_id: TaskID = None,
+                 counter: ProgressCounter = None):
+        # Progress goes to counter when one is given, otherwise to the external task or a progress bar of its own
+        percentage = max(0.0, min(100.0, percentage))
+        task = None
+
+        if counter is None and not (external_progress and external_task_id is not None) and progress_toggle:
+            from rich.progress import Progress
 
-        if external_progress and external_task_id is not None:
-            progress = external_progress
-            task = external_task_id
-        elif progress_toggle:
             progress = Progress()
-            task = progress.add_task("[cyan]Loading branches...", total=lines_to_read)
+            task = progress.add_task("[cyan]Loading branches...", total=os.path.getsize(filePath))
+            report = reporter(progress=progress, task=task)
         else:
-            progress = None
-            task = None
+            report = reporter(counter, external_progress, external_task_id)
 
         try:
-            if progress and not external_progress:
+            if task is not None:
                 progress.start()
 
-            for i, line in enumerate(lines[:lines_to_read]):
-                address, taken = line.strip().split()
-                self.append((address, taken))
+            # Load progress is counted in source bytes. The text trace is converted to the binary
+            # cache on first use, later loads only mmap it and complete the task in one step.
+            loaded_bytes = 0
+
+            def advance(consumed):
+                nonlocal loaded_bytes
+                loaded_bytes += consumed
+                report(consumed)
 
-                if progress and (i + 1) % update_interval == 0:
-                    progress.update(task, advance=update_interval)
-                    if not external_progress:
-                        progress.update(description = f"[cyan]Loaded {i + 1}/{lines_to_read} branches")
+            self.trace = open_trace(filePath, on_progress=advance if report else None)
 
-            if progress and not external_progress:
-                progress.update(task, completed=lines_to_read)
+            total_lines = len(self.trace)
+            lines_to_read = int(total_lines * (percentage / 100))
+            self._attach(self.trace, lines_to_read)
+
+            if report:
+                report(max(0, self.trace.header.source_size - loaded_bytes))
+            if task is not None:
+                progress.update(task, description=f"[cyan]Loaded {lines_to_read}/{lines_to_read} branches")
 
         finally:
-            if progress and not external_progress:
+            if task is not None:
                 progress.stop()
 
-        if progress_toggle and not external_progress:
-            console.print(
+        if task is not None:
+            progress.console.print(
                 f"[green]Successfully loaded {len(self)} branches from {filePath} ({percentage:.1f}% of file)")
+
+    def _attach(self, trace, count: int):
+        # One uint32 static ID and one outcome bit per dynamic branch, addresses live in the ID table
+        self.trace = trace
+        self.ids = trace.ids[:count]
+        self.outcomes = trace.outcomes[:(count + 7) // 8]
+        self.address_format = trace.address_format
+        self.static_addresses = trace.static_addresses
+        self.address_table = [format(address, self.address_format)
+                              for address in self.static_addresses.tolist()]
+        self.outcome_pairs = None  # see src.models.BranchStatistics.outcome_pairs
+
+    def __reduce__(self):
+        # Pickled as a reference to the binary trace: a worker process maps the same file, which the
+        # OS shares between processes, instead of receiving a copy of the branches
+        return _attach_trace, (self.trace.path, len(self))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        # An (address, outcome) pair for an integer index, negative ones included, and a list of pairs for
+        # a slice, as when Branch was a list. Any other index raises TypeError.
+        if isinstance(index, slice):
+            positions = np.arange(*index.indices(len(self)))
+            taken = (self.outcomes[positions >> 3] >> (positions & 7).astype(np.uint8)) & 1
+            return list(zip(map(self.address_table.__getitem__, self.ids[positions].tolist()),
+                            map(OUTCOMES.__getitem__, taken.tolist())))
+
+        index = range(len(self))[index]
+        taken = (int(self.outcomes[index >> 3]) >> (index & 7)) & 1
+        return self.address_table[self.ids[index]], OUTCOMES[taken]
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        for pairs, _, _ in self.iter_chunks():
+            yield from pairs
+
+    @property
+    def progress_total(self) -> int:
+        return len(self)
+
+    def iter_chunks(self):
+        # Yields (pairs, branch count, progress units) per chunk. The same string object is yielded for
+        # every occurrence of a static branch, so its hash is cached
+        address_table = self.address_table
+
+        for ids, taken, progress_units in self.iter_id_chunks():
+            pairs = zip(map(address_table.__getitem__, ids.tolist()), map(OUTCOMES.__getitem__, taken.tolist()))
+            yield pairs, len(ids), progress_units
+
+    def iter_id_chunks(self, start: int = 0, stop: int = None, chunk_size: int = ITER_CHUNK_SIZE):
+        # Yields (static IDs, taken as uint8, progress units) per chunk of branches [start, stop)
+        stop = len(self) if stop is None else min(stop, len(self))
+        for first in range(start, stop, chunk_size):
+            ids = self.ids[first:min(first + chunk_size, stop)]
+            yield ids, self.taken_array(first, first + len(ids)), len(ids)
+
+    @property
+    def static_count(self) -> int:
+        return len(self.address_table)
+
+    @property
+    def addresses(self) -> np.ndarray:
+        return self.static_addresses[self.ids]
+
+    def taken_array(self, start: int = 0, stop: int = None) -> np.ndarray:
+        # Unpacked outcomes (1 = taken) of branches [start, stop)
+        stop = len(self) if stop is None else min(stop, len(self))
+        first = start & ~7
+        packed = self.outcomes[first >> 3:(stop + 7) >> 3]
+        return np.unpackbits(packed, count=max(0, stop - first), bitorder='little')[start - first:]
+
+
+def _attach_trace(trace_path: str, count: int) -> Branch:
+    branch = Branch.__new__(Branch)
+    branch._attach(open_trace(trace_path), count)
+    return branch
@@ -0,0 +1,193 @@
+from array import array
+
+import numpy as np
+
+from src.models.Branch import OUTCOMES
+from src.models.BranchStatistics import DEFAULT_CORRECT, MISPREDICTED, PREDICTED
+from src.models.Predictor import Predictor
+from src.models.TwoBitPredictor import COUNTER_UP, COUNTER_DOWN
+
+EMPTY = 0xFF  # Counter value of a way that holds no branch yet
+
+# Saturating counter transitions per counter width, indexed by the outcome (1 = taken) and the current state
+COUNTER_STEPS = {
+    1: ((0, 0), (1, 1)),
+    2: (COUNTER_DOWN, COUNTER_UP),
+}
+
+
+def address_value(address) -> int:
+    # predict_branch hands predict() and update() integer addresses. A string passed directly is read as
+    # decimal, or hexadecimal when it has a 0x prefix or hex letters; on its own it cannot tell the hex
+    # address 408163 of a trace without prefixes from a decimal one.
+    if isinstance(address, str):
+        return int(address, 16) if address[:2] in ('0x', '0X') or not address.isdigit() else int(address)
+    return int(address)
+
+
+class BranchHistoryTable(Predictor):
+    # Hardware-style table of size entries in size // ways sets: the low bits of a branch address pick its
+    # set and the full address is the tag of its way. Every way holds a 1- or 2-bit saturating counter and
+    # a set replaces its least recently used way. Tags, counters and LRU stamps live in flat arrays of the
+    # table size, so memory and the cost of a lookup do not depend on the trace. A tag miss gives no
+    # prediction, like a miss in the fully associative predictors. The batch kernel needs the address
+    # table of the trace, since static IDs say nothing about address bits.
+    has_batch_kernel = True
+    integer_addresses = True
+    ways = 1
+    counter_bits = 2
+    index_shift = 0  # Address bits below the set index, 0 for traces of byte-aligned branches
+
+    def __init__(self, size, ways=None, counter_bits=None):
+        super().__init__(size)
+        self.check_size(size, ways)
+        self.ways = min(ways or self.ways, size)
+        self.counter_bits = counter_bits or self.counter_bits
+        self.sets = size // self.ways
+        if self.counter_bits not in COUNTER_STEPS:
+            raise ValueError(f"counters have {' or '.join(map(str, COUNTER_STEPS))} bits, not {self.counter_bits}")
+
+        self.tags = array('Q', bytes(8 * size))
+        self.counters = bytearray([EMPTY]) * size
+        self.stamps = array('q', bytes(8 * size))  # Access time of every way, 0 while it is empty
+        self.clock = 1
+        self.occupancy = 0
+
+    @classmethod
+    def check_size(cls, size, ways=None):
+        super().check_size(size)
+        ways = min(ways or cls.ways, size)
+        sets = size // ways
+        if size % ways or sets & (sets - 1):
+            raise ValueError(f"a table of {size} entries cannot be split into a power of two of {ways}-way sets")
+
+    def table_occupancy(self):
+        return self.occupancy
+
+    def canonical_state(self):
+        # Tags and counters of every set, its ways in LRU order
+        stamps = np.frombuffer(self.stamps, dtype=np.int64).reshape(self.sets, self.ways)
+        order = (np.argsort(stamps, axis=1, kind='stable') + np.arange(0, len(self.stamps), self.ways)[:, None]).ravel()
+        tags = np.frombuffer(self.tags, dtype=np.uint64)[order]
+        counters = np.frombuffer(self.counters, dtype=np.uint8)[order]
+        return tags.astype('<u8').tobytes() + counters.tobytes()
+
+    def _find(self, address):
+        # Index of the way holding address, or None
+        base = ((address >> self.index_shift) & (self.sets - 1)) * self.ways
+        for way in range(base, base + self.ways):
+            if self.counters[way] == EMPTY:
+                return None
+            if self.tags[way] == address:
+                return way
+        return None
+
+    def predict(self, address):
+        way = self._find(address_value(address))
+        return None if way is None else OUTCOMES[self.counters[way] >> (self.counter_bits - 1)]
+
+    def update(self, address, outcome):
+        address = address_value(address)
+        taken = 1 if outcome == 'T' else 0
+        way = self._find(address)
+
+        if way is not None:
+            self.counters[way] = COUNTER_STEPS[self.counter_bits][taken][self.counters[way]]
+        else:
+            base = ((address >> self.index_shift) & (self.sets - 1)) * self.ways
+            way = self.counters.find(EMPTY, base, base + self.ways)
+            if way < 0:
+                stamps = self.stamps[base:base + self.ways]
+                way = base + stamps.index(min(stamps))  # Replace the least recently used way
+            else:
+                self.occupancy += 1
+            self.tags[way] = address
+            self.counters[way] = taken  # A new entry starts at 0 and is updated once
+
+        self.stamps[way] = self.clock
+        self.clock += 1
+
+    def simulate(self, ids, taken, addresses=None, results=None):
+        # Ways fill their set from the front and are never emptied, so the first empty way ends the search
+        if addresses is None:
+            raise ValueError(f"{type(self).__name__} is indexed by address bits and needs the address table of the trace")
+
+        branch_addresses = np.asarray(addresses, dtype=np.uint64)[ids]
+        bases = ((branch_addresses >> np.uint64(self.index_shift)) & np.uint64(self.sets - 1)) * np.uint64(self.ways)
+
+        tags = self.tags
+        counters = self.counters
+        stamps = self.stamps
+        ways = self.ways
+        steps = COUNTER_STEPS[self.counter_bits]
+        shift = self.counter_bits - 1
+        clock = first = self.clock
+        occupancy = self.occupancy
+        record = results is not None
+        default_taken = 1 if self.default_prediction_state == 'T' else 0
+        predictions = 0
+        correct_predictions = 0
+        default_correct = 0
+
+        for base, address, outcome in zip(bases.tolist(), branch_addresses.tolist(), taken.tolist()):
+            end = base + ways
+            way = base
+            if ways > 1:
+                row = tags[base:end]
+                if address in row:
+                    way += row.index(address)
+            counter = counters[way]
+
+            if counter != EMPTY and tags[way] == address:
+                predictions += 1
+                if (counter >> shift) == outcome:
+                    correct_predictions += 1
+                    if record:
+                        results[clock - first] = PREDICTED
+                elif record:
+                    results[clock - first] = MISPREDICTED
+                counters[way] = steps[outcome][counter]
+            else:
+                if outcome == default_taken:
+                    default_correct += 1
+                    if record:
+                        results[clock - first] = DEFAULT_CORRECT
+                way = counters.find(EMPTY, base, end)
+                if way < 0:
+                    if ways > 1:
+                        row = stamps[base:end]
+                        way = base + row.index(min(row))
+                    else:
+                        way = base
+                else:
+                    occupancy += 1
+                tags[way] = address
+                counters[way] = outcome
+
+            stamps[way] = clock
+            clock += 1
+
+        self.clock = clock
+        self.occupancy = occupancy
+
+        return len(ids), predictions, correct_predictions, correct_predictions + default_correct
+
+
+class DirectMappedPredictor(BranchHistoryTable):
+    ways = 1
+    counter_bits = 2
+
+
+class SetAssociativePredictor(BranchHistoryTable):
+    ways = 4
+    counter_bits = 2
+
+
+class OneBitDirectMappedPredictor(BranchHistoryTable):
+    ways = 1
+    counter_bits = 1
+
+
+class OneBitSetAssociativePredictor(BranchHistoryTable):
+    ways = 4
+    counter_bits = 1
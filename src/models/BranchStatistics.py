@@ -0,0 +1,168 @@
+import numpy as np
+
+# Result of every branch as simulate() records it: bit 1 is set when the table predicted the branch, bit 0
+# when the prediction, or the default one for a miss, was right
+MISSED = 0
+DEFAULT_CORRECT = 1
+MISPREDICTED = 2
+PREDICTED = 3
+
+COUNT_FIELDS = ('executions', 'taken', 'predictions', 'correct_predictions', 'cold_misses', 'default_correct',
+                'transitions')
+STATISTICS_FIELDS = ('address', 'executions', 'taken', 'predictions', 'correct_predictions', 'mispredictions',
+                     'cold_misses', 'eviction_misses', 'default_correct', 'transitions', 'accuracy')
+TRIPLES = 24  # (result code, previous outcome, outcome) triples counted per static branch
+
+# What a compiled LRU kernel adds to a BranchStatistics: every branch, or in a run that covers a whole trace
+# its misses and a count of its right predictions per static ID (see BranchStatistics.cover)
+EVERY_BRANCH = 1
+MISSES = 2
+
+
+def outcome_pairs(branch):
+    # Executions per static ID of a loaded trace and (previous outcome + 1, outcome) pair, the previous outcome
+    # being -1 on a first execution. No predictor changes them, so they are counted once per Branch, as the
+    # triples of a run that missed every branch, and kept on it for every later run over the same trace.
+    if branch.outcome_pairs is None:
+        statistics = BranchStatistics()
+        for ids, taken, _ in branch.iter_id_chunks():
+            statistics.add(ids, taken, bytes(len(ids)))
+        branch.outcome_pairs = statistics.triples[:len(statistics)].reshape(-1, 4, 3, 2)[:, MISSED].copy()
+    return branch.outcome_pairs
+
+
+def group_order(ids, static_count):
+    # Stable order that groups equal IDs, sorted as 16-bit digits, for which NumPy uses a radix sort
+    order = np.argsort((ids & 0xFFFF).astype(np.uint16), kind='stable')
+    if static_count > 0x10000:
+        order = order[np.argsort((ids[order] >> 16).astype(np.uint16), kind='stable')]
+    return order
+
+
+class BranchStatistics:
+    # Per static branch counts of one simulation, indexed by static ID. Every chunk is added in one compiled
+    # loop (see src.models.kernels), or without numba at once with bincount over its IDs, the only per-branch
+    # work being the result code the kernel records; the compiled LRU kernels count their branches themselves
+    # into the arrays reserve() returns. triples holds the executions per (result code, previous outcome,
+    # outcome) triple, the previous outcome being -1 on the first execution, and every count follows from it
+    # when read, with the hits of a covered run (see cover()). A miss is cold on the first execution of a
+    # branch and caused by an eviction on every later one; transitions count the outcome changes between two
+    # executions.
+    def __init__(self):
+        self.static_count = 0
+        self.triples = np.zeros((0, TRIPLES), dtype=np.int64)
+        self.last_outcome = np.zeros(0, dtype=np.int8)  # -1 until the branch executed
+        self.correct_hits = np.zeros(0, dtype=np.int64)
+        self.covered = False
+        self.counted_misses = False  # True once a kernel counted the misses alone
+        self.outcome_pairs = None  # Of the trace of a run whose kernel counted the misses alone, see cover()
+        self.address_format = 'd'
+        self.static_addresses = np.zeros(0, dtype=np.uint64)
+
+    def __len__(self):
+        return self.static_count
+
+    @property
+    def counts(self):
+        # An int64 array with a row per COUNT_FIELDS entry and a column per static ID
+        triples = self.triples[:len(self)].reshape(-1, 4, 3, 2)  # result code, previous outcome + 1, outcome
+        counted = triples.sum(axis=1)  # executions per (previous outcome + 1, outcome) held by the triples
+        executions = counted if self.outcome_pairs is None else self.outcome_pairs[:len(self)]
+        hits = executions - counted  # of a covered run, see cover()
+        by_code = triples.sum(axis=(2, 3))
+        return np.stack((executions.sum(axis=(1, 2)),
+                         executions[..., 1].sum(axis=1),
+                         by_code[:, MISPREDICTED:].sum(axis=1) + hits.sum(axis=(1, 2)),
+                         by_code[:, PREDICTED] + self.correct_hits[:len(self)],
+                         triples[:, :MISPREDICTED, 0].sum(axis=(1, 2)),
+                         by_code[:, DEFAULT_CORRECT],
+                         executions[:, 1, 1] + executions[:, 2, 0]))
+
+    def _grow(self, static_count):
+        # Doubles the arrays, so a trace that keeps showing new branches does not copy them on every chunk
+        grow = max(static_count, 2 * len(self.triples)) - len(self.triples)
+        self.triples = np.concatenate((self.triples, np.zeros((grow, TRIPLES), dtype=np.int64)))
+        self.last_outcome = np.concatenate((self.last_outcome, np.full(grow, -1, dtype=np.int8)))
+        self.correct_hits = np.concatenate((self.correct_hits, np.zeros(grow, dtype=np.int64)))
+
+    def _make_room(self, ids):
+        self.static_count = max(self.static_count, int(ids.max()) + 1)
+        if self.static_count > len(self.triples):
+            self._grow(self.static_count)
+
+    def cover(self, branch):
+        # Announces a run over the whole of branch, a loaded trace, from its first branch on. A compiled LRU
+        # kernel then records the misses alone by triple and only counts the right predictions of every static
+        # branch, while its hits per (previous outcome, outcome) pair follow from the trace when read: the
+        # outcome pairs of a trace are the same for every predictor, and a hit, a branch the kernel would
+        # otherwise pass in a few cycles, costs one count at a fixed place instead of one picked by its result.
+        self.covered = True
+        self.static_count = max(self.static_count, branch.static_count)
+        if self.static_count > len(self.triples):
+            self._grow(self.static_count)
+
+    def reserve(self, ids):
+        # Makes room for the static IDs of a chunk a compiled LRU kernel is about to add, returning the arrays
+        # it adds them to and what it counts, EVERY_BRANCH or MISSES
+        if len(ids) and not self.covered:
+            self._make_room(ids)
+        self.counted_misses = self.counted_misses or self.covered
+        return self.triples, self.last_outcome, self.correct_hits, MISSES if self.covered else EVERY_BRANCH
+
+    def add(self, ids, taken, results):
+        if not len(ids):
+            return
+        self._make_room(ids)
+
+        codes = np.frombuffer(results, dtype=np.uint8)
+        from src.models.kernels import branch_statistics
+        if branch_statistics is not None:
+            branch_statistics(ids, taken, codes, self.triples, self.last_outcome)
+            return
+
+        # The chunk grouped by static ID, in trace order within every group
+        order = group_order(ids, self.static_count)
+        sorted_ids = ids[order]
+        group_start = np.ones(len(ids), dtype=bool)
+        group_start[1:] = sorted_ids[1:] != sorted_ids[:-1]
+        starts = np.flatnonzero(group_start)
+        ends = np.append(starts[1:], len(ids)) - 1
+
+        # Outcome before every branch: the previous execution in the chunk, or the last one of earlier chunks
+        outcomes = taken[order].astype(np.int8)
+        previous = np.empty_like(outcomes)
+        previous[1:] = outcomes[:-1]
+        previous[starts] = self.last_outcome[sorted_ids[starts]]
+
+        # One bincount counts every triple per static branch
+        keys = sorted_ids.astype(np.uint32 if self.static_count < 1 << 27 else np.int64) * TRIPLES
+        keys += (6 * codes[order] + 2 * previous + 2 + outcomes).astype(keys.dtype)
+        length = TRIPLES * self.static_count
+        self.triples.reshape(-1)[:length] += np.bincount(keys, minlength=length)
+        self.last_outcome[sorted_ids[ends]] = outcomes[ends]
+
+    def attach(self, branch):
+        # Keeps the addresses of the branches seen, and the outcome pairs of a covered run, so the statistics
+        # can be reported without the trace
+        if self.counted_misses:
+            self.outcome_pairs = outcome_pairs(branch)
+        self.covered = False
+        self.address_format = branch.address_format
+        self.static_addresses = np.array(branch.static_addresses[:len(self)], dtype=np.uint64)
+
+    def rows(self):
+        # One row per executed static branch in STATISTICS_FIELDS order, the most wrongly predicted first
+        executions, taken, predictions, correct_predictions, cold_misses, default_correct, transitions = self.counts
+        correct = correct_predictions + default_correct
+        order = np.lexsort((np.arange(len(self)), correct - executions))
+        order = order[executions[order] > 0]
+
+        columns = [executions, taken, predictions, correct_predictions, predictions - correct_predictions, cold_misses,
+                   executions - predictions - cold_misses, default_correct, transitions]
+        accuracy = correct[order] / executions[order] * 100
+        addresses = (format(address, self.address_format) for address in self.static_addresses[order].tolist())
+        return list(zip(addresses, *(column[order].tolist() for column in columns), accuracy.tolist()))
+
+    def top(self, count: int):
+        return self.rows()[:count]
+
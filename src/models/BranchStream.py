@@ -0,0 +1,96 @@
+import hashlib
+import itertools
+import os
+import threading
+from typing import Iterator, Tuple
+
+import numpy as np
+
+from src.models.Branch import OUTCOMES
+from src.utils.trace import parse_trace_chunks, intern_addresses, open_source, remember_checksum
+from src.utils.instrumentation import phase
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class BranchStream:
+    # Reads a text trace, plain or compressed, in fixed-size chunks while it is being simulated, so memory
+    # stays bounded by the chunk size and the number of static branches. Progress is measured in source
+    # file bytes. A complete pass also hashes the text and records its checksum, so the result cache can
+    # name a streamed trace without reading it again.
+    def __init__(self, filePath: str, chunk_size: int = STREAM_CHUNK_SIZE):
+        self.filePath = filePath
+        self.chunk_size = chunk_size
+        self.total_bytes = os.path.getsize(filePath)
+        # ID -> address table of the furthest iteration so far. IDs are assigned the same way by every
+        # iteration, so the longest table also covers the IDs of the others.
+        self.static_addresses = np.zeros(0, dtype=np.uint64)
+        self.address_format = 'd'
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        return BranchStream, (self.filePath, self.chunk_size)
+
+    @property
+    def progress_total(self) -> int:
+        return self.total_bytes
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        for pairs, _, _ in self.iter_chunks():
+            yield from pairs
+
+    def iter_chunks(self):
+        for ids, taken, consumed, address_table in self._iter_interned():
+            pairs = zip(map(address_table.__getitem__, ids.tolist()), map(OUTCOMES.__getitem__, taken.tolist()))
+            yield pairs, len(ids), consumed
+
+    def iter_id_chunks(self):
+        # Static IDs are assigned in order of first appearance, as in the binary trace format
+        for ids, taken, consumed, _ in self._iter_interned():
+            yield ids, taken, consumed
+
+    def _iter_interned(self):
+        # Every iteration keeps its own state, so one stream can feed several predictors concurrently
+        static_ids = {}
+        address_table = []
+        addresses = np.zeros(0, dtype=np.uint64)  # ID -> address, with spare room at the end
+        checksum = hashlib.sha256()
+        stat = os.stat(self.filePath)
+
+        with open_source(self.filePath, self.chunk_size) as file:
+            chunks = parse_trace_chunks(file, checksum, self.chunk_size)
+            while True:
+                # Parsing happens as the chunks are pulled, so it is timed here rather than in the consumer
+                with phase('stream/parse'):
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    address_format, chunk_addresses, taken, consumed = chunk
+                    ids = intern_addresses(chunk_addresses, static_ids)
+                    known = len(address_table)
+                    if len(static_ids) > known:
+                        # The new addresses are the last ones inserted, so only they are visited
+                        new = list(itertools.islice(reversed(static_ids), len(static_ids) - known))[::-1]
+                        address_table.extend(format(address, address_format) for address in new)
+                        addresses = self._publish_addresses(addresses, known, new, address_format)
+
+                yield ids, taken.view(np.uint8), consumed, address_table
+
+        if os.stat(self.filePath).st_mtime_ns == stat.st_mtime_ns:
+            remember_checksum(self.filePath, checksum.hexdigest(), stat)
+
+    def _publish_addresses(self, addresses, known, new, address_format):
+        # Appends the new addresses, doubling the array when it is full, and publishes the filled part. IDs
+        # never change, so a table published earlier stays valid as a prefix of the array.
+        count = known + len(new)
+        if count > len(addresses):
+            grown = np.zeros(max(count, 2 * len(addresses)), dtype=np.uint64)
+            grown[:known] = addresses[:known]
+            addresses = grown
+        addresses[known:count] = new
+
+        with self._lock:
+            self.address_format = address_format
+            if count > len(self.static_addresses):
+                self.static_addresses = addresses[:count]
+        return addresses
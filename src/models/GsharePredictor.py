@@ -0,0 +1,117 @@
+import numpy as np
+
+from src.models.Branch import OUTCOMES
+from src.models.BranchHistoryTable import COUNTER_STEPS, address_value
+from src.models.BranchStatistics import MISPREDICTED
+from src.models.Predictor import Predictor
+
+
+def history_before(history: int, history_bits: int, taken: np.ndarray):
+    # Global history ahead of every branch of a chunk, newest outcome in bit 0, and the history after it
+    if not history_bits:
+        return np.zeros(len(taken), dtype=np.uint64), 0
+
+    count = len(taken)
+    previous = np.array([(history >> bit) & 1 for bit in range(history_bits - 1, -1, -1)], dtype=np.uint64)
+    outcomes = np.concatenate((previous, taken.astype(np.uint64)))
+    before = np.zeros(count, dtype=np.uint64)
+    for age in range(1, history_bits + 1):
+        before |= outcomes[history_bits - age:history_bits - age + count] << np.uint64(age - 1)
+
+    after = 0
+    for age in range(1, history_bits + 1):
+        after |= int(outcomes[history_bits + count - age]) << (age - 1)
+    return before, after
+
+
+_HISTORY_VARIANTS = {}  # (class, history bits) -> subclass, see GsharePredictor.with_history
+
+
+class GsharePredictor(Predictor):
+    # Global predictor: a table of size 2-bit counters, indexed by the low address bits XOR the outcomes of
+    # the last history_bits branches. The table has no tags, so every branch is predicted. Counters live in
+    # a bytearray and the history is one integer; the batch kernel computes the history and index of every
+    # branch of a chunk with NumPy, so its loop only steps counters.
+    has_batch_kernel = True
+    integer_addresses = True
+    index_shift = 0
+    history_length = None  # Outcomes of global history of every size, log2 of the size when None
+
+    def __init__(self, size, history_bits=None):
+        super().__init__(size)
+        self.check_size(size)
+        if history_bits is None:
+            history_bits = size.bit_length() - 1 if self.history_length is None else self.history_length
+        self.history_bits = history_bits
+        self.global_history = 0
+        self.pattern_table = bytearray(size)  # Counters start at 0, like new entries of the Two Bit table
+
+    @classmethod
+    def check_size(cls, size):
+        if size < 1 or size & (size - 1):
+            raise ValueError(f"the pattern table size must be a power of two, not {size}")
+
+    @classmethod
+    def with_history(cls, history_bits):
+        # Subclass of cls whose predictors keep history_bits outcomes whatever their size, one per length. Its
+        # name tells the lengths apart wherever results are keyed by class: the result cache, checkpoints and
+        # the per-branch and windowed CSV files.
+        if history_bits < 0:
+            raise ValueError(f"the global history holds no fewer than 0 outcomes, not {history_bits}")
+        key = (cls, history_bits)
+        if key not in _HISTORY_VARIANTS:
+            _HISTORY_VARIANTS[key] = type(f"{cls.__name__}{history_bits}HistoryBits", (cls,),
+                                          {'history_length': history_bits, '__module__': cls.__module__})
+        return _HISTORY_VARIANTS[key]
+
+    def table_occupancy(self):
+        # Every counter of an untagged table is in use
+        return self.MAX_HISTORY_SIZE
+
+    def canonical_state(self):
+        return self.global_history.to_bytes(8, 'little') + bytes(self.pattern_table)
+
+    def _global_index(self, address):
+        return ((address >> self.index_shift) ^ self.global_history) & (self.MAX_HISTORY_SIZE - 1)
+
+    def _push_history(self, taken):
+        self.global_history = ((self.global_history << 1) | taken) & ((1 << self.history_bits) - 1)
+
+    def predict(self, address):
+        return OUTCOMES[self.pattern_table[self._global_index(address_value(address))] >> 1]
+
+    def update(self, address, outcome):
+        taken = 1 if outcome == 'T' else 0
+        index = self._global_index(address_value(address))
+        self.pattern_table[index] = COUNTER_STEPS[2][taken][self.pattern_table[index]]
+        self._push_history(taken)
+
+    def _chunk_indexes(self, ids, taken, addresses):
+        # (low address bits, global table index) of every branch, and moves the history past the chunk
+        if addresses is None:
+            raise ValueError(f"{type(self).__name__} is indexed by address bits and needs the address table of the trace")
+
+        mask = np.uint64(self.MAX_HISTORY_SIZE - 1)
+        local = np.asarray(addresses, dtype=np.uint64)[ids] >> np.uint64(self.index_shift)
+        before, self.global_history = history_before(self.global_history, self.history_bits, taken)
+        return local & mask, (local ^ before) & mask
+
+    def simulate(self, ids, taken, addresses=None, results=None):
+        # The loop only steps counters and keeps the one every branch was predicted with; which predictions
+        # were right, and their result codes, follow from those at once
+        _, indexes = self._chunk_indexes(ids, taken, addresses)
+        table = self.pattern_table
+        steps = COUNTER_STEPS[2]
+        before = bytearray()
+        keep = before.append
+
+        for index, outcome in zip(indexes.tolist(), taken.tolist()):
+            counter = table[index]
+            keep(counter)
+            table[index] = steps[outcome][counter]
+
+        hits = (np.frombuffer(before, dtype=np.uint8) >> 1) == taken
+        if results is not None:
+            np.add(hits, MISPREDICTED, out=np.frombuffer(results, dtype=np.uint8), casting='unsafe')
+        correct = int(np.count_nonzero(hits))
+        return len(ids), len(ids), correct, correct
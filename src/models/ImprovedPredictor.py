@@ -1,45 +1,89 @@
+import heapq
+
 from src.models.Predictor import Predictor
 
+
+class HistoryEntry:
+    __slots__ = ('prediction', 'accuracy', 'total_appearances', 'added_at', 'order', 'version')
+
+    def __init__(self, prediction, added_at, order):
+        self.prediction = prediction
+        self.accuracy = 1
+        self.total_appearances = 1
+        self.added_at = added_at    # Predictor clock when the entry was added
+        self.order = order          # Insertion order, breaks eviction ties like the table order did
+        self.version = 0            # Bumped on every change so stale heap items can be recognised
+
+
 class ImprovedPredictor(Predictor):
+    implementation_version = 2  # Heap eviction with lazy aging
 
     taken_branches = 0
     not_taken_branches = 0
 
     def __init__(self, size):
         super().__init__(size)
+        self.clock = 0
+        self.insertions = 0
+        # Min-heap of (accuracy / total_appearances, order, version, address). Every change pushes a new
+        # item, items whose version no longer matches the entry are skipped when evicting.
+        self.eviction_heap = []
 
     def predict(self, address):
-        if address in self.history:
-            return self.history[address][0] # Return the current prediction
+        entry = self.history.get(address)
+        if entry is not None:
+            return entry.prediction # Return the current prediction
         else:
             return None # No prediction available for this address yet
 
+    def total_since_added(self, address):
+        # Entries age lazily: instead of bumping every entry on every update, compare against the clock
+        return self.clock - self.history[address].added_at + 1
+
     def update(self, address, outcome):
         self.taken_branches += 1 if outcome == 'T' else 0
         self.not_taken_branches += 1 if outcome == 'N' else 0
         self.default_prediction_state = 'T' if self.taken_branches > self.not_taken_branches else 'N'
 
-        # Update total_since_added for all entries
-        for key in self.history:
-            self.history[key] = (*self.history[key][:3], self.history[key][3] + 1)
+        self.clock += 1
 
-        if address in self.history:
-            prediction, accuracy, total_appearances, total_since_added = self.history[address]
+        entry = self.history.get(address)
+        if entry is not None:
+            correct_predictions = entry.accuracy * entry.total_appearances
 
-            correct_predictions = accuracy * total_appearances
+            entry.total_appearances += 1
+            correct_predictions += 1 if outcome == entry.prediction else 0
 
-            total_appearances += 1
-            correct_predictions += 1 if outcome == prediction else 0
+            entry.accuracy = correct_predictions / entry.total_appearances
 
-            accuracy = correct_predictions / total_appearances
+            if entry.prediction != outcome and entry.accuracy < 0.5:
+                entry.prediction = outcome
 
-            if prediction != outcome and accuracy < 0.5:
-                prediction = outcome
-
-            self.history[address] = (prediction, accuracy, total_appearances, total_since_added)
+            entry.version += 1
         else:
             if len(self.history) >= self.MAX_HISTORY_SIZE:
-                least_used_key = min(self.history, key=lambda k: self.history[k][1]/self.history[k][2])
-                del self.history[least_used_key]
+                self.evict()
+
+            entry = HistoryEntry(outcome, self.clock, self.insertions)
+            self.insertions += 1
+            self.history[address] = entry
+
+        heapq.heappush(self.eviction_heap,
+                       (entry.accuracy / entry.total_appearances, entry.order, entry.version, address))
+
+        if len(self.eviction_heap) > 2 * len(self.history) + 64:
+            self.compact_heap()
+
+    def evict(self):
+        # Removes the entry with the lowest accuracy / total_appearances, the oldest one on ties
+        while self.eviction_heap:
+            _, order, version, address = heapq.heappop(self.eviction_heap)
+            entry = self.history.get(address)
+            if entry is not None and entry.order == order and entry.version == version:
+                del self.history[address]
+                return
 
-            self.history[address] = (outcome, 1, 1, 1)
+    def compact_heap(self):
+        self.eviction_heap = [(entry.accuracy / entry.total_appearances, entry.order, entry.version, address)
+                              for address, entry in self.history.items()]
+        heapq.heapify(self.eviction_heap)
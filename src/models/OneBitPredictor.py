@@ -1,6 +1,21 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
 from src.models.Predictor import Predictor
+from src.models.BranchStatistics import DEFAULT_CORRECT, MISPREDICTED, PREDICTED
+from src.utils.instrumentation import timed
+from src.utils.progress import ProgressCounter, reporter
+
+if TYPE_CHECKING:
+    from rich.progress import Progress, TaskID
 
 class OneBitPredictor(Predictor):
+    has_batch_kernel = True
+    implementation_version = 2  # Batch kernel
+
     def __init__(self, size):
         super().__init__(size)
 
@@ -13,4 +28,221 @@ class OneBitPredictor(Predictor):
         elif len(self.history) >= self.MAX_HISTORY_SIZE:
             self.history.popitem(last=False)  # Remove least recently used item
 
-        self.history[address] = outcome  # Add/Update the prediction
\ No newline at end of file
+        self.history[address] = outcome  # Add/Update the prediction
+
+    def compiled_loop(self):
+        from src.models.kernels import one_bit_lru
+        return one_bit_lru
+
+    def simulate(self, ids, taken, addresses=None, results=None):
+        # batch_values holds the last outcome of every static ID, which is the prediction while it is in the table
+        self._grow_batch_state(ids)
+        loop = self.compiled_loop()
+        if loop is not None and len(ids):
+            return self._simulate_compiled(loop, ids, taken, results)
+        if self._fits_in_table(ids):
+            return self._simulate_unbounded(ids, taken, results)
+
+        stamp = self.batch_stamp
+        last = self.batch_values
+        window = self.batch_window
+        base = self.batch_base
+        head = self.batch_head
+        position = first = self.batch_clock
+        occupancy = self.batch_occupancy
+        size = self.MAX_HISTORY_SIZE
+        record = results is not None
+        default_taken = 1 if self.default_prediction_state == 'T' else 0
+        predictions = 0
+        correct_predictions = 0
+        default_correct = 0
+
+        window.frombytes(ids.astype(np.uint32).tobytes())
+
+        for address, outcome in zip(ids.tolist(), taken.tolist()):
+            if stamp[address] >= head:
+                predictions += 1
+                if last[address] == outcome:
+                    correct_predictions += 1
+                    if record:
+                        results[position - first] = PREDICTED
+                elif record:
+                    results[position - first] = MISPREDICTED
+            else:
+                if outcome == default_taken:
+                    default_correct += 1
+                    if record:
+                        results[position - first] = DEFAULT_CORRECT
+                if occupancy >= size:
+                    # Evict the least recently used member: move head to the next latest access
+                    while stamp[window[head - base]] != head:
+                        head += 1
+                    head += 1
+                else:
+                    occupancy += 1
+
+            last[address] = outcome
+            stamp[address] = position
+            position += 1
+
+        self.batch_head = head
+        self.batch_clock = position
+        self.batch_occupancy = occupancy
+        self._trim_batch_window()
+
+        return len(ids), predictions, correct_predictions, correct_predictions + default_correct
+
+    def _fits_in_table(self, ids):
+        # True while nothing was evicted yet and this batch cannot fill the table
+        if self.batch_occupancy >= self.MAX_HISTORY_SIZE:
+            return False
+        stamp = self.batch_stamp
+        new = sum(1 for address in np.unique(ids).tolist() if stamp[address] < 0)
+        return self.batch_occupancy + new <= self.MAX_HISTORY_SIZE
+
+    def _simulate_unbounded(self, ids, taken, results=None):
+        # Without evictions every branch is predicted with the previous outcome of its address, so the batch
+        # becomes a shift within each group of equal IDs
+        if not len(ids):
+            return 0, 0, 0, 0
+
+        stamp = self.batch_stamp
+        last = np.frombuffer(self.batch_values, dtype=np.uint8)
+        default_taken = 1 if self.default_prediction_state == 'T' else 0
+
+        order = np.argsort(ids, kind='stable')
+        sorted_ids = ids[order]
+        sorted_taken = taken[order]
+        group_start = np.ones(len(ids), dtype=bool)
+        group_start[1:] = sorted_ids[1:] != sorted_ids[:-1]
+        group_end = np.roll(group_start, -1)
+        firsts = sorted_ids[group_start]
+        was_member = np.array([stamp[address] >= 0 for address in firsts.tolist()], dtype=bool)
+
+        # The first branch of a group is predicted from the table, the others from the branch before them
+        previous = np.empty_like(sorted_taken)
+        previous[1:] = sorted_taken[:-1]
+        previous[group_start] = last[firsts]
+        predicted = ~group_start | was_member[np.cumsum(group_start) - 1]
+
+        predictions = int(predicted.sum())
+        correct_predictions = int((predicted & (previous == sorted_taken)).sum())
+        default_correct = int((~predicted & (sorted_taken == default_taken)).sum())
+        if results is not None:
+            np.frombuffer(results, dtype=np.uint8)[order] = np.where(
+                predicted, np.where(previous == sorted_taken, PREDICTED, MISPREDICTED),
+                np.where(sorted_taken == default_taken, DEFAULT_CORRECT, 0))
+
+        # Bring the table up to date with the latest access of every ID
+        last[sorted_ids[group_end]] = sorted_taken[group_end]
+        del last  # Release the buffer so the bytearray can grow again
+        for address, position in zip(sorted_ids[group_end].tolist(), (order[group_end] + self.batch_clock).tolist()):
+            stamp[address] = position
+
+        self.batch_occupancy += int(len(firsts) - was_member.sum())
+        self.batch_window.frombytes(ids.astype(np.uint32).tobytes())
+        self.batch_clock += len(ids)
+        self._trim_batch_window()
+
+        return len(ids), predictions, correct_predictions, correct_predictions + default_correct
+
+    @classmethod
+    @timed('sweep')
+    def sweep(cls, branch, sizes, external_progress: Progress = None, external_task_id: TaskID = None,
+              counter: ProgressCounter = None):
+        # Simulates every size in one pass and returns {size: (pred_accuracy, total_accuracy, prediction_percentage)},
+        # matching predict_branch for each size. The LRU table has the inclusion property: a branch is in a
+        # table of size S exactly when fewer than S other addresses were used since its last occurrence (its
+        # stack distance), and a hit always predicts the last outcome. Stack distances are counted with a
+        # Fenwick tree over last-access times, so only per-distance histograms depend on the sizes.
+        default_taken = 1 if cls.default_prediction_state == 'T' else 0
+        last_time = []          # Per static ID, time of the last access, -1 before the first one
+        last_outcome = []
+        hits = []               # Per stack distance: hits, hits repeating the last outcome, hits with a default outcome
+        repeats = []
+        default_hits = []
+        total_branches = 0
+        default_outcomes = 0
+        report = reporter(counter, external_progress, external_task_id)
+
+        capacity = 1024
+        tree = [0] * (capacity + 1)
+        live = 0                # Distinct addresses seen, one tree bit each
+        now = 0
+
+        for ids, taken, progress_units in branch.iter_id_chunks():
+            for address, outcome in zip(ids.tolist(), taken.tolist()):
+                if address >= len(last_time):
+                    grow = address + 1 - len(last_time)
+                    last_time.extend([-1] * grow)
+                    last_outcome.extend([0] * grow)
+
+                previous = last_time[address]
+                if previous < 0:
+                    hits.append(0)
+                    repeats.append(0)
+                    default_hits.append(0)
+                    live += 1
+                else:
+                    # Addresses whose last access lies after the previous one of this address
+                    i = previous + 1
+                    before = 0
+                    while i:
+                        before += tree[i]
+                        i &= i - 1
+                    distance = live - before
+
+                    hits[distance] += 1
+                    if outcome == last_outcome[address]:
+                        repeats[distance] += 1
+                    if outcome == default_taken:
+                        default_hits[distance] += 1
+
+                    i = previous + 1
+                    while i <= capacity:
+                        tree[i] -= 1
+                        i += i & -i
+
+                if now == capacity:
+                    # Renumber the live access times to 0..live-2 and rebuild a larger tree
+                    order = sorted((time, static_id) for static_id, time in enumerate(last_time)
+                                   if time >= 0 and static_id != address)
+                    for time, (_, static_id) in enumerate(order):
+                        last_time[static_id] = time
+                    now = len(order)
+                    capacity = 2 * live + 1024
+                    tree = [0] * (capacity + 1)
+                    for i in range(1, capacity + 1):
+                        if i <= now:
+                            tree[i] += 1
+                        parent = i + (i & -i)
+                        if parent <= capacity:
+                            tree[parent] += tree[i]
+
+                i = now + 1
+                while i <= capacity:
+                    tree[i] += 1
+                    i += i & -i
+                last_time[address] = now
+                last_outcome[address] = outcome
+                now += 1
+
+            total_branches += len(ids)
+            default_outcomes += len(ids) - int(taken.sum()) if default_taken == 0 else int(taken.sum())
+            if report:
+                # Counted once per simulated size, like the per-size jobs it replaces
+                report(progress_units * len(sizes))
+
+        results = {}
+        for size in sizes:
+            limit = max(0, min(size, len(hits)))
+            total_predictions = sum(hits[:limit])
+            correct_predictions = sum(repeats[:limit])
+            correct = correct_predictions + default_outcomes - sum(default_hits[:limit])
+
+            pred_accuracy = (correct_predictions / total_predictions) * 100 if total_predictions > 0 else 0
+            total_accuracy = (correct / total_branches) * 100 if total_branches > 0 else 0
+            prediction_percentage = (total_predictions / total_branches) * 100 if total_branches > 0 else 0
+            results[size] = (pred_accuracy, total_accuracy, prediction_percentage)
+
+        return results
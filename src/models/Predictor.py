@@ -1,18 +1,105 @@
+from __future__ import annotations
+
 from abc import ABC, abstractmethod
+from array import array
 from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+import numpy as np
 
-from rich.progress import Progress, TextColumn, BarColumn, TaskProgressColumn, TimeElapsedColumn, TaskID
-from rich.console import Console
-from src.models.Branch import Branch
+if TYPE_CHECKING:
+    from rich.progress import Progress, TaskID
+from src.models.Branch import Branch, OUTCOMES
+from src.models.BranchStatistics import BranchStatistics, DEFAULT_CORRECT, MISPREDICTED, PREDICTED, TRIPLES
+from src.models.WindowedMetrics import WindowedMetrics
+from src.utils.checkpoint import CHECKPOINT_INTERVAL, TraceDigest, prefix_digest, save_checkpoint, load_checkpoint
+from src.utils.instrumentation import active, phase, timed
+from src.utils.progress import ProgressCounter, reporter
+
+NO_RESULTS = np.zeros(0, dtype=np.uint8)  # results of a compiled loop that records none
+NO_STATISTICS = (np.zeros((0, TRIPLES), dtype=np.int64), np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int64),
+                 0)  # BranchStatistics.reserve() for a compiled loop that counts nothing
 
 class Predictor(ABC):
     MAX_HISTORY_SIZE = 16
     default_prediction_state = 'N'
+    has_batch_kernel = False  # True when simulate() is an array-backed kernel rather than the predict/update fallback
+    integer_addresses = False  # True when predict/update index by address bits and take integer addresses
+    TRIM_SLACK = 1 << 16  # Positions the access window of an LRU kernel may hold before a table that is not full trims it
+    implementation_version = 1  # Part of the result cache key, bump in a subclass whenever its results change
+
+    @classmethod
+    def check_size(cls, size):
+        # Raises ValueError when no predictor of this type can be built with size entries, so a run can
+        # reject a configuration before any work starts
+        if size < 1:
+            raise ValueError(f"a table holds at least one entry, not {size}")
 
     def __init__(self, size):
         self.history = OrderedDict()
         self.MAX_HISTORY_SIZE = size
-        self.console = Console()
+
+        # LRU state of the batch kernels, indexed by static ID. batch_stamp is the trace position of every
+        # ID's latest access (-1 before the first one) and batch_head the position of the least recently
+        # used member's latest access, so an ID is in the table exactly when its stamp is >= batch_head.
+        # batch_window keeps the IDs from position batch_base on, which eviction scans to find the next member.
+        # Exact LRU order is sequential: the kernels run compiled loops over these flat arrays (see
+        # src.models.kernels), or the same loops in Python when numba is not installed.
+        self.batch_stamp = array('q')
+        self.batch_values = bytearray()
+        self.batch_window = array('I')
+        self.batch_base = 0
+        self.batch_head = 0
+        self.batch_clock = 0
+        self.batch_occupancy = 0
+
+    def __getstate__(self):
+        # Everything but the console is plain data, so a predictor pickles as a snapshot of its tables,
+        # LRU order and counters
+        state = self.__dict__.copy()
+        state.pop('_console', None)
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state.get('batch_stamp'), list):
+            state = dict(state, batch_stamp=array('q', state['batch_stamp']))  # Taken before the stamps were an array
+        self.__dict__.update(state)
+
+    @property
+    def console(self):
+        # Created on first use, so predictors that never print do not load rich
+        console = self.__dict__.get('_console')
+        if console is None:
+            from rich.console import Console
+            console = self._console = Console()
+        return console
+
+    def canonical_state(self):
+        # The batch table as bytes: members in LRU order followed by their values, independent of the
+        # positions at which they were filled. None when the state is not just the table, as for
+        # predictors without a batch kernel.
+        if not self.has_batch_kernel:
+            return None
+
+        stamp = np.asarray(self.batch_stamp, dtype=np.int64)
+        members = np.flatnonzero(stamp >= max(self.batch_head, 0))
+        members = members[np.argsort(stamp[members])]
+        values = np.frombuffer(bytes(self.batch_values), dtype=np.uint8)[members]
+        return members.astype('<u4').tobytes() + values.tobytes()
+
+    def table_occupancy(self):
+        # Entries in the table the simulation uses: the batch state once a kernel ran, otherwise the history
+        return self.batch_occupancy if self.batch_clock else len(self.history)
+
+    def record_activity(self, recorder, branches, predictions, occupancy_before):
+        # Instrumentation counters of a simulated chunk: predicted branches hit the table, and every miss
+        # that did not grow the table evicted an entry
+        occupancy = self.table_occupancy()
+        misses = branches - predictions
+        scope = f'{type(self).__name__}/{self.MAX_HISTORY_SIZE}'
+        recorder.count(scope, {'branches': branches, 'hits': predictions, 'misses': misses,
+                               'evictions': misses - (occupancy - occupancy_before)})
+        recorder.gauge(scope, {'occupancy': occupancy, 'capacity': self.MAX_HISTORY_SIZE})
 
     @abstractmethod
     def predict(self, address):
@@ -22,58 +109,236 @@ class Predictor(ABC):
     def update(self, address, outcome):
         pass
 
-    def predict_branch(self, branch: Branch, progress_toggle=False, external_progress: Progress = None, external_task_id: TaskID = None):
+    def simulate(self, ids, taken, addresses=None, results=None):
+        # Batch API: runs the branches given as static IDs and taken bits (1 = taken), continuing from the
+        # state left by earlier calls, and returns (branches, predictions, correct predictions, correct).
+        # addresses is the ID -> address table of the trace, for predictors indexed by address bits. When
+        # results is a bytearray of one byte per branch, each branch's result code (see BranchStatistics)
+        # is written to it. This fallback drives predict/update with the IDs as addresses.
+        predictions = 0
+        correct_predictions = 0
+        correct = 0
+
+        for position, (address, taken_bit) in enumerate(zip(ids.tolist(), taken.tolist())):
+            actual_outcome = OUTCOMES[taken_bit]
+            prediction = self.predict(address)
+
+            if prediction is not None:
+                predictions += 1
+                correct_predictions += 1 if prediction == actual_outcome else 0
+                correct += 1 if actual_outcome == prediction else 0
+                if results is not None:
+                    results[position] = PREDICTED if prediction == actual_outcome else MISPREDICTED
+            else:
+                correct += 1 if actual_outcome == self.default_prediction_state else 0
+                if results is not None and actual_outcome == self.default_prediction_state:
+                    results[position] = DEFAULT_CORRECT
+
+            self.update(address, actual_outcome)
+
+        return len(ids), predictions, correct_predictions, correct
+
+    def simulate_chunk(self, ids, taken, addresses=None, statistics: BranchStatistics = None,
+                       metrics: WindowedMetrics = None):
+        # simulate() feeding the optional collectors: the chunk's per-branch results go to statistics, and
+        # with metrics the chunk is simulated in pieces that end at window boundaries, each one added to it
+        if metrics is None:
+            return self.simulate_counted(ids, taken, addresses, statistics)
+
+        totals = [0, 0, 0, 0]
+        for start, stop in metrics.pieces(len(ids)):
+            piece = self.simulate_counted(ids[start:stop], taken[start:stop], addresses, statistics)
+            metrics.add(*piece)
+            totals = [total + value for total, value in zip(totals, piece)]
+        return tuple(totals)
+
+    def simulate_counted(self, ids, taken, addresses=None, statistics: BranchStatistics = None):
+        # simulate() adding every branch to statistics when given. A compiled loop counts the branches as it
+        # simulates them; otherwise the result codes are recorded and added afterwards.
+        if statistics is None:
+            return self.simulate(ids, taken, addresses)
+        loop = self.compiled_loop()
+        if loop is not None and len(ids):
+            self._grow_batch_state(ids)
+            return self._simulate_compiled(loop, ids, taken, statistics=statistics)
+
+        results = bytearray(len(ids))
+        totals = self.simulate(ids, taken, addresses, results)
+        with phase('statistics'):
+            statistics.add(ids, taken, results)
+        return totals
+
+    def compiled_loop(self):
+        # The loop of src.models.kernels that simulates this predictor, None without one or without numba
+        return None
+
+    def _grow_batch_state(self, ids):
+        needed = int(ids.max()) + 1 if len(ids) else 0
+        grow = needed - len(self.batch_stamp)
+        if grow > 0:
+            self.batch_stamp.extend(array('q', [-1]) * grow)
+            self.batch_values.extend(bytes(grow))
+
+    def _simulate_compiled(self, loop, ids, taken, results=None, statistics: BranchStatistics = None):
+        # Runs a loop of src.models.kernels over the batch state and returns what simulate() does
+        self.batch_window.frombytes(ids.astype(np.uint32).tobytes())
+        self.batch_head, self.batch_clock, self.batch_occupancy, predictions, correct_predictions, default_correct = loop(
+            ids, taken, np.frombuffer(self.batch_stamp, dtype=np.int64), np.frombuffer(self.batch_values, dtype=np.uint8),
+            np.frombuffer(self.batch_window, dtype=np.uint32), self.batch_base, self.batch_head, self.batch_clock,
+            self.batch_occupancy, self.MAX_HISTORY_SIZE, 1 if self.default_prediction_state == 'T' else 0,
+            NO_RESULTS if results is None else np.frombuffer(results, dtype=np.uint8), results is not None,
+            *(NO_STATISTICS if statistics is None else statistics.reserve(ids)))
+        self._trim_batch_window()
+        return len(ids), predictions, correct_predictions, correct_predictions + default_correct
+
+    def _oldest_stamp(self):
+        # Latest access of the least recently used ID while nothing was evicted: a pass over every stamp
+        return min(filter((-1).__lt__, self.batch_stamp), default=self.batch_clock)
+
+    def _trim_batch_window(self):
+        # Positions before the least recently used member's latest access are never scanned again
+        if self.batch_occupancy < self.MAX_HISTORY_SIZE:
+            # Nothing was evicted yet, so every ID seen is a member and the head is the oldest one's latest
+            # access. Finding it takes a pass over the stamps, so it is only done once the window holds more
+            # than TRIM_SLACK positions beyond four per static ID: at most one pass per that many branches.
+            if len(self.batch_window) <= self.TRIM_SLACK + 4 * len(self.batch_stamp):
+                return
+            self.batch_head = self._oldest_stamp()
+
+        del self.batch_window[:self.batch_head - self.batch_base]
+        self.batch_base = self.batch_head
+
+    @timed('predict_branch')
+    def predict_branch(self, branch: Branch, progress_toggle=False, external_progress: Progress = None, external_task_id: TaskID = None, batch: bool = True,
+                       checkpoint_path: str = None, checkpoint_interval: int = CHECKPOINT_INTERVAL, counter: ProgressCounter = None,
+                       statistics: BranchStatistics = None, metrics: WindowedMetrics = None):
+        # branch is a Branch or a BranchStream; progress is advanced once per chunk, in the units of
+        # branch.progress_total (branches for a loaded trace, source bytes for a stream), on counter when
+        # one is given, otherwise on the external task or a progress bar of its own. Predictors with
+        # a batch kernel run it on static IDs unless batch=False selects the predict/update reference path.
+        # With a checkpoint_path, the run continues from the snapshot stored there when the trace starts
+        # with the branches it covers (an interrupted run, or a trace that had branches appended), and
+        # snapshots are written every checkpoint_interval branches and at the end. Checkpointed runs
+        # always simulate static IDs. So do runs given statistics, a BranchStatistics that collects the
+        # per static branch counts of the branches this call simulates, or metrics, a WindowedMetrics
+        # that collects them per window of the whole trace: checkpoints carry the windows counted so far,
+        # and a snapshot taken without them is not resumed from.
         correct_predictions = 0
         total_predictions = 0
         correct = 0
-        total_branches = len(branch)
-        update_interval = max(1, total_branches // 100)  # Update every 1%
+        total_branches = 0
+        digest = None
+        skip = 0
+        saved_at = -1
+        recorder = active()
+
+        if checkpoint_path is not None:
+            checkpoint = self.resume(branch, checkpoint_path, metrics)
+            if checkpoint is not None:
+                total_predictions, correct_predictions, correct, total_branches = checkpoint['totals']
+                digest = checkpoint['digest']
+                skip = saved_at = total_branches
+            else:
+                digest = TraceDigest()
+            next_checkpoint = total_branches + checkpoint_interval
     
-        if external_progress and external_task_id is not None:
-            progress = external_progress
-            task_id = external_task_id
-        elif progress_toggle:
+        task_id = None
+        if counter is None and not (external_progress and external_task_id is not None) and progress_toggle:
+            from rich.progress import Progress, TextColumn, BarColumn, TaskProgressColumn, TimeElapsedColumn
+
             progress = Progress(
                 TextColumn("[progress.description]{task.description}"),
                 BarColumn(),
                 TaskProgressColumn(),
                 TimeElapsedColumn()
             )
-            task_id = progress.add_task("[cyan]Processing branches...", total=total_branches)
+            task_id = progress.add_task("[cyan]Processing branches...", total=branch.progress_total)
+            report = reporter(progress=progress, task=task_id)
         else:
-            progress = None
-            task_id = None
+            report = reporter(counter, external_progress, external_task_id)
     
         try:
-            if progress and not external_progress:
+            if task_id is not None:
                 progress.start()
     
-            for i, (address, actual_outcome) in enumerate(branch):
-                prediction = self.predict(address)
+            if metrics is not None and isinstance(branch, Branch):
+                metrics.reserve(len(branch) - skip)
+            if statistics is not None and isinstance(branch, Branch) and not skip:
+                statistics.cover(branch)
 
-                if prediction is not None:
-                    total_predictions += 1
-                    correct_predictions += 1 if prediction == actual_outcome else 0
-                    correct += 1 if actual_outcome == prediction else 0
-                else:
-                    correct += 1 if actual_outcome == self.default_prediction_state else 0
+            if (batch and self.has_batch_kernel) or digest is not None or statistics is not None or metrics is not None:
+                for ids, taken, progress_units in branch.iter_id_chunks():
+                    if skip:
+                        # Branches before the snapshot were simulated by the run that took it
+                        dropped = min(skip, len(ids))
+                        ids, taken, skip = ids[dropped:], taken[dropped:], skip - dropped
 
-                self.update(address, actual_outcome)
-    
-                if progress:
-                    if (i + 1) % update_interval == 0:
-                        progress.update(task_id, advance=update_interval)
+                    if len(ids):
+                        occupancy = self.table_occupancy() if recorder else 0
+                        with phase('simulate'):
+                            count, predictions, chunk_correct_predictions, chunk_correct = self.simulate_chunk(
+                                ids, taken, branch.static_addresses, statistics, metrics)
+                        if recorder:
+                            self.record_activity(recorder, count, predictions, occupancy)
+                        total_predictions += predictions
+                        correct_predictions += chunk_correct_predictions
+                        correct += chunk_correct
+                        total_branches += count
+
+                        if digest is not None:
+                            digest.update(ids, taken)
+                            if total_branches >= next_checkpoint:
+                                self.save_checkpoint(checkpoint_path, digest, total_predictions, correct_predictions, correct,
+                                                     total_branches, metrics)
+                                saved_at = total_branches
+                                next_checkpoint = total_branches + checkpoint_interval
+
+                    if report:
+                        with phase('progress'):
+                            report(progress_units)
+
+                if digest is not None and saved_at != total_branches:
+                    # The final snapshot lets branches appended later be simulated on their own
+                    self.save_checkpoint(checkpoint_path, digest, total_predictions, correct_predictions, correct,
+                                         total_branches, metrics)
+            else:
+                chunks = self._integer_chunks(branch) if self.integer_addresses else branch.iter_chunks()
+                for pairs, count, progress_units in chunks:
+                    predictions = total_predictions
+                    occupancy = self.table_occupancy() if recorder else 0
+                    with phase('predict/update'):
+                        for address, actual_outcome in pairs:
+                            prediction = self.predict(address)
+
+                            if prediction is not None:
+                                total_predictions += 1
+                                correct_predictions += 1 if prediction == actual_outcome else 0
+                                correct += 1 if actual_outcome == prediction else 0
+                            else:
+                                correct += 1 if actual_outcome == self.default_prediction_state else 0
+
+                            self.update(address, actual_outcome)
+
+                    total_branches += count
+                    if recorder:
+                        self.record_activity(recorder, count, total_predictions - predictions, occupancy)
+                    if report:
+                        with phase('progress'):
+                            report(progress_units)
     
-            if progress and not external_progress:
-                progress.update(task_id, completed=total_branches)
+            if statistics is not None:
+                statistics.attach(branch)
+            if metrics is not None:
+                metrics.finish()
+            if task_id is not None:
+                progress.update(task_id, completed=branch.progress_total)
     
         finally:
-            if progress and not external_progress:
+            if task_id is not None:
                 progress.stop()
 
-        pred_accuracy = (correct_predictions / total_predictions) * 100 if total_predictions > 0 else 0
-        total_accuracy = (correct / total_branches) * 100 if total_branches > 0 else 0
-        prediction_percentage = (total_predictions / total_branches) * 100 if total_branches > 0 else 0
+        pred_accuracy, total_accuracy, prediction_percentage = self.accuracies(
+            total_predictions, correct_predictions, correct, total_branches)
     
         if progress_toggle:
             self.console.print(f"[green]Total branches: {total_predictions}")
@@ -81,4 +346,99 @@ class Predictor(ABC):
             self.console.print(f"[green]Prediction percentage: {prediction_percentage:.2f}%")
             self.console.print(f"[green]Accuracy: {pred_accuracy:.2f}%")
     
-        return pred_accuracy, total_accuracy, prediction_percentage
\ No newline at end of file
+        return pred_accuracy, total_accuracy, prediction_percentage
+
+    @timed('checkpoint')
+    def save_checkpoint(self, checkpoint_path, digest, total_predictions, correct_predictions, correct, total_branches,
+                        metrics: WindowedMetrics = None):
+        save_checkpoint(checkpoint_path, {
+            'predictor': type(self).__name__,
+            'size': self.MAX_HISTORY_SIZE,
+            'implementation_version': self.implementation_version,
+            'totals': (total_predictions, correct_predictions, correct, total_branches),
+            'digest': digest.hexdigest(),
+            'state': self.__getstate__(),
+            'metrics': None if metrics is None else metrics.snapshot(),
+        })
+
+    def resume(self, branch, checkpoint_path, metrics: WindowedMetrics = None):
+        # Restores the snapshot in checkpoint_path when it was taken by this kind of predictor on a trace
+        # that branch starts with, and with metrics, by a run that counted the same windows; returns it with
+        # a TraceDigest ready to continue, or None
+        checkpoint = load_checkpoint(checkpoint_path)
+        if checkpoint is None or (checkpoint['predictor'], checkpoint['size'], checkpoint['implementation_version']) != \
+                (type(self).__name__, self.MAX_HISTORY_SIZE, self.implementation_version):
+            return None
+
+        digest = prefix_digest(branch, checkpoint['totals'][3])
+        if digest is None or digest.hexdigest() != checkpoint['digest']:
+            return None
+        if metrics is not None and not metrics.restore(checkpoint.get('metrics')):
+            return None
+
+        self.__setstate__(checkpoint['state'])
+        return dict(checkpoint, digest=digest)
+
+    @staticmethod
+    def _integer_chunks(branch):
+        # branch.iter_chunks() with the addresses as integers from the ID table, rather than strings whose
+        # base depends on the trace
+        for ids, taken, progress_units in branch.iter_id_chunks():
+            pairs = zip(branch.static_addresses[ids].tolist(), map(OUTCOMES.__getitem__, taken.tolist()))
+            yield pairs, len(ids), progress_units
+
+    @staticmethod
+    def accuracies(total_predictions, correct_predictions, correct, total_branches):
+        pred_accuracy = (correct_predictions / total_predictions) * 100 if total_predictions > 0 else 0
+        total_accuracy = (correct / total_branches) * 100 if total_branches > 0 else 0
+        prediction_percentage = (total_predictions / total_branches) * 100 if total_branches > 0 else 0
+        return pred_accuracy, total_accuracy, prediction_percentage
+
+    @staticmethod
+    @timed('predict_together')
+    def predict_together(predictors, branch: Branch, external_progress: Progress = None, external_task_id: TaskID = None,
+                         counter: ProgressCounter = None, statistics=None, metrics=None):
+        # Drives any set of predictors with a single walk over the trace: every chunk is decoded once and
+        # handed to each predictor's simulate() while it is still in cache. Progress advances once per
+        # chunk in the units of branch.progress_total. statistics and metrics, when given, hold a
+        # BranchStatistics and a WindowedMetrics (or None) per predictor, as for predict_branch.
+        # Returns one result tuple per predictor, in order.
+        totals = [[0, 0, 0] for _ in predictors]
+        total_branches = 0
+        recorder = active()
+        report = reporter(counter, external_progress, external_task_id)
+        statistics = statistics or [None] * len(predictors)
+        metrics = metrics or [None] * len(predictors)
+        if isinstance(branch, Branch):
+            for predictor_metrics in metrics:
+                if predictor_metrics is not None:
+                    predictor_metrics.reserve(len(branch))
+            for predictor_statistics in statistics:
+                if predictor_statistics is not None:
+                    predictor_statistics.cover(branch)
+
+        for ids, taken, progress_units in branch.iter_id_chunks():
+            for predictor, total, predictor_statistics, predictor_metrics in zip(predictors, totals, statistics, metrics):
+                occupancy = predictor.table_occupancy() if recorder else 0
+                with phase('simulate'):
+                    _, predictions, correct_predictions, correct = predictor.simulate_chunk(
+                        ids, taken, branch.static_addresses, predictor_statistics, predictor_metrics)
+                if recorder:
+                    predictor.record_activity(recorder, len(ids), predictions, occupancy)
+                total[0] += predictions
+                total[1] += correct_predictions
+                total[2] += correct
+
+            total_branches += len(ids)
+            if report:
+                with phase('progress'):
+                    report(progress_units)
+
+        for predictor_statistics, predictor_metrics in zip(statistics, metrics):
+            if predictor_statistics is not None:
+                predictor_statistics.attach(branch)
+            if predictor_metrics is not None:
+                predictor_metrics.finish()
+
+        return [Predictor.accuracies(total_predictions, correct_predictions, correct, total_branches)
+                for total_predictions, correct_predictions, correct in totals]
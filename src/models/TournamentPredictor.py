@@ -0,0 +1,77 @@
+from src.models.Branch import OUTCOMES
+from src.models.BranchHistoryTable import COUNTER_STEPS, address_value
+from src.models.BranchStatistics import MISPREDICTED, PREDICTED
+from src.models.GsharePredictor import GsharePredictor
+
+
+class TournamentPredictor(GsharePredictor):
+    # Combines the gshare table with a local one indexed by the low address bits alone, both of size 2-bit
+    # counters. A chooser table, indexed like the local one, picks the prediction: from state 2 up the
+    # global one. When the two disagree the chooser moves towards the one that was right.
+    def __init__(self, size, history_bits=None):
+        super().__init__(size, history_bits)
+        self.local_table = bytearray(size)
+        self.chooser_table = bytearray(size)
+
+    def canonical_state(self):
+        return super().canonical_state() + bytes(self.local_table) + bytes(self.chooser_table)
+
+    def _local_index(self, address):
+        return (address >> self.index_shift) & (self.MAX_HISTORY_SIZE - 1)
+
+    def predict(self, address):
+        address = address_value(address)
+        local = self._local_index(address)
+        if self.chooser_table[local] >> 1:
+            return OUTCOMES[self.pattern_table[self._global_index(address)] >> 1]
+        return OUTCOMES[self.local_table[local] >> 1]
+
+    def update(self, address, outcome):
+        address = address_value(address)
+        taken = 1 if outcome == 'T' else 0
+        steps = COUNTER_STEPS[2]
+        local = self._local_index(address)
+        index = self._global_index(address)
+
+        global_taken = self.pattern_table[index] >> 1
+        local_taken = self.local_table[local] >> 1
+        if global_taken != local_taken:
+            self.chooser_table[local] = steps[global_taken == taken][self.chooser_table[local]]
+        self.pattern_table[index] = steps[taken][self.pattern_table[index]]
+        self.local_table[local] = steps[taken][self.local_table[local]]
+        self._push_history(taken)
+
+    def simulate(self, ids, taken, addresses=None, results=None):
+        local_indexes, global_indexes = self._chunk_indexes(ids, taken, addresses)
+        global_table = self.pattern_table
+        local_table = self.local_table
+        chooser = self.chooser_table
+        steps = COUNTER_STEPS[2]
+        correct = 0
+        record = results is not None
+
+        for position, local, index, outcome in zip(range(len(ids)), local_indexes.tolist(), global_indexes.tolist(),
+                                                   taken.tolist()):
+            global_counter = global_table[index]
+            local_counter = local_table[local]
+            global_taken = global_counter >> 1
+            local_taken = local_counter >> 1
+            prediction = global_taken
+
+            if global_taken != local_taken:
+                choice = chooser[local]
+                if not choice >> 1:
+                    prediction = local_taken
+                chooser[local] = steps[global_taken == outcome][choice]
+
+            if prediction == outcome:
+                correct += 1
+                if record:
+                    results[position] = PREDICTED
+            elif record:
+                results[position] = MISPREDICTED
+
+            global_table[index] = steps[outcome][global_counter]
+            local_table[local] = steps[outcome][local_counter]
+
+        return len(ids), len(ids), correct, correct
@@ -1,6 +1,16 @@
+import numpy as np
+
 from src.models.Predictor import Predictor
+from src.models.BranchStatistics import DEFAULT_CORRECT, MISPREDICTED, PREDICTED
+
+# Saturating counter transitions, indexed by the current state
+COUNTER_UP = (1, 2, 3, 3)
+COUNTER_DOWN = (0, 0, 1, 2)
 
 class TwoBitPredictor(Predictor):
+    has_batch_kernel = True
+    implementation_version = 2  # Batch kernel
+
     def __init__(self, size):
         super().__init__(size)
 
@@ -25,4 +35,66 @@ class TwoBitPredictor(Predictor):
         else:
             state = max(0, state - 1)  # Decrement state, min is 0 (Strongly Not Taken)
 
-        self.history[address] = state  # Add/Update the prediction state
\ No newline at end of file
+        self.history[address] = state  # Add/Update the prediction state
+
+    def compiled_loop(self):
+        from src.models.kernels import two_bit_lru
+        return two_bit_lru
+
+    def simulate(self, ids, taken, addresses=None, results=None):
+        # batch_values holds the counter of every static ID, a member predicts taken from state 2 up
+        self._grow_batch_state(ids)
+        loop = self.compiled_loop()
+        if loop is not None and len(ids):
+            return self._simulate_compiled(loop, ids, taken, results)
+
+        stamp = self.batch_stamp
+        state = self.batch_values
+        window = self.batch_window
+        base = self.batch_base
+        head = self.batch_head
+        position = first = self.batch_clock
+        occupancy = self.batch_occupancy
+        size = self.MAX_HISTORY_SIZE
+        record = results is not None
+        default_taken = 1 if self.default_prediction_state == 'T' else 0
+        predictions = 0
+        correct_predictions = 0
+        default_correct = 0
+
+        window.frombytes(ids.astype(np.uint32).tobytes())
+
+        for address, outcome in zip(ids.tolist(), taken.tolist()):
+            if stamp[address] >= head:
+                counter = state[address]
+                predictions += 1
+                if (counter >> 1) == outcome:
+                    correct_predictions += 1
+                    if record:
+                        results[position - first] = PREDICTED
+                elif record:
+                    results[position - first] = MISPREDICTED
+                state[address] = COUNTER_UP[counter] if outcome else COUNTER_DOWN[counter]
+            else:
+                if outcome == default_taken:
+                    default_correct += 1
+                    if record:
+                        results[position - first] = DEFAULT_CORRECT
+                if occupancy >= size:
+                    # Evict the least recently used member: move head to the next latest access
+                    while stamp[window[head - base]] != head:
+                        head += 1
+                    head += 1
+                else:
+                    occupancy += 1
+                state[address] = outcome  # A new entry starts at 0 and is updated once
+
+            stamp[address] = position
+            position += 1
+
+        self.batch_head = head
+        self.batch_clock = position
+        self.batch_occupancy = occupancy
+        self._trim_batch_window()
+
+        return len(ids), predictions, correct_predictions, correct_predictions + default_correct
@@ -0,0 +1,127 @@
+import numpy as np
+
+WINDOW_SIZE = 1 << 16  # Branches per window unless told otherwise
+WINDOW_FIELDS = ('window', 'first_branch', 'branches', 'predictions', 'correct_predictions', 'correct',
+                 'prediction_percentage', 'pred_accuracy', 'total_accuracy')
+DECAYED_FIELDS = ('decayed_prediction_percentage', 'decayed_pred_accuracy', 'decayed_total_accuracy')
+
+
+class WindowedMetrics:
+    # Counts of every window of `window` branches: branches, predictions, correct predictions and correct,
+    # in the columns of an int64 array allocated for the expected number of windows and doubled if the
+    # trace is longer. Drivers simulate each chunk in pieces that end at window boundaries and add the
+    # totals simulate() returns for every piece, so nothing is done per branch. With half_life (in
+    # branches) every window also records the counts decayed over the windows before it, from which the
+    # exponentially weighted percentages follow.
+    def __init__(self, window: int = WINDOW_SIZE, half_life: float = None, expected_branches: int = None,
+                 start: int = 0):
+        # start is the position of the first branch counted, for the metrics of a shard or a block of one
+        if window < 1:
+            raise ValueError(f"a window holds at least one branch, not {window}")
+        self.window = window
+        self.decay = 0.5 ** (window / half_life) if half_life else None
+        self.first = start // window  # Window counted in the first column
+        self.position = start
+        self.closed = 0  # Windows whose decayed counts are final
+        self.decayed = np.zeros(4)
+        self.counts = np.zeros((4, 0), dtype=np.int64)
+        self.decayed_counts = np.zeros((4, 0))
+        self.reserve(expected_branches or window)
+
+    def __len__(self):
+        # Windows with at least one branch
+        return -(-self.position // self.window) - self.first
+
+    def reserve(self, branches: int):
+        # Room for the next branches
+        self._grow(-(-(self.position + branches) // self.window) - self.first)
+
+    def _grow(self, windows: int):
+        if windows > self.counts.shape[1]:
+            grow = windows - self.counts.shape[1]
+            self.counts = np.concatenate((self.counts, np.zeros((4, grow), dtype=np.int64)), axis=1)
+            self.decayed_counts = np.concatenate((self.decayed_counts, np.zeros((4, grow))), axis=1)
+
+    def pieces(self, count: int):
+        # (start, stop) of the next count branches, split where a window ends
+        start = 0
+        stop = min(count, self.window - self.position % self.window)
+        while start < count:
+            yield start, stop
+            start, stop = stop, min(count, stop + self.window)
+
+    def add(self, branches, predictions, correct_predictions, correct):
+        # Totals of a piece that does not cross a window boundary
+        if not branches:
+            return
+        index = self.position // self.window - self.first
+        if index >= self.counts.shape[1]:
+            self._grow(max(index + 1, 2 * self.counts.shape[1]))
+        self.counts[:, index] += (branches, predictions, correct_predictions, correct)
+        self.position += branches
+        if self.position % self.window == 0:
+            self._close(index + 1)
+
+    def finish(self):
+        # Closes the last, partial window; called once the trace ended
+        self._close(len(self))
+
+    def merge(self, other: 'WindowedMetrics'):
+        # Adds the counts of other, the metrics of later branches counted on their own, such as a shard's;
+        # windows both count branches of are summed, and the decayed counts are redone from the first one
+        offset = other.first - self.first
+        windows = len(other)
+        self._grow(offset + windows)
+        self.counts[:, offset:offset + windows] += other.counts[:, :windows]
+        self.position = max(self.position, other.position)
+        if offset < self.closed:
+            self.closed = offset
+            self.decayed = self.decayed_counts[:, offset - 1].copy() if offset else np.zeros(4)
+
+    def snapshot(self) -> dict:
+        # The counts so far, enough for restore() to continue from, whatever the half life
+        return {'window': self.window, 'first': self.first, 'position': self.position,
+                'counts': self.counts[:, :len(self)].copy()}
+
+    def restore(self, snapshot) -> bool:
+        # Continues from a snapshot() of metrics with the same windows; False if there is none such
+        if snapshot is None or int(snapshot['window']) != self.window or int(snapshot['first']) != self.first:
+            return False
+        counts = np.asarray(snapshot['counts'], dtype=np.int64)
+        self.position = int(snapshot['position'])
+        self._grow(counts.shape[1])
+        self.counts[:, :counts.shape[1]] = counts
+        self.closed = 0
+        self.decayed = np.zeros(4)
+        self._close(self.position // self.window - self.first)
+        return True
+
+    def _close(self, windows):
+        if self.decay is None:
+            return
+        for index in range(self.closed, windows):
+            self.decayed = self.decayed * self.decay + self.counts[:, index]
+            self.decayed_counts[:, index] = self.decayed
+        self.closed = max(self.closed, windows)
+
+    def rows(self):
+        # One row per window in WINDOW_FIELDS order, followed by DECAYED_FIELDS with a half life
+        windows = len(self)
+        branches, predictions, correct_predictions, correct = self.counts[:, :windows]
+        indexes = np.arange(self.first, self.first + windows)
+        columns = [indexes, indexes * self.window, branches, predictions, correct_predictions,
+                   correct, _percentage(predictions, branches), _percentage(correct_predictions, predictions),
+                   _percentage(correct, branches)]
+        if self.decay is not None:
+            branches, predictions, correct_predictions, correct = self.decayed_counts[:, :windows]
+            columns += [_percentage(predictions, branches), _percentage(correct_predictions, predictions),
+                        _percentage(correct, branches)]
+        return list(zip(*(column.tolist() for column in columns)))
+
+    def fields(self):
+        return WINDOW_FIELDS + (DECAYED_FIELDS if self.decay is not None else ())
+
+
+def _percentage(part, whole):
+    # Same convention as Predictor.accuracies: 0 where there is nothing to divide
+    return np.divide(part * 100.0, whole, out=np.zeros(len(whole)), where=whole > 0)
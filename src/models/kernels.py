@@ -0,0 +1,121 @@
+from src.models.BranchStatistics import EVERY_BRANCH, MISPREDICTED, MISSES, PREDICTED
+
+# Compiled loops of the LRU batch kernels and of the per-branch statistics. Exact LRU order is sequential, so
+# NumPy cannot take these loops over; numba, when it is installed, compiles them on first use and caches the
+# machine code beside this module, releasing the GIL while they run. Without numba every loop here is None and
+# the callers run their Python or NumPy version. numba takes a while to import, so only a kernel about to run
+# imports this module.
+#
+# The LRU loops work on the batch state of Predictor as arrays: stamp (int64) and values (uint8) per static
+# ID, and window (uint32), the IDs from trace position base on, this batch included. head, position and
+# occupancy are batch_head, batch_clock and batch_occupancy. results receives a result code per branch when
+# record is set. With count, EVERY_BRANCH or MISSES (see BranchStatistics.cover), the branches are added to
+# the arrays of a BranchStatistics (triples, last_outcome and correct_hits) as they are simulated, which costs
+# less than a second pass over the chunk. Every loop returns (head, position, occupancy, predictions, correct
+# predictions, correct defaults).
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def compiled(function):
+    return None if numba is None else numba.njit(cache=True, nogil=True)(function)
+
+
+@compiled
+def one_bit_lru(ids, taken, stamp, values, window, base, head, position, occupancy, size, default_taken, results,
+                record, triples, last_outcome, correct_hits, count):
+    # values holds the last outcome of every static ID, which is the prediction while it is in the table
+    predictions = 0
+    correct_predictions = 0
+    default_correct = 0
+    for index in range(len(ids)):
+        address = ids[index]
+        outcome = taken[index]
+        if stamp[address] >= head:
+            predictions += 1
+            code = PREDICTED if values[address] == outcome else MISPREDICTED
+            correct_predictions += code == PREDICTED
+        else:
+            code = outcome == default_taken  # DEFAULT_CORRECT or MISSED
+            default_correct += code
+            if occupancy >= size:
+                # Evict the least recently used member: move head to the next latest access
+                while stamp[window[head - base]] != head:
+                    head += 1
+                head += 1
+            else:
+                occupancy += 1
+
+        if record:
+            results[index] = code
+        if count == EVERY_BRANCH or count == MISSES and code < MISPREDICTED:
+            count_branch(address, outcome, code, triples, last_outcome)
+        elif count:
+            correct_hits[address] += code == PREDICTED
+            last_outcome[address] = outcome
+        values[address] = outcome
+        stamp[address] = position
+        position += 1
+
+    return head, position, occupancy, predictions, correct_predictions, default_correct
+
+
+@compiled
+def two_bit_lru(ids, taken, stamp, values, window, base, head, position, occupancy, size, default_taken, results,
+                record, triples, last_outcome, correct_hits, count):
+    # values holds the counter of every static ID, a member predicts taken from state 2 up
+    predictions = 0
+    correct_predictions = 0
+    default_correct = 0
+    for index in range(len(ids)):
+        address = ids[index]
+        outcome = taken[index]
+        if stamp[address] >= head:
+            counter = values[address]
+            predictions += 1
+            code = PREDICTED if (counter >> 1) == outcome else MISPREDICTED
+            correct_predictions += code == PREDICTED
+            if outcome:
+                values[address] = min(counter + 1, 3)
+            else:
+                values[address] = max(counter - 1, 0)
+        else:
+            code = outcome == default_taken  # DEFAULT_CORRECT or MISSED
+            default_correct += code
+            if occupancy >= size:
+                while stamp[window[head - base]] != head:
+                    head += 1
+                head += 1
+            else:
+                occupancy += 1
+            values[address] = outcome  # A new entry starts at 0 and is updated once
+
+        if record:
+            results[index] = code
+        if count == EVERY_BRANCH or count == MISSES and code < MISPREDICTED:
+            count_branch(address, outcome, code, triples, last_outcome)
+        elif count:
+            correct_hits[address] += code == PREDICTED
+            last_outcome[address] = outcome
+        stamp[address] = position
+        position += 1
+
+    return head, position, occupancy, predictions, correct_predictions, default_correct
+
+
+@compiled
+def count_branch(address, outcome, code, triples, last_outcome):
+    # Adds one branch with its result code to the arrays of a BranchStatistics: a single count, whatever the
+    # outcome, so nothing here is branched on
+    triples[address, 6 * code + 2 * last_outcome[address] + 2 + outcome] += 1
+    last_outcome[address] = outcome
+
+
+@compiled
+def branch_statistics(ids, taken, codes, triples, last_outcome):
+    # Adds a chunk to the arrays of a BranchStatistics, given the result code of every branch
+    for index in range(len(ids)):
+        count_branch(ids[index], taken[index], codes[index], triples, last_outcome)
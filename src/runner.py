@@ -0,0 +1,555 @@
+import collections
+import collections.abc
+import contextlib
+import importlib
+import os
+import re
+import time
+
+from src.models.Branch import Branch
+from src.models.WindowedMetrics import WindowedMetrics, WINDOW_SIZE
+from src.utils.trace import is_trace_file, known_checksum, ensure_trace, cached_header
+from src.utils.results_cache import ResultCache, result_key, cached_windows, cache_windows
+from src.utils.instrumentation import profileFolder, recording, phase, active, collect, merge
+
+# The simulation engine shared by the interactive menu and the batch runner. It imports no UI module up
+# front: rich is only loaded to show progress or messages, and the results store only to save results.
+# Nor does it import what only some runs use: the predictor modules are loaded by type on first use, and
+# the pools, checkpoints, shards and streams by the runs that need them.
+
+filesFolder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Data', 'txt'))
+
+_PREDICTOR_CLASSES = {
+    'One Bit Predictor': ('src.models.OneBitPredictor', 'OneBitPredictor'),
+    'Two Bit Predictor': ('src.models.TwoBitPredictor', 'TwoBitPredictor'),
+    'Improved Predictor': ('src.models.ImprovedPredictor', 'ImprovedPredictor'),
+    'Direct Mapped Predictor': ('src.models.BranchHistoryTable', 'DirectMappedPredictor'),
+    'Set Associative Predictor': ('src.models.BranchHistoryTable', 'SetAssociativePredictor'),
+    'One Bit Direct Mapped Predictor': ('src.models.BranchHistoryTable', 'OneBitDirectMappedPredictor'),
+    'One Bit Set Associative Predictor': ('src.models.BranchHistoryTable', 'OneBitSetAssociativePredictor'),
+    'Gshare Predictor': ('src.models.GsharePredictor', 'GsharePredictor'),
+    'Tournament Predictor': ('src.models.TournamentPredictor', 'TournamentPredictor'),
+}
+
+
+HISTORY_NAME = re.compile(r'(.+) (\d+) History Bits')
+
+
+def history_name(name: str, history_bits: int) -> str:
+    # Name of the cells of a global-history predictor type whose predictors keep history_bits outcomes
+    return f"{name} {history_bits} History Bits"
+
+
+class PredictorTypes(collections.abc.Mapping):
+    # Predictor type name -> class, importing a class's module when it is first looked up. A history_name()
+    # of a global-history type is looked up too, as its subclass of that history length, but not iterated.
+    def __getitem__(self, name):
+        match = HISTORY_NAME.fullmatch(name)
+        if match and match[1] in _PREDICTOR_CLASSES:
+            predictor_class = self[match[1]]
+            if hasattr(predictor_class, 'with_history'):
+                return predictor_class.with_history(int(match[2]))
+        module, class_name = _PREDICTOR_CLASSES[name]
+        return getattr(importlib.import_module(module), class_name)
+
+    def __iter__(self):
+        return iter(_PREDICTOR_CLASSES)
+
+    def __len__(self):
+        return len(_PREDICTOR_CLASSES)
+
+    @staticmethod
+    def class_name(name: str) -> str:
+        return _PREDICTOR_CLASSES[name][1]
+
+
+PREDICTOR_TYPES = PredictorTypes()
+ONE_BIT = 'One Bit Predictor'
+COMPARE_ALL = 'Compare All'
+MAX_RESIDENT_TRACES = 2
+SWEEP_MIN_SIZES = 12  # One Bit sizes from which one stack-distance sweep beats the Python batch kernel per size
+
+_console = None
+
+
+def console():
+    # Progress and messages go to stderr, so they never mix with results written to stdout
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console(stderr=True)
+    return _console
+
+
+def sweep_min_sizes():
+    # One Bit sizes from which a trace's cells share one stack-distance sweep, None for never: the compiled
+    # batch kernel, used when numba is installed, is faster per size than a sweep of any number of sizes
+    import importlib.util
+    return SWEEP_MIN_SIZES if importlib.util.find_spec('numba') is None else None
+
+
+def trace_files():
+    # Trace files of Data/txt, smallest first
+    files = [f for f in os.listdir(filesFolder) if is_trace_file(f)]
+    files.sort(key=lambda x: os.path.getsize(os.path.join(filesFolder, x)))
+    return files
+
+
+def run_cells(cells, streaming=False, processes=False, max_workers=None, use_cache=True, checkpoints=False, shards=1,
+              show_progress=True, save=True, instrument=False, profile=False, branch_stats=0, window=0, half_life=None,
+              plot=False, coordinator=None, local_workers=0):
+    # ({cell: (pred_accuracy, total_accuracy, prediction_percentage)}, approximate cells) for (file, predictor
+    # type, size) cells, the approximate ones being sharded results that reconciliation could not make exact.
+    # Results are memoized by trace content, predictor and size, so only missing or invalidated cells are
+    # simulated; the new exact ones are cached and, with save, written to the results store. window writes
+    # the metrics of every cell per window of that many branches (decayed with half_life) to
+    # Data/csv/windows; they are collected by the same jobs as the results, whatever the other options, and
+    # cached beside them. plot draws the windows of every trace to Data/plots. With branch_stats every cell
+    # is simulated and observed, the cells of a trace in one local pass: each writes its per static branch
+    # table to Data/csv/branches and prints its branch_stats hardest branches. With coordinator, a (host,
+    # port) address, the cells are simulated by the workers that connect to it (see distribute_cells)
+    # instead of a local executor.
+    if instrument or profile:
+        # Per-phase timings, predictor counters and memory samples of the whole run, plus cProfile with profile
+        stem = os.path.join(profileFolder, time.strftime('run-%Y%m%d-%H%M%S'))
+        with recording(stem, profile), phase('run'):
+            accuracies, approximate = run_cells(cells, streaming, processes, max_workers, use_cache, checkpoints, shards,
+                                   show_progress, save, branch_stats=branch_stats, window=window, half_life=half_life,
+                                   plot=plot, coordinator=coordinator, local_workers=local_workers)
+        console().print(f"[green]Instrumentation saved to {stem}.json and {stem}.prof")
+        return accuracies, approximate
+
+    if half_life and not window:
+        window = WINDOW_SIZE
+    windows = (window, half_life) if window else None
+    observe = (True, window, half_life) if branch_stats else None
+    if observe and coordinator is not None:
+        raise ValueError("per-branch statistics are only collected by local runs")
+
+    accuracies = {}
+    approximate = set()
+    observations = {}  # cell -> (BranchStatistics, WindowedMetrics), either None when not asked for
+    cache = ResultCache() if use_cache else None
+    keys = {}
+
+    def reuse(cells):
+        # Takes the cached results of the cells whose trace checksum is known, returning those cells
+        found = cell_keys(cells)
+        keys.update(found)
+        reused = []
+        for cell, key in found.items():
+            cached = cache.get(key)
+            metrics = None if cached is None or windows is None else cached_windows(key, *windows)
+            if cached is not None and (windows is None or metrics is not None):
+                accuracies[cell] = cached
+                observations[cell] = (None, metrics)
+                reused.append(cell)
+        return reused
+
+    # A trace whose checksum is not known yet is looked up once it is loaded, which records it, so the
+    # traces are converted by the pipelined loader rather than one after another before it starts
+    reuse_loaded = None if cache is None or observe else reuse
+    if reuse_loaded is not None:
+        reused = reuse(cells)
+        if reused and show_progress:
+            console().print(f"[green]Reusing {len(reused)} cached results, {len(cells) - len(reused)} to simulate")
+
+    pending = [cell for cell in cells if cell not in accuracies]
+    if pending:
+        started_at = time.time()
+        started = time.perf_counter()
+        if coordinator is not None:
+            results, branch_count = distribute_cells(pending, coordinator, local_workers, show_progress, windows,
+                                                     observations, reuse_loaded)
+        else:
+            results, approximate, branch_count = simulate_cells(pending, streaming, processes, max_workers, checkpoints,
+                                                                shards, show_progress, observe, observations, windows,
+                                                                None if streaming else reuse_loaded)
+        wall_time = time.perf_counter() - started
+        accuracies.update(results)
+
+        # Only the new, exact results are cached and stored; loads and streams have recorded the checksums
+        # they lacked
+        exact_cells = [cell for cell in pending if cell in results and cell not in approximate]
+        if cache is not None:
+            keys.update(cell_keys([cell for cell in exact_cells if cell not in keys]))
+            for cell in exact_cells:
+                if cell in keys:
+                    cache.put(keys[cell], accuracies[cell])
+                    if windows is not None:
+                        cache_windows(keys[cell], observations[cell][1])
+
+        if save and exact_cells:
+            from src.utils.utils import save_results
+            save_results([cell + accuracies[cell] for cell in exact_cells], started_at=started_at, wall_time=wall_time,
+                         branches=branch_count)
+
+    if cache is not None:
+        cache.save()
+    if observe or windows:
+        report_observations(cells, observations, branch_stats, plot)
+
+    return accuracies, approximate
+
+
+def cell_keys(cells):
+    # Result cache key of every cell whose trace checksum is known: a current binary conversion records it,
+    # and so does a complete stream
+    checksums = {}
+    for file in dict.fromkeys(cell[0] for cell in cells):
+        checksum = known_checksum(os.path.join(filesFolder, file))
+        if checksum is not None:
+            checksums[file] = checksum
+    return {cell: result_key(checksums[cell[0]], PREDICTOR_TYPES[cell[1]], cell[2]) for cell in cells
+            if cell[0] in checksums}
+
+
+def report_observations(cells, observations, branch_stats=0, plot=False):
+    from src.utils.utils import save_branch_statistics, branch_statistics_table, save_windowed_metrics, \
+        plot_windowed_metrics, plotFolder
+
+    for cell in cells:
+        file, name, size = cell
+        statistics, metrics = observations[cell]
+        if statistics is not None:
+            path = save_branch_statistics(statistics, file, PREDICTOR_TYPES[name], size)
+            console().print(branch_statistics_table(statistics.top(branch_stats), f"{file} {name} {size}"))
+            console().print(f"[green]Per-branch statistics saved to {path}")
+        if metrics is not None:
+            path = save_windowed_metrics(metrics, file, PREDICTOR_TYPES[name], size)
+            console().print(f"[green]Windowed metrics saved to {path}")
+
+    if plot:
+        for file in dict.fromkeys(cell[0] for cell in cells):
+            series = {f"{name} {size}": observations[(file, name, size)][1] for _, name, size in cells
+                      if (file, name, size) in observations and observations[(file, name, size)][1] is not None}
+            if series:
+                path = plot_windowed_metrics(series, file, os.path.join(plotFolder, f"{os.path.basename(file)}.windows.png"))
+                console().print(f"[green]Windowed metrics plotted to {path}")
+
+
+def load_file(file_path, counter):
+    branch = Branch(file_path, progress_toggle=False, counter=counter)
+    return branch
+
+def process_file(branch, size, predictor_type, checkpoint, windows, counter):
+    # With windows, (window, half_life), the result comes with the cell's WindowedMetrics
+    predictor = PREDICTOR_TYPES[predictor_type](size)
+    if windows is None:
+        return predictor.predict_branch(branch, checkpoint_path=checkpoint, counter=counter)
+    metrics = WindowedMetrics(*windows)
+    return predictor.predict_branch(branch, checkpoint_path=checkpoint, counter=counter, metrics=metrics), metrics
+
+def observe_file(branch, configurations, statistics, window, half_life, counter):
+    # Every (predictor type, size) configuration in a single pass, each returning its result with its
+    # BranchStatistics and WindowedMetrics, or None for the ones not asked for
+    predictors = [PREDICTOR_TYPES[name](size) for name, size in configurations]
+    from src.models.BranchStatistics import BranchStatistics
+    from src.models.Predictor import Predictor
+
+    collected = [BranchStatistics() if statistics else None for _ in predictors]
+    metrics = [WindowedMetrics(window, half_life) if window else None for _ in predictors]
+    results = Predictor.predict_together(predictors, branch, counter=counter, statistics=collected, metrics=metrics)
+    return list(zip(results, collected, metrics))
+
+def sweep_file(branch, sizes, counter):
+    results = PREDICTOR_TYPES[ONE_BIT].sweep(branch, sizes, counter=counter)
+    return [results[size] for size in sizes]
+
+def compare_file(branch, configurations, windows, counter):
+    # Every (predictor type, size) configuration in a single pass over the trace, with windows each result
+    # with its WindowedMetrics as for process_file
+    from src.models.Predictor import Predictor
+
+    predictors = [PREDICTOR_TYPES[name](size) for name, size in configurations]
+    if windows is None:
+        return Predictor.predict_together(predictors, branch, counter=counter)
+    metrics = [WindowedMetrics(*windows) for _ in predictors]
+    return list(zip(Predictor.predict_together(predictors, branch, counter=counter, metrics=metrics), metrics))
+
+def shard_file(branch, size, predictor_type, start, stop, window, counter):
+    from src.utils.sharding import run_shard
+
+    result = run_shard(PREDICTOR_TYPES[predictor_type], size, branch, start, stop, metrics_window=window)
+    if counter is not None:
+        counter.advance(stop - start)
+    return result
+
+def plan_jobs(branches, cells, checkpoints=False, shards=1, observe=None, fuse=True, windows=None):
+    # (function, arguments, progress units, cells) per job, branches mapping each file to its trace; the
+    # progress counter is passed after the arguments and the job returns the results of its cells in order.
+    # With observe, (statistics, window, half_life), the cells of a file share one observed pass whatever
+    # the other options. Checkpointed runs get one job per cell, each with its own snapshot file. With shards > 1 every cell of
+    # a loaded trace whose predictor has a batch kernel is split into that many shard jobs. With fuse, or for
+    # a stream, which every job would parse again, the cells of a file share one pass over it; otherwise
+    # every cell of a loaded trace is a job of its own, so they spread over the pool. Either way One Bit
+    # cells of at least sweep_min_sizes() sizes share one sweep, unless windows, (window, half_life), has
+    # every job also return the WindowedMetrics of its cells, which a sweep does not count.
+    jobs = []
+    min_sizes = sweep_min_sizes()
+    for file, branch in branches.items():
+        file_cells = [cell for cell in cells if cell[0] == file]
+        one_bit = [cell for cell in file_cells if cell[1] == ONE_BIT]
+        if min_sizes is None or len(one_bit) < min_sizes or windows is not None:
+            one_bit = []
+        if observe:
+            jobs.append((observe_file, (branch, [(name, size) for _, name, size in file_cells], *observe),
+                         branch.progress_total, file_cells))
+        elif checkpoints:
+            from src.utils.checkpoint import checkpoint_path
+
+            source = os.path.join(filesFolder, file)
+            jobs.extend((process_file, (branch, size, name, checkpoint_path(source, PREDICTOR_TYPES[name], size), windows),
+                         branch.progress_total, [(file, name, size)]) for _, name, size in file_cells)
+        elif shards > 1 and isinstance(branch, Branch):
+            from src.utils.sharding import shard_ranges
+
+            window = None if windows is None else windows[0]
+            for _, name, size in file_cells:
+                if PREDICTOR_TYPES[name].has_batch_kernel:
+                    jobs.extend((shard_file, (branch, size, name, start, stop, window), stop - start, [(file, name, size)])
+                                for start, stop in shard_ranges(len(branch), shards))
+                else:
+                    jobs.append((process_file, (branch, size, name, None, windows), branch.progress_total,
+                                 [(file, name, size)]))
+        else:
+            if one_bit:
+                # One stack-distance pass per file gives the results of every size
+                jobs.append((sweep_file, (branch, [size for _, _, size in one_bit]),
+                             branch.progress_total * len(one_bit), one_bit))
+            rest = [cell for cell in file_cells if cell not in one_bit]
+            if len(rest) > 1 and (fuse or not isinstance(branch, Branch)):
+                jobs.append((compare_file, (branch, [(name, size) for _, name, size in rest], windows),
+                             branch.progress_total, rest))
+            else:
+                jobs.extend((process_file, (branch, size, name, None, windows), branch.progress_total,
+                             [(file, name, size)]) for _, name, size in rest)
+    return jobs
+
+def simulate_cells(cells, streaming=False, processes=False, max_workers=None, checkpoints=False, shards=1,
+                   show_progress=True, observe=None, observations=None, windows=None, reuse=None):
+    # Pipelined scheduler. Traces are opened largest first and the jobs of a trace are submitted, largest
+    # first, as soon as it is ready; a trace is released once all of its jobs are done. The next trace is
+    # opened while fewer than MAX_RESIDENT_TRACES are open, or when the open ones no longer have a job for
+    # every worker. In a process pool a Branch is pickled as a reference to its mmap'd binary trace and a
+    # BranchStream as its path, so no job copies a trace. Every load and job advances its own ProgressCounter,
+    # in a thread or a worker process alike, and only the board's reporter thread updates the progress bars;
+    # without show_progress jobs get no counter at all. Returns ({cell: accuracies}, approximate cells,
+    # simulated branches or None for streams). With observe or windows (see plan_jobs) the observations dict
+    # is filled with the (BranchStatistics, WindowedMetrics) of every cell. reuse, when given, is called with
+    # the cells of every trace as soon as it is loaded and returns those it found cached, which are left out.
+    import concurrent.futures
+    import multiprocessing
+    from src.models.BranchStream import BranchStream
+    from src.utils.progress import ProgressBoard
+
+    paths = {file: os.path.join(filesFolder, file) for file, _, _ in cells}
+    waiting = collections.deque(sorted(paths, key=lambda file: -os.path.getsize(paths[file])))
+    workers = max_workers or os.cpu_count() or 1
+
+    accuracies = {}
+    approximate = set()
+    branch_count = 0
+    branch_of = {}
+    cells_of = {}
+    remaining = {}
+    shard_results = {}
+    loads = {}
+    running = {}
+    process_total = 0
+    recorder = active()
+
+    if processes:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    if show_progress:
+        from rich.progress import Progress, TextColumn, BarColumn, TaskProgressColumn, TimeRemainingColumn
+
+        progress = Progress(
+            TextColumn("{task.description}"),
+            BarColumn(),
+            TaskProgressColumn(),
+            TimeRemainingColumn(),
+            console=console(),
+        )
+        display = progress
+        board = ProgressBoard(progress)
+    else:
+        display = board = contextlib.nullcontext()
+
+    with display, board, executor, concurrent.futures.ThreadPoolExecutor(max_workers=MAX_RESIDENT_TRACES) as loader:
+        taskLoad = None
+        taskProcess = None
+        if show_progress and not streaming:
+            # Progress totals come from the file sizes, so no pass over the traces is needed to count lines
+            taskLoad = progress.add_task("[cyan]Loading files...", total=sum(os.path.getsize(path) for path in paths.values()))
+        if show_progress:
+            taskProcess = progress.add_task("[cyan]Processing files...", total=0)
+
+        def counter(task):
+            return None if task is None else board.counter(task)
+
+        def open_traces():
+            while waiting and (len(branch_of) + len(loads) < MAX_RESIDENT_TRACES or (not loads and len(running) < workers)):
+                file = waiting.popleft()
+                if streaming:
+                    # Every job reads its trace chunk by chunk, nothing is loaded up front
+                    loads[loader.submit(BranchStream, paths[file])] = file
+                else:
+                    loads[loader.submit(load_file, paths[file], counter(taskLoad))] = file
+
+        def finish(file):
+            nonlocal branch_count
+            branch = branch_of.pop(file)
+            file_cells = cells_of.pop(file)
+            if isinstance(branch, Branch):
+                branch_count += len(branch) * len(file_cells)
+
+            for cell in file_cells:
+                if cell in shard_results:
+                    reconcile_cell(cell, branch, sorted(shard_results.pop(cell), key=lambda shard: shard['start']),
+                                   accuracies, approximate, windows, observations)
+
+        open_traces()
+        while loads or running:
+            done, _ = concurrent.futures.wait([*loads, *running], return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future in loads:
+                    file = loads.pop(future)
+                    branch = branch_of[file] = future.result()
+                    file_cells = [cell for cell in cells if cell[0] == file]
+                    if reuse is not None:
+                        reused = reuse(file_cells)
+                        if reused and show_progress:
+                            console().print(f"[green]Reusing {len(reused)} cached results of {file}")
+                        file_cells = [cell for cell in file_cells if cell not in reused]
+                    cells_of[file] = file_cells
+
+                    # Cells share a pass only while the traces still to come can keep the other workers busy
+                    fuse = len(waiting) + len(loads) + 1 >= workers - len(running)
+                    jobs = plan_jobs({file: branch}, file_cells, checkpoints, shards, observe, fuse, windows)
+                    remaining[file] = len(jobs)
+                    if not jobs:
+                        finish(file)
+                    process_total += sum(job[2] for job in jobs)
+                    if taskProcess is not None:
+                        progress.update(taskProcess, total=process_total)
+
+                    for job in sorted(jobs, key=lambda job: -job[2]):
+                        function, arguments, _, _ = job
+                        if processes and recorder:
+                            # The worker records into its own recorder and sends it back with the result
+                            future = executor.submit(collect, recorder.profile, function, *arguments, counter(taskProcess))
+                        else:
+                            future = executor.submit(function, *arguments, counter(taskProcess))
+                        running[future] = (file, job)
+                else:
+                    file, (function, _, _, job_cells) = running.pop(future)
+                    result = future.result()
+                    if processes and recorder:
+                        result, snapshot = result
+                        merge(snapshot)
+
+                    if function is shard_file:
+                        shard_results.setdefault(job_cells[0], []).append(result)
+                    elif function is observe_file:
+                        for cell, (accuracy, statistics, metrics) in zip(job_cells, result):
+                            accuracies[cell] = accuracy
+                            observations[cell] = (statistics, metrics)
+                    else:
+                        for cell, accuracy in zip(job_cells, result if isinstance(result, list) else [result]):
+                            if windows is not None:
+                                accuracy, metrics = accuracy
+                                observations[cell] = (None, metrics)
+                            accuracies[cell] = accuracy
+
+                    remaining[file] -= 1
+                    if not remaining[file]:
+                        finish(file)
+
+            open_traces()
+
+        if show_progress:
+            board.refresh()
+            progress.refresh()
+        for task in (taskLoad, taskProcess):
+            if task is not None:
+                progress.remove_task(task)
+
+    return accuracies, approximate, branch_count or None
+
+def distribute_cells(cells, coordinator, local_workers=0, show_progress=True, windows=None, observations=None,
+                     reuse=None):
+    # One job per cell, run by the workers of a coordinator listening on coordinator (host, port), with
+    # local_workers of them started on this host. Jobs name their trace by checksum and the coordinator
+    # serves the binary traces, converted here first, to workers that do not have them yet; the jobs of
+    # the largest traces are handed out first. Returns ({cell: accuracies}, simulated branches). With
+    # windows the observations dict is filled as by simulate_cells, and reuse is called as there once the
+    # traces are converted.
+    from src.utils.distributed import distribute
+
+    headers = {}
+    traces = {}
+    for file in dict.fromkeys(cell[0] for cell in cells):
+        source = os.path.join(filesFolder, file)
+        path = ensure_trace(source)
+        headers[file] = cached_header(source)
+        traces[headers[file].checksum] = path
+    if reuse is not None:
+        reused = reuse(cells)
+        cells = [cell for cell in cells if cell not in reused]
+        if not cells:
+            return {}, 0
+
+    cells = sorted(cells, key=lambda cell: -headers[cell[0]].count)
+    jobs = [(process_file, headers[file].checksum, (size, name, None, windows)) for file, name, size in cells]
+
+    if show_progress:
+        from rich.progress import Progress, TextColumn, BarColumn, TaskProgressColumn, TimeRemainingColumn
+
+        progress = Progress(
+            TextColumn("{task.description}"),
+            BarColumn(),
+            TaskProgressColumn(),
+            TimeRemainingColumn(),
+            console=console(),
+        )
+        task = progress.add_task("[cyan]Processing jobs...", total=len(jobs))
+        display = progress
+        on_result = lambda job: progress.advance(task)
+    else:
+        display = contextlib.nullcontext()
+        on_result = None
+
+    with display:
+        results = distribute(jobs, traces, coordinator, local_workers, on_result, log=console().print)
+        if show_progress:
+            progress.remove_task(task)
+
+    if windows is not None:
+        for cell, (_, metrics) in zip(cells, results):
+            observations[cell] = (None, metrics)
+        results = [accuracy for accuracy, _ in results]
+    return dict(zip(cells, results)), sum(headers[file].count for file, _, _ in cells)
+
+def reconcile_cell(cell, branch, shard_list, accuracies, approximate, windows=None, observations=None):
+    from src.models.Predictor import Predictor
+    from src.utils.sharding import reconcile_shards
+
+    file, name, size = cell
+    count = len(branch)
+    metrics = None if windows is None else WindowedMetrics(*windows, count)
+    totals, report = reconcile_shards(PREDICTOR_TYPES[name], size, branch, shard_list, metrics)
+    accuracies[cell] = Predictor.accuracies(*totals, count)
+    if metrics is not None:
+        observations[cell] = (None, metrics)
+    if report['exact']:
+        console().print(f"[green]{file} {name} {size}: {report['shards']} shards, exact "
+                      f"({report['repaired']} branches re-simulated, divergence {report['divergence']})")
+    else:
+        approximate.add(cell)
+        console().print(f"[yellow]{file} {name} {size}: {report['shards']} shards, approximate: up to "
+                      f"{report['error_bound']} of {count} branches may be counted differently "
+                      f"(divergence {report['divergence']})")
@@ -0,0 +1,287 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+from rich.console import Console
+from rich.table import Table
+from rich import box
+
+from src.models.Branch import Branch
+from src.models.BranchStatistics import BranchStatistics
+from src.runner import PREDICTOR_TYPES
+from src.utils.synthetic import generate_trace
+from src.utils.trace import trace_cache_path
+from src.utils.utils import getLines
+
+benchmarkFolder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Data', 'benchmarks'))
+
+BASELINE_FILE = 'baseline.json'
+BENCHMARK_SIZES = (4, 16, 64)
+REGRESSION_THRESHOLD = 0.10  # Relative throughput loss against the baseline that counts as a regression
+STATISTICS_OVERHEAD_LIMIT = 0.20  # Time per-branch statistics may add to a simulation
+STATISTICS_REPEAT = 7
+RSS_SAMPLE_INTERVAL = 0.005
+
+console = Console()
+
+
+class PeakRss:
+    # Samples the resident set size of this process in a background thread while the block runs
+    def __init__(self):
+        self.process = psutil.Process()
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self._stop.wait(RSS_SAMPLE_INTERVAL)
+
+    def __enter__(self):
+        self.peak = self.process.memory_info().rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def predictor_classes():
+    # Every predictor type the runner offers
+    return list(dict.fromkeys(PREDICTOR_TYPES.values()))
+
+
+def measure(name, work, branches=None, source_bytes=None):
+    gc.collect()
+    with PeakRss() as rss:
+        start = time.perf_counter()
+        work()
+        seconds = time.perf_counter() - start
+
+    result = {'name': name, 'seconds': seconds, 'peak_rss_mb': rss.peak / 2 ** 20}
+    if branches is not None:
+        result.update(branches=branches, branches_per_second=branches / seconds, ns_per_branch=seconds * 1e9 / branches)
+    if source_bytes is not None:
+        result.update(source_mb=source_bytes / 2 ** 20, mb_per_second=source_bytes / 2 ** 20 / seconds)
+    return result
+
+
+def drop_trace_cache(trace_path):
+    cache_path = trace_cache_path(trace_path)
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+
+
+def benchmark_loading(trace_path, branches):
+    # Cold runs convert the text trace into the binary cache, warm runs only read the cached one
+    source_bytes = os.path.getsize(trace_path)
+    results = []
+
+    drop_trace_cache(trace_path)
+    results.append(measure('load/getLines/cold', lambda: getLines(trace_path), branches, source_bytes))
+    results.append(measure('load/getLines/warm', lambda: getLines(trace_path), branches, source_bytes))
+
+    drop_trace_cache(trace_path)
+    results.append(measure('load/Branch/cold', lambda: Branch(trace_path, progress_toggle=False), branches, source_bytes))
+    results.append(measure('load/Branch/warm', lambda: Branch(trace_path, progress_toggle=False), branches, source_bytes))
+    return results
+
+
+def warm_up(cls, branch):
+    # Loads, or compiles, what a batch kernel needs once per process, so the timed runs only simulate
+    for ids, taken, _ in branch.iter_id_chunks(stop=1024):
+        cls(1).simulate(ids, taken, branch.static_addresses)
+
+
+def benchmark_predictors(branch, sizes):
+    results = []
+    for cls in predictor_classes():
+        warm_up(cls, branch)
+        for size in sizes:
+            results.append(measure(f'predict/{cls.__name__}/{size}', lambda: cls(size).predict_branch(branch), len(branch)))
+            console.print(f"[cyan]{results[-1]['name']}: {results[-1]['branches_per_second']:,.0f} branches/s")
+    return results
+
+
+def statistics_overhead(branch, cls, size, repeat=STATISTICS_REPEAT):
+    # Relative time statistics collection adds to a run, fastest of repeat runs each way so noise cancels out.
+    # The runs alternate, so the machine drifting along the measurement slows both ways alike, and take CPU
+    # time, which other processes on the machine do not add to.
+    def seconds(statistics):
+        gc.collect()
+        start = time.process_time()
+        cls(size).predict_branch(branch, statistics=BranchStatistics() if statistics else None)
+        return time.process_time() - start
+
+    plain = collecting = float('inf')
+    for _ in range(repeat):
+        plain = min(plain, seconds(False))
+        collecting = min(collecting, seconds(True))
+    return collecting / plain - 1
+
+
+def benchmark_statistics(branch, sizes):
+    results = []
+    for cls in predictor_classes():
+        for size in sizes:
+            overhead = statistics_overhead(branch, cls, size)
+            results.append({'name': f'statistics/{cls.__name__}/{size}', 'overhead': overhead})
+            console.print(f"[cyan]{results[-1]['name']}: {overhead:+.1%}")
+    return results
+
+
+def run_benchmarks(length=1_000_000, sizes=BENCHMARK_SIZES, seed=0, static_branches=4096, bias=0.7,
+                   loop_fraction=0.2, loop_length=8, locality=1.1):
+    trace_parameters = {'length': length, 'seed': seed, 'static_branches': static_branches, 'bias': bias,
+                        'loop_fraction': loop_fraction, 'loop_length': loop_length, 'locality': locality}
+    folder = tempfile.mkdtemp(prefix='bp-benchmark-')
+    trace_path = os.path.join(folder, f'synthetic-{os.getpid()}.txt')
+
+    try:
+        console.print(f"[cyan]Generating a synthetic trace of {length:,} branches...")
+        generate = measure('generate/synthetic', lambda: generate_trace(trace_path, **trace_parameters), length,
+                           None)
+        results = [generate] + benchmark_loading(trace_path, length)
+
+        branch = Branch(trace_path, progress_toggle=False)
+        results += benchmark_predictors(branch, sizes)
+        results += benchmark_statistics(branch, sizes)
+        del branch
+    finally:
+        drop_trace_cache(trace_path)
+        shutil.rmtree(folder, ignore_errors=True)
+
+    return {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sizes': list(sizes),
+            'trace': trace_parameters,
+        },
+        'results': results,
+    }
+
+
+def primary_metric(result):
+    # Throughput the comparison is made on, higher is better
+    return 'mb_per_second' if 'mb_per_second' in result else 'branches_per_second'
+
+
+def statistics_over_limit(report, limit=STATISTICS_OVERHEAD_LIMIT):
+    return [result['name'] for result in report['results'] if result.get('overhead', 0) > limit]
+
+
+def compare_with_baseline(report, baseline, threshold=REGRESSION_THRESHOLD):
+    # Returns (name, metric, baseline value, current value, relative change, regressed) per common benchmark
+    baseline_results = {result['name']: result for result in baseline.get('results', [])}
+    comparison = []
+    for result in report['results']:
+        previous = baseline_results.get(result['name'])
+        if previous is None:
+            continue
+        metric = primary_metric(result)
+        if metric not in result or metric not in previous:
+            continue
+        change = result[metric] / previous[metric] - 1
+        comparison.append((result['name'], metric, previous[metric], result[metric], change, change < -threshold))
+    return comparison
+
+
+def print_report(report, comparison):
+    table = Table(title="Benchmark Results", box=box.DOUBLE_EDGE, show_header=True, header_style="bold magenta")
+    table.add_column("Benchmark", style="yellow", no_wrap=True)
+    table.add_column("Branches/s", style="green", justify="right", no_wrap=True)
+    table.add_column("ns/branch", style="green", justify="right")
+    table.add_column("MB/s", style="green", justify="right")
+    table.add_column("Peak RSS (MB)", style="cyan", justify="right")
+    table.add_column("Overhead", style="cyan", justify="right")
+    table.add_column("vs Baseline", justify="right")
+
+    changes = {name: (change, regressed) for name, _, _, _, change, regressed in comparison}
+    for result in report['results']:
+        change, regressed = changes.get(result['name'], (None, False))
+        table.add_row(
+            result['name'],
+            f"{result['branches_per_second']:,.0f}" if 'branches_per_second' in result else "",
+            f"{result['ns_per_branch']:.1f}" if 'ns_per_branch' in result else "",
+            f"{result['mb_per_second']:.1f}" if 'mb_per_second' in result else "",
+            f"{result['peak_rss_mb']:.1f}" if 'peak_rss_mb' in result else "",
+            f"{result['overhead']:+.1%}" if 'overhead' in result else "",
+            "" if change is None else f"[{'red' if regressed else 'green'}]{change:+.1%}",
+        )
+    console.print(table)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput benchmarks of the predictors and trace loading paths "
+                                                 "on a deterministic synthetic trace")
+    parser.add_argument('--length', type=int, default=1_000_000, help="dynamic branches in the synthetic trace")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(BENCHMARK_SIZES), help="predictor table sizes")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--static-branches', type=int, default=4096)
+    parser.add_argument('--bias', type=float, default=0.7)
+    parser.add_argument('--loop-fraction', type=float, default=0.2)
+    parser.add_argument('--loop-length', type=int, default=8)
+    parser.add_argument('--locality', type=float, default=1.1)
+    parser.add_argument('--output', help="write the report as JSON to this file")
+    parser.add_argument('--baseline', default=os.path.join(benchmarkFolder, BASELINE_FILE),
+                        help="baseline report to compare with")
+    parser.add_argument('--save-baseline', action='store_true', help="store this report as the new baseline")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="relative throughput loss that fails the comparison")
+    parser.add_argument('--statistics-limit', type=float, default=STATISTICS_OVERHEAD_LIMIT,
+                        help="relative time statistics collection may add before the run fails")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.length, args.sizes, args.seed, args.static_branches, args.bias,
+                            args.loop_fraction, args.loop_length, args.locality)
+
+    comparison = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        if baseline.get('meta', {}).get('trace') != report['meta']['trace']:
+            console.print("[yellow]The baseline was measured on a different synthetic trace, comparing anyway")
+        comparison = compare_with_baseline(report, baseline, args.threshold)
+        report['comparison'] = [dict(zip(('name', 'metric', 'baseline', 'current', 'change', 'regressed'), row))
+                                for row in comparison]
+
+    print_report(report, comparison)
+
+    outputs = [args.output] if args.output else []
+    if args.save_baseline:
+        outputs.append(args.baseline)
+    for output in outputs:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+        console.print(f"[green]Report saved to {output}")
+
+    status = 0
+    regressions = [row[0] for row in comparison if row[5]]
+    if regressions:
+        console.print(f"[red]{len(regressions)} benchmarks regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        status = 1
+    over_limit = statistics_over_limit(report, args.statistics_limit)
+    if over_limit:
+        console.print(f"[red]Statistics add more than {args.statistics_limit:.0%} in {len(over_limit)} benchmarks: "
+                      f"{', '.join(over_limit)}")
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
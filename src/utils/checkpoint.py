@@ -0,0 +1,71 @@
+import hashlib
+import os
+
+import numpy as np
+
+from src.utils.files import atomic_write
+from src.utils.trace import source_digest
+
+checkpointFolder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Data', 'checkpoints'))
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_INTERVAL = 1 << 24  # Branches between two snapshots of a running simulation
+
+
+def checkpoint_path(source_path: str, predictor_class, size: int) -> str:
+    # Keyed by the digest of the source path, like the binary trace cache, so traces of the same name in
+    # different folders do not resume from each other's snapshots
+    return os.path.join(checkpointFolder, f"{os.path.basename(source_path)}.{source_digest(source_path)[:16]}."
+                                          f"{predictor_class.__name__}.{size}.ckpt")
+
+
+class TraceDigest:
+    # Running SHA-256 of the static IDs and outcomes simulated so far. IDs and outcomes are hashed
+    # separately, so the digest does not depend on how the trace was split into chunks.
+    def __init__(self):
+        self.ids = hashlib.sha256()
+        self.taken = hashlib.sha256()
+
+    def update(self, ids, taken):
+        self.ids.update(np.ascontiguousarray(ids, dtype='<u4').tobytes())
+        self.taken.update(np.ascontiguousarray(taken, dtype=np.uint8).tobytes())
+
+    def hexdigest(self) -> str:
+        return self.ids.hexdigest() + self.taken.hexdigest()
+
+
+def prefix_digest(branch, position: int):
+    # Digest of the first position branches, None when the trace is shorter than that
+    digest = TraceDigest()
+    remaining = position
+
+    for ids, taken, _ in branch.iter_id_chunks():
+        if remaining <= 0:
+            break
+        digest.update(ids[:remaining], taken[:remaining])
+        remaining -= min(remaining, len(ids))
+
+    return digest if remaining <= 0 else None
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    # Written atomically, an interrupted save leaves the previous snapshot in place
+    import pickle
+
+    with atomic_write(path) as file:
+        pickle.dump(dict(checkpoint, version=CHECKPOINT_VERSION), file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_checkpoint(path: str):
+    # None when there is no usable snapshot
+    import pickle
+
+    try:
+        with open(path, 'rb') as file:
+            checkpoint = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+    if not isinstance(checkpoint, dict) or checkpoint.get('version') != CHECKPOINT_VERSION:
+        return None
+    return checkpoint
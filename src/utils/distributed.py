@@ -0,0 +1,328 @@
+import collections
+import contextlib
+import os
+import queue
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+from src.models.Branch import Branch
+from src.utils.files import atomic_write
+from src.utils.trace import binFolder, read_header, HEADER_SIZE, TRACE_EXTENSION
+
+storeFolder = os.path.join(binFolder, 'store')
+
+AUTHKEY_VARIABLE = 'BP_AUTHKEY'  # Environment variable holding the key shared by a coordinator and its workers
+MAX_ATTEMPTS = 3          # Times a job may be lost or fail before the sweep is abandoned
+MAX_COPIES = 2            # Workers running the same job at once, once no job is left to hand out
+HEARTBEAT_INTERVAL = 5.0  # Seconds between two heartbeats of a worker running a job
+WORKER_TIMEOUT = 60.0     # Seconds without a message after which a running worker is considered dead
+CONNECT_TIMEOUT = 30.0    # Seconds a worker keeps trying to reach its coordinator
+STOP_TIMEOUT = 5.0        # Seconds local workers get to exit once the sweep is done
+POLL_INTERVAL = 0.5
+TRANSFER_CHUNK_SIZE = 16 * 1024 * 1024
+
+# A coordinator runs the jobs of a sweep on the workers that connect to it, on this host or others. Workers
+# pull jobs one at a time, so a faster worker simply runs more of them; once none is left, an idle worker
+# runs a second copy of the oldest running job, and the first result of a job wins. A job whose worker
+# dies, or stays silent for WORKER_TIMEOUT, goes back to the front of the queue. Traces are named by the
+# checksum of their text: a worker keeps the binary traces it was sent in Data/bin/store and only asks the
+# coordinator for the ones it does not have. Messages are pickled over multiprocessing connections, which
+# authenticate both ends with an HMAC of a shared key: anyone holding it can run code on the other end. The
+# key is BP_AUTHKEY; a coordinator without one draws a random key, hands it to its local workers and
+# prints it for the others, and a worker without one refuses to start.
+
+
+def authkey(generate: bool = False) -> bytes:
+    # The shared key from BP_AUTHKEY; without it a random one with generate, otherwise a ValueError
+    key = os.environ.get(AUTHKEY_VARIABLE)
+    if key:
+        return key.encode()
+    if generate:
+        return secrets.token_hex(16).encode()
+    raise ValueError(f"set {AUTHKEY_VARIABLE} to the key of the coordinator")
+
+
+class Scheduler:
+    # Job indexes handed out to workers, shared by the threads serving them
+    def __init__(self, count: int, max_attempts: int = MAX_ATTEMPTS):
+        self.pending = collections.deque(range(count))
+        self.running = {}  # job -> workers running a copy, oldest job first
+        self.results = {}
+        self.failures = collections.Counter()
+        self.max_attempts = max_attempts
+        self.workers = set()
+        self.error = None
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def finished(self) -> bool:
+        return self.closed or self.error is not None or not (self.pending or self.running)
+
+    def connect(self, worker):
+        with self.condition:
+            self.workers.add(worker)
+
+    def disconnect(self, worker):
+        with self.condition:
+            self.workers.discard(worker)
+
+    def next_job(self, worker):
+        # Blocks until there is a job for worker, None once the sweep is over
+        with self.condition:
+            while not self.finished():
+                if self.pending:
+                    job = self.pending.popleft()
+                else:
+                    job = next((job for job, workers in self.running.items()
+                                if len(workers) < MAX_COPIES and worker not in workers), None)
+                if job is not None:
+                    self.running.setdefault(job, []).append(worker)
+                    return job
+                self.condition.wait()
+            return None
+
+    def complete(self, job, worker, result) -> bool:
+        # False when another copy of the job finished first
+        with self.condition:
+            self._release(job, worker)
+            if job in self.results:
+                return False
+            self.results[job] = result
+            self.running.pop(job, None)  # Other copies finish on their own, their results are dropped
+            self.condition.notify_all()
+            return True
+
+    def fail(self, job, worker, reason: str, attempted=True):
+        # attempted is False when the job never reached the worker, which does not count against it
+        with self.condition:
+            self._release(job, worker)
+            if job in self.results:
+                return
+            self.failures[job] += attempted
+            if self.failures[job] >= self.max_attempts:
+                self.error = f"job {job} failed {self.failures[job]} times, last: {reason}"
+            elif job not in self.running:
+                self.pending.appendleft(job)  # Unless another copy is still running
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def _release(self, job, worker):
+        workers = self.running.get(job)
+        if workers and worker in workers:
+            workers.remove(worker)
+            if not workers:
+                del self.running[job]
+
+
+def distribute(jobs, traces, address, local_workers=0, on_result=None, log=print):
+    # Runs jobs, (function, trace checksum, arguments) each called as function(branch, *arguments, None)
+    # on a worker, with every worker that connects to address (host, port) and local_workers more started
+    # on this host. traces maps checksums to binary trace paths. on_result is called with the index of
+    # every finished job; returns the results of all jobs in order.
+    scheduler = Scheduler(len(jobs))
+    done = queue.Queue()
+    key = authkey(generate=True)
+    listener = Listener(address, authkey=key)
+    host, port = listener.address
+    log(f"[cyan]Coordinator listening on {host}:{port} for {len(jobs)} jobs")
+    if not os.environ.get(AUTHKEY_VARIABLE):
+        log(f"[cyan]Start other workers with {AUTHKEY_VARIABLE}={key.decode()}")
+
+    def accept():
+        while not scheduler.closed:
+            try:
+                connection = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue  # A refused or aborted connection, or the listener closing
+            threading.Thread(target=_serve, args=(connection, scheduler, jobs, traces, done, log), daemon=True).start()
+
+    acceptor = threading.Thread(target=accept, daemon=True)
+    acceptor.start()
+    local_host = '127.0.0.1' if host in ('0.0.0.0', '') else host
+    processes = [spawn_worker((local_host, port), key) for _ in range(local_workers)]
+
+    try:
+        finished = 0
+        while finished < len(jobs) and scheduler.error is None:
+            try:
+                job = done.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if (scheduler.error is None and processes and not scheduler.workers
+                        and all(process.poll() is not None for process in processes)):
+                    raise RuntimeError("every local worker exited before the sweep was done") from None
+                continue
+            finished += 1
+            if on_result is not None:
+                on_result(job)
+
+        if scheduler.error is not None:
+            raise RuntimeError(scheduler.error)
+        return [scheduler.results[job] for job in range(len(jobs))]
+    finally:
+        scheduler.close()
+        with contextlib.suppress(OSError):
+            socket.create_connection((local_host, port), timeout=1).close()  # Wakes the acceptor up
+        acceptor.join(timeout=STOP_TIMEOUT)
+        listener.close()
+        for process in processes:
+            try:
+                process.wait(timeout=STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()  # Still running a copy of a job another worker finished
+                process.wait()
+
+
+def _serve(connection, scheduler, jobs, traces, done, log):
+    # Talks to one worker until the sweep is over or the worker is lost
+    worker = None
+    job = None
+    sent = False
+    try:
+        if not connection.poll(WORKER_TIMEOUT):
+            return
+        _, worker = connection.recv()
+        scheduler.connect(worker)
+        log(f"[green]Worker {worker} connected")
+
+        while (job := scheduler.next_job(worker)) is not None:
+            function, checksum, arguments = jobs[job]
+            connection.send(('job', job, checksum, function, arguments))
+            sent = True
+
+            while True:
+                if not connection.poll(WORKER_TIMEOUT):
+                    raise TimeoutError(f"silent for {WORKER_TIMEOUT:.0f} seconds")
+                message = connection.recv()
+                if message[0] == 'fetch':
+                    _send_trace(connection, traces[message[1]])
+                elif message[0] == 'result':
+                    if scheduler.complete(job, worker, message[2]):
+                        done.put(job)
+                    break
+                elif message[0] == 'error':
+                    log(f"[yellow]Job {job} failed on worker {worker}: {message[2]}")
+                    scheduler.fail(job, worker, message[2])
+                    break
+                # Heartbeats only show that the worker is alive
+            job = None
+            sent = False
+
+        connection.send(('stop',))
+    except (EOFError, OSError) as error:
+        if job is not None and not scheduler.closed:
+            log(f"[yellow]Worker {worker} lost while running job {job} ({str(error) or type(error).__name__}), retrying it")
+            scheduler.fail(job, worker, f"worker {worker} lost", attempted=sent)
+    finally:
+        if worker is not None:
+            scheduler.disconnect(worker)
+        connection.close()
+
+
+def _send_trace(connection, path):
+    # The binary trace as raw chunks, ended by an empty one
+    with open(path, 'rb') as file:
+        while block := file.read(TRANSFER_CHUNK_SIZE):
+            connection.send_bytes(block)
+    connection.send_bytes(b'')
+
+
+def spawn_worker(address, key: bytes):
+    # A worker process on this host, given the key through its environment; its stdout is dropped so it
+    # never mixes with the results
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+    return subprocess.Popen([sys.executable, '-m', 'src.cli', '--worker', f"{address[0]}:{address[1]}"], cwd=root,
+                            stdout=subprocess.DEVNULL, env=dict(os.environ, **{AUTHKEY_VARIABLE: key.decode()}))
+
+
+def run_worker(address, key: bytes, name=None, connect_timeout=CONNECT_TIMEOUT, max_resident=2):
+    # Runs jobs for the coordinator at address (host, port) until it has none left or goes away. Returns
+    # the number of jobs run. key is the coordinator's, see authkey().
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    connection = _connect(address, key, connect_timeout)
+    lock = threading.Lock()  # The heartbeat thread sends on the same connection
+    branches = collections.OrderedDict()  # checksum -> Branch, the most recently used last
+    count = 0
+
+    def send(message):
+        with lock:
+            connection.send(message)
+
+    with connection:
+        try:
+            send(('hello', name))
+            while (message := connection.recv())[0] != 'stop':
+                _, job, checksum, function, arguments = message
+                branch = branches.pop(checksum, None) or _local_trace(connection, lock, checksum)
+                branches[checksum] = branch
+                while len(branches) > max_resident:
+                    branches.popitem(last=False)
+
+                stop = threading.Event()
+                heartbeat = threading.Thread(target=_heartbeat, args=(send, stop), daemon=True)
+                heartbeat.start()
+                try:
+                    reply = ('result', job, function(branch, *arguments, None))
+                    count += 1
+                except Exception as error:
+                    traceback.print_exc()  # The coordinator only gets the error itself
+                    reply = ('error', job, f"{type(error).__name__}: {error}")
+                finally:
+                    stop.set()
+                    heartbeat.join()
+                send(reply)
+        except (EOFError, OSError):
+            pass  # The coordinator is done or gone
+    return count
+
+
+def _connect(address, key, timeout):
+    # Retries while the coordinator is not listening yet
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return Client(address, authkey=key)
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(POLL_INTERVAL)
+
+
+def _heartbeat(send, stop):
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            send(('heartbeat',))
+        except OSError:
+            return
+
+
+def _stored_checksum(path):
+    try:
+        with open(path, 'rb') as file:
+            return read_header(file.read(HEADER_SIZE), path).checksum
+    except (OSError, ValueError):
+        return None
+
+
+def _local_trace(connection, lock, checksum):
+    # The trace from the local store, fetched from the coordinator the first time
+    path = os.path.join(storeFolder, checksum + TRACE_EXTENSION)
+    if _stored_checksum(path) != checksum:
+        with lock:
+            connection.send(('fetch', checksum))
+        with atomic_write(path) as file:
+            while block := connection.recv_bytes():
+                file.write(block)
+        if _stored_checksum(path) != checksum:
+            raise ValueError(f"the coordinator sent a trace that does not match checksum {checksum}")
+    return Branch(path, progress_toggle=False)
@@ -0,0 +1,296 @@
+import functools
+import json
+import marshal
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from src.utils.files import atomic_write
+
+profileFolder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Data', 'profiles'))
+
+MEMORY_SAMPLE_INTERVAL = 0.05  # Seconds between two RSS samples, and two entries of the memory timeline
+PHASE_FILE = '<phase>'         # File name of the phase entries in the pstats dump
+
+# Opt-in instrumentation of the hot paths. While disabled, phase() hands out one shared no-op context manager
+# and active() is None, so instrumented code pays one function call per chunk of branches. enable() starts
+# a Recorder that collects, per phase, the calls, wall and CPU time (with the time spent in nested phases
+# taken out as self time) and the peak RSS sampled when it ended; counters and gauges per predictor; and a
+# sampled memory timeline. RSS is read at most once per MEMORY_SAMPLE_INTERVAL, or when a phase that ran
+# for longer than that ends; other phases are charged the latest sample. Phases nest per thread, and with
+# profile=True every thread that enters a phase also runs cProfile while it is inside one. psutil, cProfile
+# and pstats are only imported when recording.
+
+_NO_PHASE = nullcontext()
+_recorder = None
+
+
+class Phase:
+    __slots__ = ('recorder', 'name', 'wall', 'cpu', 'children_wall', 'children_cpu')
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        stack = self.recorder.stack()
+        if not stack:
+            self.recorder.start_profiler()
+        stack.append(self)
+        self.children_wall = 0.0
+        self.children_cpu = 0.0
+        self.cpu = time.thread_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        stack = self.recorder.stack()
+        stack.pop()
+
+        parent = stack[-1] if stack else None
+        if parent is not None:
+            parent.children_wall += wall
+            parent.children_cpu += cpu
+        self.recorder.add_phase(self.name, parent.name if parent else None, wall, cpu,
+                                wall - self.children_wall, cpu - self.children_cpu)
+        if parent is None:
+            self.recorder.stop_profiler()
+
+
+class Recorder:
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        import psutil
+
+        self.process = psutil.Process()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+        # phase name -> [calls, wall, cpu, self wall, self cpu, peak rss, {parent: [calls, wall]}]
+        self.phases = {}
+        self.counters = {}
+        self.gauges = {}
+        self.memory = {}
+        self.rss = 0
+        self.last_sample = float('-inf')
+        self.profilers = []
+        self.profile_stats = []
+
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def start_profiler(self):
+        if not self.profile:
+            return
+        profiler = getattr(self.local, 'profiler', None)
+        if profiler is None:
+            import cProfile
+
+            profiler = self.local.profiler = cProfile.Profile()
+            with self.lock:
+                self.profilers.append(profiler)
+        profiler.enable()
+
+    def stop_profiler(self):
+        profiler = getattr(self.local, 'profiler', None)
+        if profiler is not None:
+            profiler.disable()
+
+    def add_phase(self, name, parent, wall, cpu, self_wall, self_cpu):
+        # Reading RSS is a system call, far more than the rest of a phase exit
+        sampled = wall >= MEMORY_SAMPLE_INTERVAL or time.perf_counter() - self.last_sample >= MEMORY_SAMPLE_INTERVAL
+        rss = self.process.memory_info().rss if sampled else self.rss
+
+        with self.lock:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = [0, 0.0, 0.0, 0.0, 0.0, 0, {}]
+            phase[0] += 1
+            phase[1] += wall
+            phase[2] += cpu
+            phase[3] += self_wall
+            phase[4] += self_cpu
+            phase[5] = max(phase[5], rss)
+            if parent is not None:
+                caller = phase[6].setdefault(parent, [0, 0.0])
+                caller[0] += 1
+                caller[1] += wall
+
+            if sampled:
+                self.memory.setdefault(os.getpid(), []).append((time.time(), rss))
+                self.rss = rss
+                self.last_sample = time.perf_counter()
+
+    def count(self, scope, values):
+        with self.lock:
+            counters = self.counters.setdefault(scope, {})
+            for name, value in values.items():
+                counters[name] = counters.get(name, 0) + value
+
+    def gauge(self, scope, values):
+        # Keeps the latest and the highest value of every gauge
+        with self.lock:
+            gauges = self.gauges.setdefault(scope, {})
+            for name, value in values.items():
+                gauges[name] = value
+                gauges[f'peak_{name}'] = max(gauges.get(f'peak_{name}', value), value)
+
+    def snapshot(self):
+        # Everything recorded so far as plain data, which is what a worker process sends back with its result
+        import pstats
+
+        with self.lock:
+            return {
+                'phases': {name: phase[:6] + [{parent: list(caller) for parent, caller in phase[6].items()}]
+                           for name, phase in self.phases.items()},
+                'counters': {scope: dict(counters) for scope, counters in self.counters.items()},
+                'gauges': {scope: dict(gauges) for scope, gauges in self.gauges.items()},
+                'memory': {pid: list(samples) for pid, samples in self.memory.items()},
+                'profile_stats': self.profile_stats + [pstats.Stats(profiler).stats for profiler in self.profilers
+                                                       if profiler.getstats()],
+            }
+
+    def merge(self, snapshot):
+        with self.lock:
+            for name, (calls, wall, cpu, self_wall, self_cpu, rss, callers) in snapshot['phases'].items():
+                phase = self.phases.get(name)
+                if phase is None:
+                    phase = self.phases[name] = [0, 0.0, 0.0, 0.0, 0.0, 0, {}]
+                for index, value in enumerate((calls, wall, cpu, self_wall, self_cpu)):
+                    phase[index] += value
+                phase[5] = max(phase[5], rss)
+                for parent, (caller_calls, caller_wall) in callers.items():
+                    caller = phase[6].setdefault(parent, [0, 0.0])
+                    caller[0] += caller_calls
+                    caller[1] += caller_wall
+
+            for scope, counters in snapshot['counters'].items():
+                merged = self.counters.setdefault(scope, {})
+                for name, value in counters.items():
+                    merged[name] = merged.get(name, 0) + value
+            for scope, gauges in snapshot['gauges'].items():
+                merged = self.gauges.setdefault(scope, {})
+                for name, value in gauges.items():
+                    merged[name] = max(merged[name], value) if name.startswith('peak_') and name in merged else value
+            for pid, samples in snapshot['memory'].items():
+                self.memory.setdefault(pid, []).extend(samples)
+            self.profile_stats.extend(snapshot['profile_stats'])
+
+    def report(self):
+        snapshot = self.snapshot()
+        return {
+            'meta': {
+                'started_at': self.started_at,
+                'wall_time': time.perf_counter() - self.started,
+                'pid': os.getpid(),
+                'python': platform.python_version(),
+                'profiled': self.profile,
+            },
+            'phases': {
+                name: {'calls': calls, 'wall': wall, 'cpu': cpu, 'self_wall': self_wall, 'self_cpu': self_cpu,
+                       'peak_rss_mb': rss / 2 ** 20,
+                       'callers': {parent: {'calls': caller[0], 'wall': caller[1]} for parent, caller in callers.items()}}
+                for name, (calls, wall, cpu, self_wall, self_cpu, rss, callers) in sorted(snapshot['phases'].items())
+            },
+            'counters': snapshot['counters'],
+            'gauges': snapshot['gauges'],
+            'memory': {str(pid): [[round(at - self.started_at, 4), rss / 2 ** 20] for at, rss in sorted(samples)]
+                       for pid, samples in snapshot['memory'].items()},
+        }
+
+    def pstats_entries(self):
+        # Phases as pstats entries: (file, line, name) -> (calls, calls, self time, total time, callers)
+        entries = {}
+        with self.lock:
+            for name, phase in self.phases.items():
+                callers = {(PHASE_FILE, 0, parent): (calls, calls, wall, wall) for parent, (calls, wall) in phase[6].items()}
+                entries[(PHASE_FILE, 0, name)] = (phase[0], phase[0], phase[3], phase[1], callers)
+        return entries
+
+    def export_json(self, path):
+        with atomic_write(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+        return path
+
+    def export_pstats(self, path):
+        # Loadable with pstats.Stats(path) or snakeviz: the phases, plus every cProfile run with profile=True
+        import pstats
+
+        stats = pstats.Stats()
+        for entries in [self.pstats_entries()] + self.snapshot()['profile_stats']:
+            part = pstats.Stats()
+            part.stats = entries
+            stats.add(part)
+        with atomic_write(path) as file:
+            marshal.dump(stats.stats, file)
+        return path
+
+
+def enable(profile=False) -> Recorder:
+    global _recorder
+    _recorder = Recorder(profile)
+    return _recorder
+
+
+def disable():
+    # Stops recording and returns the recorder, which can still be exported
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+
+def active():
+    return _recorder
+
+
+def phase(name: str):
+    recorder = _recorder
+    return _NO_PHASE if recorder is None else Phase(recorder, name)
+
+
+def timed(name: str):
+    # Decorator recording every call of a function as the phase name
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def collect(profile, function, *arguments):
+    # Runs a job in a worker process with its own recorder and returns (result, snapshot) for merge()
+    global _recorder
+    _recorder = Recorder(profile)
+    try:
+        result = function(*arguments)
+        return result, _recorder.snapshot()
+    finally:
+        _recorder = None
+
+
+def merge(snapshot):
+    if _recorder is not None:
+        _recorder.merge(snapshot)
+
+
+@contextmanager
+def recording(stem: str, profile=False):
+    # Records everything run inside the block and writes <stem>.json and <stem>.prof when it ends
+    recorder = enable(profile)
+    try:
+        yield recorder
+    finally:
+        disable()
+        recorder.export_json(stem + '.json')
+        recorder.export_pstats(stem + '.prof')
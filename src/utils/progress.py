@@ -0,0 +1,102 @@
+import mmap
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+BOARD_SLOTS = 1024      # Counters per shared block, a new block is added when they are all in use
+REFRESH_INTERVAL = 0.1  # Seconds between two reads of the counters by the reporter thread
+
+# Progress of concurrent jobs without a shared lock: every job advances its own int64 slot in a small
+# memory-mapped file, which a worker process maps by path just like a thread of this process does. Only the
+# job writes to its slot, so advancing a counter is a plain add. One reporter thread sums the slots of each
+# rich task at a fixed rate and is the only thread that updates the Progress display.
+
+_blocks = {}  # path -> counts, the blocks mapped by this process
+
+
+def _map_block(path):
+    counts = _blocks.get(path)
+    if counts is None:
+        with open(path, 'r+b') as file:
+            counts = _blocks[path] = np.frombuffer(mmap.mmap(file.fileno(), 8 * BOARD_SLOTS), dtype=np.int64)
+    return counts
+
+
+class ProgressCounter:
+    __slots__ = ('path', 'slot', 'counts')
+
+    def __init__(self, path, slot):
+        self.path = path
+        self.slot = slot
+        self.counts = _map_block(path)
+
+    def advance(self, units):
+        self.counts[self.slot] += units
+
+    def __reduce__(self):
+        return ProgressCounter, (self.path, self.slot)
+
+
+class ProgressBoard:
+    # Hands out one counter per job and task, and reports their sums to a rich Progress while it is running
+    def __init__(self, progress, interval: float = REFRESH_INTERVAL):
+        self.progress = progress
+        self.interval = interval
+        self.folder = tempfile.mkdtemp(prefix='bp-progress-')
+        self.paths = []
+        self.used = BOARD_SLOTS
+        self.slots = {}  # task -> {block path: [slots]}
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def counter(self, task) -> ProgressCounter:
+        with self.lock:
+            if self.used == BOARD_SLOTS:
+                path = os.path.join(self.folder, f'{len(self.paths)}.counts')
+                with open(path, 'wb') as file:
+                    file.truncate(8 * BOARD_SLOTS)
+                self.paths.append(path)
+                self.used = 0
+            counter = ProgressCounter(self.paths[-1], self.used)
+            self.slots.setdefault(task, {}).setdefault(counter.path, []).append(counter.slot)
+            self.used += 1
+        return counter
+
+    def refresh(self):
+        with self.lock:
+            totals = {task: sum(int(_blocks[path][slots].sum()) for path, slots in blocks.items())
+                      for task, blocks in self.slots.items()}
+        for task, completed in totals.items():
+            if task in self.progress.task_ids:
+                self.progress.update(task, completed=completed)
+
+    def _report(self):
+        while not self._stop.wait(self.interval):
+            self.refresh()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._report, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.refresh()
+        for path in self.paths:
+            del _blocks[path]
+            os.remove(path)
+        os.rmdir(self.folder)
+
+
+def reporter(counter: ProgressCounter = None, progress=None, task=None):
+    # The function a job advances its progress with: its counter, else the rich task it was given, else None
+    # for a silent run, which then skips all progress bookkeeping
+    if counter is not None:
+        return counter.advance
+    if progress is not None and task is not None:
+        return lambda units: progress.update(task, advance=units)
+    return None
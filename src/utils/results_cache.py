@@ -0,0 +1,136 @@
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from src.models.WindowedMetrics import WindowedMetrics
+from src.utils.files import atomic_write
+
+cacheFolder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Data', 'cache'))
+
+RESULT_CACHE_FILE = 'results.json'
+RESULT_CACHE_LIMIT = 50000  # Entries kept on disk, the least recently used ones are evicted beyond it
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_MIN_LENGTH = 1024  # Journal lines always allowed before compaction, however few entries the file has
+WINDOW_CACHE_FOLDER = os.path.join(cacheFolder, 'windows')
+
+
+def result_key(checksum: str, predictor_class, size: int) -> str:
+    # Content addressed: the trace is identified by the checksum of its text, not by its name, and the
+    # predictor by its class and implementation version
+    return f"{checksum}:{predictor_class.__name__}:{predictor_class.implementation_version}:{size}"
+
+
+class ResultCache:
+    # Memoized (pred_accuracy, total_accuracy, prediction_percentage) per result_key. The entries are stored
+    # as one JSON file, and what changed since is appended to a journal beside it, one JSON line per entry,
+    # so a save writes only the entries a sweep used or added. The journal is folded back into the file
+    # once it holds more lines than the file has entries, or when entries have to be evicted.
+    def __init__(self, path: str = os.path.join(cacheFolder, RESULT_CACHE_FILE), limit: int = RESULT_CACHE_LIMIT):
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.limit = limit
+        self.entries = {}
+        self.clock = 0
+        self.changed = {}  # Entries to write on the next save
+        self.journal_length = 0
+
+        try:
+            with open(path, 'r') as file:
+                stored = json.load(file)
+            self.entries = stored['entries']
+            self.clock = stored['clock']
+        except (OSError, ValueError, KeyError):
+            pass  # A missing or damaged cache starts empty
+
+        try:
+            with open(self.journal_path, 'r') as file:
+                for line in file:
+                    try:
+                        key, entry = json.loads(line)
+                        self.clock = max(self.clock, entry['used'])
+                    except (ValueError, TypeError, KeyError):
+                        continue  # A line cut short by an interrupted save
+                    self.entries[key] = entry
+                    self.journal_length += 1
+        except OSError:
+            pass
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        self.clock += 1
+        entry['used'] = self.clock
+        self.changed[key] = entry
+        return tuple(entry['result'])
+
+    def put(self, key: str, result):
+        self.clock += 1
+        self.entries[key] = self.changed[key] = {'result': list(result), 'used': self.clock}
+
+    def evict(self):
+        if len(self.entries) > self.limit:
+            ranked = sorted(self.entries, key=lambda key: self.entries[key]['used'])
+            for key in ranked[:len(self.entries) - self.limit]:
+                for path in glob.glob(windows_cache_path(key, '*')):
+                    os.remove(path)  # The windows of an evicted result go with it
+            self.entries = {key: self.entries[key] for key in ranked[len(self.entries) - self.limit:]}
+
+    def save(self):
+        if not self.changed:
+            return
+
+        if len(self.entries) > self.limit or self.journal_length + len(self.changed) > max(len(self.entries),
+                                                                                           JOURNAL_MIN_LENGTH):
+            self.compact()
+        else:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            lines = ''.join(json.dumps([key, entry]) + '\n' for key, entry in self.changed.items())
+            with open(self.journal_path, 'a') as file:
+                file.write(lines)
+            self.journal_length += len(self.changed)
+        self.changed = {}
+
+    def compact(self):
+        # Rewrites the file with every entry and starts an empty journal
+        self.evict()
+        with atomic_write(self.path, 'w') as file:
+            json.dump({'clock': self.clock, 'entries': self.entries}, file)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.journal_length = 0
+
+
+# The WindowedMetrics of a cached result are kept beside it, one file per result and window size holding the
+# counts per window, so that a cached cell needs no simulation for its windows either; the half life is
+# applied when they are read back.
+
+def windows_cache_path(key: str, window) -> str:
+    return os.path.join(WINDOW_CACHE_FOLDER, f"{hashlib.sha256(key.encode()).hexdigest()}.{window}.npz")
+
+
+def cached_windows(key: str, window: int, half_life: float = None):
+    # The whole trace WindowedMetrics stored for key, or None
+    try:
+        with np.load(windows_cache_path(key, window)) as stored:
+            snapshot = {name: stored[name] for name in ('window', 'first', 'position', 'counts')}
+    except (OSError, ValueError, KeyError):
+        return None  # Missing or damaged
+
+    metrics = WindowedMetrics(window, half_life)
+    if not metrics.restore(snapshot):
+        return None
+    metrics.finish()
+    return metrics
+
+
+def cache_windows(key: str, metrics: WindowedMetrics):
+    with atomic_write(windows_cache_path(key, metrics.window)) as file:
+        np.savez(file, **metrics.snapshot())
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import time
+
+resultsDb = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Data', 'results.sqlite3'))
+
+# Every run keeps its own rows, queries read the latest run of each (trace, predictor, size) cell.
+# The primary key doubles as the (trace, predictor, size, run) index used to find that run.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    wall_time REAL,
+    branches INTEGER,
+    branches_per_second REAL,
+    source TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    trace TEXT NOT NULL,
+    predictor TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    run INTEGER NOT NULL REFERENCES runs (id),
+    pred_accuracy REAL NOT NULL,
+    total_accuracy REAL NOT NULL,
+    prediction_percentage REAL NOT NULL,
+    PRIMARY KEY (trace, predictor, size, run)
+);
+CREATE INDEX IF NOT EXISTS results_by_predictor ON results (predictor, size);
+'''
+
+LATEST_RESULTS = '''
+SELECT trace, predictor, size, pred_accuracy, total_accuracy, prediction_percentage
+FROM results AS result
+WHERE run = (SELECT MAX(run) FROM results
+             WHERE trace = result.trace AND predictor = result.predictor AND size = result.size)
+'''
+
+
+def open_store(path: str = resultsDb) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def is_empty(connection: sqlite3.Connection) -> bool:
+    return connection.execute('SELECT 1 FROM runs LIMIT 1').fetchone() is None
+
+
+def add_run(connection: sqlite3.Connection, started_at: float = None, wall_time: float = None,
+            branches: int = None, source: str = None) -> int:
+    # Run metadata; branches counts every simulated branch, summed over predictors and sizes
+    branches_per_second = branches / wall_time if branches and wall_time else None
+    cursor = connection.execute(
+        'INSERT INTO runs (started_at, wall_time, branches, branches_per_second, source) VALUES (?, ?, ?, ?, ?)',
+        (time.time() if started_at is None else started_at, wall_time, branches, branches_per_second, source))
+    connection.commit()
+    return cursor.lastrowid
+
+
+def upsert_results(connection: sqlite3.Connection, run: int, rows):
+    # rows of (trace, predictor, size, pred_accuracy, total_accuracy, prediction_percentage); the cost
+    # only depends on the number of rows written
+    connection.executemany('''
+        INSERT INTO results (trace, predictor, size, run, pred_accuracy, total_accuracy, prediction_percentage)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (trace, predictor, size, run) DO UPDATE SET
+            pred_accuracy = excluded.pred_accuracy,
+            total_accuracy = excluded.total_accuracy,
+            prediction_percentage = excluded.prediction_percentage
+    ''', [(trace, predictor, size, run, *accuracies) for trace, predictor, size, *accuracies in rows])
+    connection.commit()
+
+
+def query_results(connection: sqlite3.Connection, trace: str = None, predictor: str = None, size: int = None):
+    # Latest result of every cell matching the given filters, ordered by trace, predictor and size
+    conditions = []
+    parameters = []
+    for column, value in (('trace', trace), ('predictor', predictor), ('size', size)):
+        if value is not None:
+            conditions.append(f'{column} = ?')
+            parameters.append(value)
+
+    query = LATEST_RESULTS + ''.join(f' AND {condition}' for condition in conditions)
+    return connection.execute(query + ' ORDER BY trace, predictor, size', parameters).fetchall()
+
+
+def stored_predictors(connection: sqlite3.Connection):
+    return [row[0] for row in connection.execute('SELECT DISTINCT predictor FROM results ORDER BY predictor')]
+
+
+def stored_traces(connection: sqlite3.Connection):
+    return [row[0] for row in connection.execute('SELECT DISTINCT trace FROM results ORDER BY trace')]
@@ -0,0 +1,136 @@
+import copy
+import hashlib
+
+from src.models.WindowedMetrics import WindowedMetrics
+from src.utils.instrumentation import timed
+
+SHARD_WARMUP = 1 << 16         # Branches simulated before a shard, without being counted, to warm its table up
+SHARD_BLOCK = 1 << 14          # Granularity at which a shard records its state for reconciliation
+SHARD_REPAIR_WINDOW = 1 << 20  # Branches at the start of a shard that reconciliation may re-simulate
+
+# A trace is split into consecutive shards simulated independently, each starting from a table warmed up
+# on the branches just before it. Shards record their counts and a digest of their table every SHARD_BLOCK
+# branches over their first SHARD_REPAIR_WINDOW branches. Reconciliation then walks the shards in order
+# with the true state at each boundary (the final state of the previous, exact, shard): when it matches
+# the warmed-up state the shard is exact as it is, otherwise the shard is re-simulated from the true state
+# block by block until both tables agree, from where on the shard's own counts are exact. A shard that
+# does not converge within the window leaves a bounded error: at most one branch counted differently per
+# branch that was not re-simulated. Windowed metrics follow the counts: a shard keeps the windows of every
+# recorded block apart, so that the blocks reconciliation re-simulates can be swapped for its own.
+
+
+def shard_ranges(count: int, shards: int):
+    shards = max(1, min(shards, count))
+    bounds = [count * index // shards for index in range(shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def state_digest(predictor) -> bytes:
+    return hashlib.sha256(predictor.canonical_state()).digest()
+
+
+@timed('shard')
+def run_shard(predictor_class, size, branch, start, stop, warmup=SHARD_WARMUP, block=SHARD_BLOCK,
+              window=SHARD_REPAIR_WINDOW, metrics_window=None):
+    # With metrics_window the result also holds the shard's WindowedMetrics per window of that many
+    # branches: one per recorded block, then one for the rest of the shard
+    predictor = predictor_class(size)
+    for ids, taken, _ in branch.iter_id_chunks(max(0, start - warmup), start):
+        predictor.simulate(ids, taken, branch.static_addresses)
+
+    # records hold (position, predictions, correct predictions, correct, table digest) at the start of the
+    # shard and after every block of its window
+    totals = [0, 0, 0]
+    records = [(start, 0, 0, 0, state_digest(predictor))]
+    recorded_stop = min(stop, start + window)
+
+    blocks = []
+
+    for ids, taken, _ in branch.iter_id_chunks(start, recorded_stop, block):
+        metrics = None if metrics_window is None else WindowedMetrics(metrics_window, None, len(ids), records[-1][0])
+        _, predictions, correct_predictions, correct = predictor.simulate_chunk(ids, taken, branch.static_addresses,
+                                                                                metrics=metrics)
+        totals = [totals[0] + predictions, totals[1] + correct_predictions, totals[2] + correct]
+        records.append((records[-1][0] + len(ids), *totals, state_digest(predictor)))
+        blocks.append(metrics)
+
+    rest = None if metrics_window is None else WindowedMetrics(metrics_window, None, stop - recorded_stop, recorded_stop)
+    for ids, taken, _ in branch.iter_id_chunks(recorded_stop, stop):
+        _, predictions, correct_predictions, correct = predictor.simulate_chunk(ids, taken, branch.static_addresses,
+                                                                                metrics=rest)
+        totals = [totals[0] + predictions, totals[1] + correct_predictions, totals[2] + correct]
+
+    return {'start': start, 'stop': stop, 'totals': tuple(totals), 'records': records,
+            'state': predictor.__getstate__(), 'metrics': None if metrics_window is None else (blocks, rest)}
+
+
+@timed('reconcile')
+def reconcile_shards(predictor_class, size, branch, shards, metrics: WindowedMetrics = None):
+    # Combines the shard results, in trace order, into (predictions, correct predictions, correct) and a
+    # report with whether the result is exact, the divergence (|difference| in correct branches between
+    # the warmed-up shards and the true state over the re-simulated blocks) and the error bound in branches.
+    # metrics, for shards run with a metrics_window, collects the windows of the whole trace the same way.
+    totals = [0, 0, 0]
+    true_state = None
+    divergence = 0
+    error_bound = 0
+    repaired = 0
+
+    for shard in shards:
+        start, stop, records = shard['start'], shard['stop'], shard['records']
+        shard_totals = shard['totals']
+        repair = None
+        kept = 0  # Recorded blocks before this one were re-simulated, the shard's own counts are kept after
+
+        if start == 0:
+            counts = shard_totals
+            true_state = shard['state']
+        elif true_state is None:
+            # The state before this shard is not known exactly, so nothing can be said about the shard
+            counts = shard_totals
+            error_bound += stop - start
+        else:
+            predictor = predictor_class(size)
+            predictor.__setstate__(copy.deepcopy(true_state))
+            counts = shard_totals
+            true_state = shard['state']
+
+            if state_digest(predictor) != records[0][4]:
+                fixed = [0, 0, 0]
+                position = start
+                converged = False
+                if metrics is not None:
+                    repair = WindowedMetrics(metrics.window, None, records[-1][0] - start, start)
+
+                for kept, record in enumerate(records[1:], 1):
+                    for ids, taken, _ in branch.iter_id_chunks(position, record[0]):
+                        _, predictions, correct_predictions, correct = predictor.simulate_chunk(
+                            ids, taken, branch.static_addresses, metrics=repair)
+                        fixed = [fixed[0] + predictions, fixed[1] + correct_predictions, fixed[2] + correct]
+                    position = record[0]
+
+                    if state_digest(predictor) == record[4]:
+                        converged = True
+                        break
+
+                divergence += abs(fixed[2] - record[3])
+                repaired += position - start
+                # From the converged block on the shard simulated what the true state would have
+                counts = [fixed[i] + shard_totals[i] - record[i + 1] for i in range(3)]
+
+                if position == stop:
+                    true_state = predictor.__getstate__()
+                elif not converged:
+                    error_bound += stop - position
+                    true_state = None
+
+        totals = [totals[i] + counts[i] for i in range(3)]
+        if metrics is not None:
+            blocks, rest = shard['metrics']
+            for part in ([repair] if repair is not None else []) + blocks[kept:] + [rest]:
+                metrics.merge(part)
+
+    if metrics is not None:
+        metrics.finish()
+    return tuple(totals), {'shards': len(shards), 'exact': error_bound == 0, 'divergence': divergence,
+                           'error_bound': error_bound, 'repaired': repaired}
@@ -0,0 +1,54 @@
+import numpy as np
+
+from src.utils.files import atomic_write
+
+GENERATE_CHUNK_SIZE = 1 << 20  # Dynamic branches generated and written per step
+ADDRESS_BASE = 3000000000      # Addresses look like the decimal ones of the gcc traces
+
+
+def generate_trace(filePath: str, length: int, static_branches: int = 4096, bias: float = 0.7,
+                   loop_fraction: float = 0.2, loop_length: int = 8, locality: float = 1.1, seed: int = 0,
+                   on_progress=None) -> str:
+    # Writes a deterministic synthetic trace in the text format of Data/txt, streaming it chunk by chunk so
+    # any length fits in memory. For a given seed and parameters the output is identical on every run.
+    #   static_branches  number of distinct branch addresses
+    #   bias             mean probability that a biased branch is taken (each branch draws its own)
+    #   loop_fraction    share of static branches that are loop branches: taken loop_length - 1 times, then not
+    #   locality         Zipf exponent of how often each static branch executes, 0 for uniform
+    # on_progress is called with the number of branches written after every chunk.
+    rng = np.random.default_rng(seed)
+
+    addresses = ADDRESS_BASE + 4 * rng.choice(1 << 24, size=static_branches, replace=False)
+    taken_probability = rng.beta(max(bias, 1e-3) * 4, max(1 - bias, 1e-3) * 4, size=static_branches)
+    is_loop = rng.random(static_branches) < loop_fraction
+    weights = 1.0 / np.arange(1, static_branches + 1) ** locality
+    rng.shuffle(weights)
+    cumulative = np.cumsum(weights / weights.sum())
+
+    # Line i * 2 + taken of the table is the full text line of static branch i with that outcome
+    lines = [f"{address} {outcome}\n".encode('ascii') for address in addresses.tolist() for outcome in 'NT']
+    occurrences = np.zeros(static_branches, dtype=np.int64)
+
+    with atomic_write(filePath) as file:
+        for start in range(0, length, GENERATE_CHUNK_SIZE):
+            count = min(GENERATE_CHUNK_SIZE, length - start)
+            ids = np.minimum(np.searchsorted(cumulative, rng.random(count)), static_branches - 1)
+            taken = rng.random(count) < taken_probability[ids]
+
+            # Loop branches follow their period across chunks: number every occurrence of each branch
+            order = np.argsort(ids, kind='stable')
+            sorted_ids = ids[order]
+            group_start = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+            rank = np.arange(count) - np.repeat(group_start, np.diff(np.r_[group_start, count]))
+            occurrence = np.empty(count, dtype=np.int64)
+            occurrence[order] = occurrences[sorted_ids] + rank
+            occurrences += np.bincount(ids, minlength=static_branches)
+
+            loop = is_loop[ids]
+            taken[loop] = (occurrence[loop] + 1) % loop_length != 0
+
+            file.write(b''.join(map(lines.__getitem__, (ids * 2 + taken).tolist())))
+            if on_progress:
+                on_progress(count)
+
+    return filePath
@@ -0,0 +1,432 @@
+import bz2
+import gzip
+import hashlib
+import json
+import lzma
+import mmap
+import os
+import queue
+import struct
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+from src.utils.files import atomic_write
+from src.utils.instrumentation import timed
+
+binFolder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Data', 'bin'))
+
+# Binary traces are cached per source path, named after it and a digest of its absolute path, so traces
+# of the same name in different folders never share a cache file. A cached trace is current while its
+# header records the digest, size and mtime of its source.
+#
+# Binary trace layout (little endian):
+#   header     HEADER_SIZE bytes, see HEADER_FORMAT
+#   ids        count * uint32, dense static branch ID of every dynamic branch
+#   outcomes   ceil(count / 8) bytes, bit i set when branch i was taken (LSB first)
+#   addresses  static_count * uint64 at the next 8 byte boundary, ID -> address table
+# Static IDs are handed out in order of first appearance in the trace.
+TRACE_MAGIC = b'BPTRACE\0'
+TRACE_VERSION = 3
+TRACE_EXTENSION = '.bpt'
+HEADER_FORMAT = '<8sHH4sQQQQQ32s32s'
+HEADER_SIZE = 128
+
+CHECKSUM_FILE = 'checksums.json'  # Checksums of the traces streamed without a binary conversion
+
+READ_CHUNK_SIZE = 16 * 1024 * 1024
+PREFETCH_DEPTH = 4
+_HEX_LETTERS = [bytes([letter]) for letter in b'abcdefABCDEFxX']  # Searched one by one, much faster than a regex
+
+COMPRESSED_EXTENSIONS = ('.gz', '.xz', '.bz2', '.zst')
+TRACE_SUFFIXES = ('.txt',) + COMPRESSED_EXTENSIONS
+
+
+class TraceHeader(NamedTuple):
+    version: int
+    address_format: str
+    count: int
+    static_count: int
+    taken: int
+    source_size: int
+    source_mtime: int
+    checksum: str
+    source_digest: str
+
+
+class TraceFile:
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.header = read_header(self._mmap, path)
+        self.address_format = self.header.address_format
+        self.checksum = self.header.checksum
+
+        count = self.header.count
+        outcomes_offset = HEADER_SIZE + 4 * count
+        table_offset = _align8(outcomes_offset + (count + 7) // 8)
+
+        self.ids = np.frombuffer(self._mmap, dtype='<u4', count=count, offset=HEADER_SIZE)
+        self.outcomes = np.frombuffer(self._mmap, dtype=np.uint8, count=(count + 7) // 8, offset=outcomes_offset)
+        self.static_addresses = np.frombuffer(self._mmap, dtype='<u8', count=self.header.static_count,
+                                              offset=table_offset)
+
+    def __len__(self):
+        return self.header.count
+
+    @property
+    def addresses(self) -> np.ndarray:
+        return self.static_addresses[self.ids]
+
+    def close(self):
+        self.ids = None
+        self.outcomes = None
+        self.static_addresses = None
+        self._mmap.close()
+
+
+def _align8(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def read_header(buffer, path: str) -> TraceHeader:
+    if len(buffer) < HEADER_SIZE:
+        raise ValueError(f"{path} is not a binary trace file")
+
+    magic, version, _, address_format, count, static_count, taken, source_size, source_mtime, checksum, source = \
+        struct.unpack_from(HEADER_FORMAT, buffer)
+    if magic != TRACE_MAGIC:
+        raise ValueError(f"{path} is not a binary trace file")
+    if version != TRACE_VERSION:
+        raise ValueError(f"{path} has trace version {version}, expected {TRACE_VERSION}")
+
+    return TraceHeader(version, address_format.rstrip(b'\0').decode('ascii'), count, static_count, taken,
+                       source_size, source_mtime, checksum.hex(), source.hex())
+
+
+def detect_address_format(text: bytes) -> str:
+    # Format spec used to print addresses back the way the source trace wrote them, from lines of the trace
+    # (outcomes are T or N, never hex digits). Lines of decimal digits only are 'd', though they could also
+    # be hexadecimal addresses that happen to have no letter.
+    if b'0x' in text or b'0X' in text:
+        return '#x'
+    return 'x' if any(letter in text for letter in _HEX_LETTERS) else 'd'
+
+
+def parse_addresses(addresses, address_format: str) -> np.ndarray:
+    if address_format == 'd':
+        return np.array(addresses, dtype=np.bytes_).astype(np.uint64)
+    return np.fromiter((int(address, 16) for address in addresses), dtype=np.uint64, count=len(addresses))
+
+
+def is_trace_file(name: str) -> bool:
+    return name.endswith(TRACE_SUFFIXES)
+
+
+class PrefetchReader:
+    # Decodes a compressed stream on a background thread so decompression overlaps with parsing
+    # (the gzip, lzma, bz2 and zstd decoders release the GIL). read() hands out whole decoded blocks
+    # and tell() reports the position reached in the compressed file.
+    def __init__(self, decoder, raw, chunk_size: int, depth: int = PREFETCH_DEPTH):
+        self._decoder = decoder
+        self._raw = raw
+        self._chunk_size = chunk_size
+        self._blocks = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._position = 0
+        self._finished = False
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _fill(self):
+        try:
+            while True:
+                block = self._decoder.read(self._chunk_size)
+                if not self._put((block, self._raw.tell())) or not block:
+                    break
+        except BaseException as error:
+            self._put((error, None))
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read(self, size: int = -1) -> bytes:
+        if self._finished:
+            return b''
+
+        block, position = self._blocks.get()
+        if isinstance(block, BaseException):
+            self._finished = True
+            raise block
+        if not block:
+            self._finished = True
+        self._position = position
+        return block
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self._decoder.close()
+        self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_source(filePath: str, chunk_size: int = READ_CHUNK_SIZE):
+    # Opens a text trace for binary reading, decompressing .gz/.xz/.bz2/.zst traces on the fly
+    extension = os.path.splitext(filePath)[1]
+    if extension not in COMPRESSED_EXTENSIONS:
+        return open(filePath, 'rb')
+
+    raw = open(filePath, 'rb')
+    try:
+        if extension == '.gz':
+            decoder = gzip.GzipFile(fileobj=raw)
+        elif extension == '.xz':
+            decoder = lzma.LZMAFile(raw)
+        elif extension == '.bz2':
+            decoder = bz2.BZ2File(raw)
+        else:
+            decoder = _zstd_reader(raw)
+    except BaseException:
+        raw.close()
+        raise
+
+    return PrefetchReader(decoder, raw, chunk_size)
+
+
+def _zstd_reader(raw):
+    try:
+        from compression import zstd
+        return zstd.ZstdFile(raw)
+    except ImportError:
+        pass
+
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading .zst traces needs Python 3.14+ or the zstandard package") from None
+    return zstandard.ZstdDecompressor().stream_reader(raw, closefd=False)
+
+
+def parse_trace_chunks(file, checksum=None, chunk_size: int = READ_CHUNK_SIZE):
+    # Yields (address_format, addresses, taken, consumed) per chunk of whole lines read from a binary stream,
+    # consumed being the number of source file bytes read since the previous chunk (compressed bytes for
+    # a PrefetchReader). checksum is fed the decoded text. The address format is detected on every chunk:
+    # the first one with hex digits makes the trace hexadecimal, and a trace whose earlier chunks were
+    # read as decimal is rejected then, since those addresses were hexadecimal too.
+    address_format = None
+    lines = 0
+    remainder = b''
+    consumed = 0
+    position = file.tell()
+
+    while True:
+        chunk = file.read(chunk_size)
+        consumed += file.tell() - position
+        position = file.tell()
+
+        if chunk:
+            if checksum is not None:
+                checksum.update(chunk)
+            data = remainder + chunk
+            cut = data.rfind(b'\n') + 1
+            data, remainder = data[:cut], data[cut:]
+        else:
+            data, remainder = remainder, b''
+
+        tokens = data.split()
+        if tokens:
+            if len(tokens) % 2:
+                raise ValueError("Malformed trace: every line must hold an address and an outcome")
+            addresses = tokens[0::2]
+            chunk_format = detect_address_format(data)
+            if address_format is None:
+                address_format = chunk_format
+            elif address_format == 'd' and chunk_format != 'd':
+                raise ValueError(f"Ambiguous trace: the addresses of the first {lines} lines have decimal digits only "
+                                 f"and were read as decimal, but later ones are hexadecimal. Write hexadecimal "
+                                 f"addresses with a 0x prefix.")
+            lines += len(addresses)
+
+            yield (address_format,
+                   parse_addresses(addresses, address_format),
+                   np.array(tokens[1::2], dtype=np.bytes_) == b'T',
+                   consumed)
+            consumed = 0
+
+        if not chunk:
+            break
+
+
+def intern_addresses(addresses: np.ndarray, static_ids: dict) -> np.ndarray:
+    # Maps addresses to dense IDs, extending static_ids (address -> ID) in order of first appearance
+    unique, first, inverse = np.unique(addresses, return_index=True, return_inverse=True)
+    unique_ids = np.empty(len(unique), dtype=np.uint32)
+    unique_list = unique.tolist()
+
+    for position in np.argsort(first, kind='stable').tolist():
+        unique_ids[position] = static_ids.setdefault(unique_list[position], len(static_ids))
+
+    return unique_ids[inverse]
+
+
+@timed('load/convert')
+def convert_trace(source_path: str, target_path: str, on_progress=None) -> str:
+    stat = os.stat(source_path)
+    checksum = hashlib.sha256()
+    address_format = 'd'
+    count = 0
+    taken = 0
+    packed = bytearray()
+    carry = np.zeros(0, dtype=bool)
+    static_ids = {}
+
+    with atomic_write(target_path) as out, open_source(source_path) as source:
+        out.write(b'\0' * HEADER_SIZE)
+
+        for address_format, addresses, outcomes, consumed in parse_trace_chunks(source, checksum):
+            if on_progress:
+                on_progress(consumed)
+            out.write(intern_addresses(addresses, static_ids).astype('<u4', copy=False).tobytes())
+            count += len(addresses)
+            taken += int(np.count_nonzero(outcomes))
+
+            # Pack whole bytes only so chunks can be concatenated bit-exactly
+            outcomes = np.concatenate((carry, outcomes))
+            whole = len(outcomes) - len(outcomes) % 8
+            packed += np.packbits(outcomes[:whole], bitorder='little').tobytes()
+            carry = outcomes[whole:]
+
+        if len(carry):
+            packed += np.packbits(carry, bitorder='little').tobytes()
+        out.write(packed)
+
+        end = HEADER_SIZE + 4 * count + len(packed)
+        out.write(b'\0' * (_align8(end) - end))
+        out.write(np.fromiter(static_ids, dtype='<u8', count=len(static_ids)).tobytes())
+
+        out.seek(0)
+        out.write(struct.pack(HEADER_FORMAT, TRACE_MAGIC, TRACE_VERSION, 0, address_format.encode('ascii'),
+                              count, len(static_ids), taken, stat.st_size, stat.st_mtime_ns, checksum.digest(),
+                              bytes.fromhex(source_digest(source_path))))
+
+    return target_path
+
+
+def source_digest(source_path: str) -> str:
+    # SHA-256 of the absolute path of a source trace
+    return hashlib.sha256(os.path.abspath(source_path).encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+def trace_cache_path(source_path: str) -> str:
+    return os.path.join(binFolder, f"{os.path.basename(source_path)}.{source_digest(source_path)[:16]}{TRACE_EXTENSION}")
+
+
+def cached_header(source_path: str):
+    # Header of the binary conversion of a text trace, None while it is missing or out of date
+    cache_path = trace_cache_path(source_path)
+    if os.path.exists(cache_path):
+        stat = os.stat(source_path)
+        try:
+            with open(cache_path, 'rb') as file:
+                header = read_header(file.read(HEADER_SIZE), cache_path)
+            if (header.source_digest == source_digest(source_path) and header.source_size == stat.st_size
+                    and header.source_mtime == stat.st_mtime_ns):
+                return header
+        except ValueError:
+            pass
+    return None
+
+
+def ensure_trace(source_path: str, on_progress=None) -> str:
+    # Returns the cached binary conversion of a text trace, building it the first time it is used
+    cache_path = trace_cache_path(source_path)
+    if cached_header(source_path) is not None:
+        return cache_path
+
+    return convert_trace(source_path, cache_path, on_progress)
+
+
+def open_trace(filePath: str, on_progress=None) -> TraceFile:
+    # on_progress is called with the number of source bytes parsed while a conversion is running
+    if filePath.endswith(TRACE_EXTENSION):
+        return TraceFile(filePath)
+    return TraceFile(ensure_trace(filePath, on_progress))
+
+
+def trace_length(filePath: str) -> int:
+    path = filePath if filePath.endswith(TRACE_EXTENSION) else ensure_trace(filePath)
+    with open(path, 'rb') as file:
+        return read_header(file.read(HEADER_SIZE), path).count
+
+
+_checksum_lock = threading.Lock()
+
+
+def _source_identity(source_path: str, stat=None) -> list:
+    stat = stat or os.stat(source_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _stored_checksums(path: str) -> dict:
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def remember_checksum(source_path: str, checksum: str, stat=None):
+    # Records the checksum of a streamed source, valid while its size and mtime are those of stat
+    path = os.path.join(binFolder, CHECKSUM_FILE)
+    with _checksum_lock:
+        checksums = _stored_checksums(path)
+        checksums[source_digest(source_path)] = {'source': _source_identity(source_path, stat), 'checksum': checksum}
+        with atomic_write(path, 'w') as file:
+            json.dump(checksums, file)
+
+
+def known_checksum(filePath: str):
+    # The checksum of a trace when it is known without reading the trace: from a current binary conversion,
+    # or recorded by an earlier stream over the unchanged source. None otherwise.
+    if filePath.endswith(TRACE_EXTENSION):
+        with open(filePath, 'rb') as file:
+            return read_header(file.read(HEADER_SIZE), filePath).checksum
+
+    header = cached_header(filePath)
+    if header is not None:
+        return header.checksum
+
+    entry = _stored_checksums(os.path.join(binFolder, CHECKSUM_FILE)).get(source_digest(filePath))
+    if entry is not None and entry['source'] == _source_identity(filePath):
+        return entry['checksum']
+    return None
+
+
+@timed('checksum')
+def trace_checksum(filePath: str) -> str:
+    # SHA-256 of the decoded trace text, so a trace keeps its identity when it is renamed or recompressed.
+    # Read from the binary trace when it is up to date, otherwise the source is converted, which records it.
+    checksum = known_checksum(filePath)
+    if checksum is None:
+        with open(ensure_trace(filePath), 'rb') as file:
+            checksum = read_header(file.read(HEADER_SIZE), filePath).checksum
+    return checksum
@@ -1,83 +1,112 @@
 import csv
 import os
-from itertools import pairwise
+from contextlib import closing
 
 from rich.console import Console
 from rich import box
 from rich.table import Table
 from colorama import init, Fore, Style
 
+from src.models.BranchStatistics import STATISTICS_FIELDS
+from src.utils.trace import trace_length
+from src.utils.instrumentation import timed
+from src.utils.results_store import open_store, is_empty, add_run, upsert_results, query_results, stored_predictors
+
 filesFolder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Data', 'txt'))
 csvFolder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Data', 'csv'))
-
-file_list = [f for f in os.listdir(filesFolder) if f.endswith('.txt')]
-file_list.sort(key=lambda x: os.path.getsize(os.path.join(filesFolder, x)))
+plotFolder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Data', 'plots'))
 
 rich_console = Console(color_system="auto")
 init(autoreset=True)  # Initialize colorama with auto reset
 
-def save_table(table, nameCSV):
-    columns = table.columns
-    cells = [column.cells for column in columns]
-    rows = list(zip(*cells))
+@timed('save_results')
+def save_results(rows, started_at=None, wall_time=None, branches=None):
+    # rows of (file, predictor type, size, pred_accuracy, total_accuracy, prediction_percentage). Only these
+    # rows are written to the results store, as one run; the CSV files are exported on demand.
+    with closing(results_store()) as connection:
+        run = add_run(connection, started_at=started_at, wall_time=wall_time, branches=branches)
+        upsert_results(connection, run, rows)
+
+
+def results_csv_name(predictor: str) -> str:
+    return f"{predictor.lower().replace(' ', '_')}_results.csv"
+
+
+def export_results(predictors=None):
+    # Writes the stored results of the given predictor types, every stored one by default, to their CSV files
+    with closing(results_store()) as connection:
+        for predictor in predictors or stored_predictors(connection):
+            export_results_csv(connection, predictor)
+
 
-    files = [row[0] for row in rows]
-    sizes = [row[1] for row in rows]
-    predAccuracies = [row[2].rstrip('%') for row in rows]
-    totalAccuracies = [row[3].rstrip('%') for row in rows]
-    pred_percents = [row[4].rstrip('%') for row in rows]
+def export_results_csv(connection, predictor: str):
+    # Writes the latest results of a predictor type in the CSV layout of results_csv_name files
+    rows = query_results(connection, predictor=predictor)
+    table = create_table([row[0] for row in rows], [row[2] for row in rows], [row[3] for row in rows],
+                         [row[4] for row in rows], [row[5] for row in rows])
+    save_table_to_csv(table, results_csv_name(predictor))
 
-    save_results(files,sizes,predAccuracies,totalAccuracies, pred_percents, nameCSV)
 
-def save_results(files, sizes, pred_accuracies, total_accuracies, pred_percents, nameCSV):
-    csv_file = os.path.join(csvFolder, nameCSV)
-    existing_table = load_results_from_csv(csv_file)
-    new_table = create_table(files, sizes, pred_accuracies, total_accuracies, pred_percents)
+def results_store():
+    # Opens the results store; a new store first imports the CSV files written before it existed
+    connection = open_store()
+    if is_empty(connection):
+        import_csv_results(connection)
+    return connection
 
-    final_table = empty_table()
 
-    if existing_table:
-        oldColumns = existing_table.columns
-        oldCells = [column.cells for column in oldColumns]
-        oldRows = list(zip(*oldCells))
+def import_csv_results(connection):
+    if not os.path.isdir(csvFolder):
+        return
 
+    for name in sorted(os.listdir(csvFolder)):
+        if not name.endswith('_results.csv'):
+            continue
 
-        # Now let's declare the new rows
-        newColumns = new_table.columns
-        newCells = [column.cells for column in newColumns]
-        newRows = list(zip(*newCells))
-        # print(f"New Rows: {newRows}")
+        predictor = name[:-len('_results.csv')].replace('_', ' ').title()
+        csvPath = os.path.join(csvFolder, name)
+        with open(csvPath, 'r', newline='') as file:
+            reader = csv.reader(file)
+            next(reader, None)
+            rows = [(trace, predictor, int(size), float(pred.rstrip('%')), float(total.rstrip('%')), float(percent.rstrip('%')))
+                    for trace, size, pred, total, percent in reader]
 
-        # Remove the rows that are already in the existing table
-        newRows = [row for row in newRows if row not in oldRows]
+        if rows:
+            run = add_run(connection, started_at=os.path.getmtime(csvPath), source=name)
+            upsert_results(connection, run, rows)
 
-        finalRows = oldRows + newRows
-        # Sort finalRows by the first element, then second, then third
-        finalRows = sorted(finalRows, key=lambda x: (
-            x[0],  # Branch name (string)
-            int(x[1]),  # Size (integer)
-            float(x[2].rstrip('%')),  # Accuracy (float, remove '%' sign)
-            float(x[3].rstrip('%')),  # Accuracy (float, remove '%' sign)
-            float(x[4].rstrip('%'))   # Percentage( float, remove '% sign)
-        ))
 
-        # print(f"Final Rows: {finalRows}")
+def saved_predictors():
+    with closing(results_store()) as connection:
+        return stored_predictors(connection)
 
-        for row in finalRows:
-            final_table.add_row(*row)
-    else:
-        final_table = new_table
 
-    # Save the final table to CSV
-    save_table_to_csv(final_table, nameCSV)
+def load_results_table(predictor: str = None, trace: str = None) -> Table | None:
+    # Latest stored results, filtered by predictor type and trace; None when nothing matches
+    with closing(results_store()) as connection:
+        rows = query_results(connection, trace=trace, predictor=predictor)
+    if not rows:
+        return None
 
-    return final_table
+    table = empty_table(predictor_column=predictor is None)
+    table.title = predictor or "All Predictors"
+    previous_trace = rows[0][0]
+    for trace, name, size, pred_accuracy, total_accuracy, prediction_percentage in rows:
+        if trace != previous_trace:
+            table.add_section()
+            previous_trace = trace
+        row = (trace, str(size), f"{pred_accuracy:.2f}%", f"{total_accuracy:.2f}%", f"{prediction_percentage:.2f}%")
+        table.add_row(*(row[:1] + (name,) + row[1:] if predictor is None else row))
+
+    return table
 
 
-def empty_table() -> Table:
+def empty_table(predictor_column: bool = False) -> Table:
     table = Table(title="Results Table", box=box.DOUBLE_EDGE, show_header=True, header_style="bold magenta")
 
     table.add_column("Branch", style="yellow", justify="center")
+    if predictor_column:
+        table.add_column("Predictor", style="blue", justify="center")
     table.add_column("Size", style="cyan", justify="center")
     table.add_column("Prediction Accuracy (%)", style="green", justify="center")
     table.add_column("Total Accuracy (%)", style="green", justify="center")
@@ -122,34 +151,78 @@ def save_table_to_csv(table: Table, csvName: str):
     print_colored(f"Table saved to {csvPath}", Fore.GREEN, Style.BRIGHT)
 
 
-def load_results_from_csv(csvFile) -> Table | None:
-    csvPath = os.path.join(csvFolder, csvFile)
-    try:
-        with open(csvPath, 'r', newline='') as file:
-            reader = csv.reader(file)
-            headers = next(reader)
+def branch_statistics_csv_name(trace: str, predictor_class, size: int) -> str:
+    return os.path.join('branches', f"{os.path.basename(trace)}.{predictor_class.__name__}.{size}.csv")
 
-            table = Table(title= csvFile)
-            styles = ["cyan", "magenta", "green", "green"]
-            for i, header in enumerate(headers)  :
-                table.add_column(header, style=styles[i] or "white")
 
-            for row, next_row in pairwise(reader):
-                print(*row)
-                file = row[0]
-                nextFile = next_row[0]
+def save_branch_statistics(statistics, trace: str, predictor_class, size: int) -> str:
+    # Full per static branch table of a simulation, the most wrongly predicted branches first
+    csvPath = os.path.join(csvFolder, branch_statistics_csv_name(trace, predictor_class, size))
+    os.makedirs(os.path.dirname(csvPath), exist_ok=True)
 
-                if file != nextFile:
-                    table.add_row(*row, end_section=True)
-                else:
-                    table.add_row(*row)
+    with open(csvPath, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(STATISTICS_FIELDS)
+        writer.writerows(row[:-1] + (f"{row[-1]:.2f}",) for row in statistics.rows())
+    return csvPath
 
-            table.add_row(*next_row, end_section=True)
 
-            return table
-    except Exception as e:
-        print_colored(f"Error loading CSV: {e}", Fore.RED, Style.BRIGHT)
-        return None
+def windowed_metrics_csv_name(trace: str, predictor_class, size: int) -> str:
+    return os.path.join('windows', f"{os.path.basename(trace)}.{predictor_class.__name__}.{size}.csv")
+
+
+def save_windowed_metrics(metrics, trace: str, predictor_class, size: int) -> str:
+    csvPath = os.path.join(csvFolder, windowed_metrics_csv_name(trace, predictor_class, size))
+    os.makedirs(os.path.dirname(csvPath), exist_ok=True)
+
+    with open(csvPath, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(metrics.fields())
+        writer.writerows(row[:6] + tuple(f"{value:.2f}" for value in row[6:]) for row in metrics.rows())
+    return csvPath
+
+
+def plot_windowed_metrics(series, title: str, path: str) -> str:
+    # series maps a label to its WindowedMetrics; draws the total accuracy and the prediction percentage of
+    # every window, the decayed ones where there are, against the branch position, and saves it as an image
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    sns.set_theme(style='whitegrid')
+    figure, (accuracy_axis, coverage_axis) = plt.subplots(2, 1, sharex=True, figsize=(12, 7))
+    for label, metrics in series.items():
+        rows = metrics.rows()
+        decayed = metrics.decay is not None
+        positions = [row[1] + row[2] for row in rows]
+        accuracy_axis.plot(positions, [row[11 if decayed else 8] for row in rows], label=label)
+        coverage_axis.plot(positions, [row[9 if decayed else 6] for row in rows], label=label)
+
+    accuracy_axis.set_ylabel("Total accuracy (%)")
+    coverage_axis.set_ylabel("Prediction percentage (%)")
+    coverage_axis.set_xlabel("Branches")
+    accuracy_axis.set_title(title)
+    accuracy_axis.legend(loc='best', fontsize='small')
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    figure.tight_layout()
+    figure.savefig(path, dpi=120)
+    plt.close(figure)
+    return path
+
+
+def branch_statistics_table(rows, title: str) -> Table:
+    table = Table(title=title, box=box.DOUBLE_EDGE, show_header=True, header_style="bold magenta")
+
+    table.add_column("Address", style="yellow", justify="center", no_wrap=True)
+    for header in ("Runs", "Taken", "Hits", "Right", "Wrong", "Cold", "Evicted", "Default", "Flips"):
+        table.add_column(header, style="cyan", justify="right")
+    table.add_column("Acc %", style="green", justify="right")
+
+    for row in rows:
+        table.add_row(row[0], *(str(value) for value in row[1:-1]), f"{row[-1]:.2f}")
+    return table
 
 
 def print_colored(text, color=Fore.WHITE, style=Style.NORMAL, end='\n'):
@@ -157,7 +230,5 @@ def print_colored(text, color=Fore.WHITE, style=Style.NORMAL, end='\n'):
 
 
 def getLines(filePath):
-    with open(filePath, 'r') as file:
-        lines = file.readlines()
-
-    return len(lines)
+    # The branch count is stored in the binary trace header, so only the first use reads the text file
+    return trace_length(filePath)
@@ -0,0 +1,54 @@
+import pytest
+
+from src.utils import trace, checkpoint
+from src.utils.synthetic import generate_trace
+
+# Differential tests: every fast path is checked against the reference path it replaced, on small synthetic
+# traces. Binary traces, recorded checksums and checkpoints go to the test's own folder, never to Data.
+
+TRACE_LENGTH = 60000
+RUN_OPTIONS = dict(use_cache=False, show_progress=False, save=False)
+
+TRACES = {
+    'hot': dict(static_branches=48, locality=1.1, seed=1),          # Fits the larger tables, few evictions
+    'wide': dict(static_branches=3000, locality=0.6, seed=2),       # Evicts constantly at every size
+    'loops': dict(static_branches=400, loop_fraction=0.6, loop_length=5, bias=0.9, seed=3),
+}
+
+
+@pytest.fixture(autouse=True)
+def data_folders(tmp_path, monkeypatch):
+    monkeypatch.setattr(trace, 'binFolder', str(tmp_path / 'bin'))
+    monkeypatch.setattr(checkpoint, 'checkpointFolder', str(tmp_path / 'checkpoints'))
+
+
+@pytest.fixture(params=sorted(TRACES))
+def trace_path(request, tmp_path):
+    return generate_trace(str(tmp_path / f"{request.param}.txt"), TRACE_LENGTH, **TRACES[request.param])
+
+
+@pytest.fixture
+def hex_trace_path(tmp_path):
+    # The 'hot' trace with 0x prefixed hexadecimal addresses, as some traces write them
+    source = generate_trace(str(tmp_path / 'decimal.txt'), TRACE_LENGTH, **TRACES['hot'])
+    path = tmp_path / 'hex.txt'
+    with open(source) as lines, open(path, 'w') as file:
+        for line in lines:
+            address, outcome = line.split()
+            file.write(f"{int(address):#x} {outcome}\n")
+    return str(path)
+
+
+@pytest.fixture
+def run_serial_and():
+    # Runs cells serially with run_cells, then once with the options of every variant in turn, each of which
+    # must give the serial results, all of them exact
+    from src.runner import run_cells
+
+    def run(cells, *variants):
+        serial, _ = run_cells(cells, max_workers=1, **RUN_OPTIONS)
+        for variant in variants:
+            results, approximate = run_cells(cells, **RUN_OPTIONS, **variant)
+            assert not approximate, variant
+            assert results == serial, variant
+    return run
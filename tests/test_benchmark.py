@@ -0,0 +1,62 @@
+import json
+
+from src.models.Branch import Branch
+from src.utils import benchmark
+from src.utils.synthetic import generate_trace
+
+
+def test_synthetic_traces_are_deterministic(tmp_path):
+    first = generate_trace(str(tmp_path / 'first.txt'), 5000, static_branches=64, seed=7)
+    second = generate_trace(str(tmp_path / 'second.txt'), 5000, static_branches=64, seed=7)
+    other = generate_trace(str(tmp_path / 'other.txt'), 5000, static_branches=64, seed=8)
+    with open(first, 'rb') as a, open(second, 'rb') as b, open(other, 'rb') as c:
+        text = a.read()
+        assert text == b.read()
+        assert text != c.read()
+    assert text.count(b'\n') == 5000
+    assert len(set(text.split()[0::2])) <= 64
+
+
+def test_loop_branches_follow_their_period(tmp_path, monkeypatch):
+    # Generated in several chunks, so the period has to carry over from one chunk to the next
+    monkeypatch.setattr('src.utils.synthetic.GENERATE_CHUNK_SIZE', 1000)
+    path = generate_trace(str(tmp_path / 'loops.txt'), 20000, static_branches=8, loop_fraction=1.0, loop_length=5)
+    outcomes = {}
+    for address, outcome in Branch(path, progress_toggle=False):
+        outcomes.setdefault(address, []).append(outcome)
+    for history in outcomes.values():
+        assert history == (['T'] * 4 + ['N']) * (len(history) // 5) + ['T'] * (len(history) % 5)
+
+
+def test_comparison_flags_losses_past_the_threshold():
+    baseline = {'results': [{'name': 'predict', 'branches_per_second': 100.0},
+                            {'name': 'load', 'mb_per_second': 10.0, 'branches_per_second': 100.0},
+                            {'name': 'gone', 'branches_per_second': 1.0}]}
+    report = {'results': [{'name': 'predict', 'branches_per_second': 85.0},
+                          {'name': 'load', 'mb_per_second': 9.5, 'branches_per_second': 50.0},
+                          {'name': 'new', 'branches_per_second': 1.0}]}
+    comparison = benchmark.compare_with_baseline(report, baseline, threshold=0.10)
+    assert [(name, metric, regressed) for name, metric, _, _, _, regressed in comparison] == \
+        [('predict', 'branches_per_second', True), ('load', 'mb_per_second', False)]
+
+
+def test_main_writes_a_report_and_compares_with_it(tmp_path):
+    baseline = str(tmp_path / 'baseline.json')
+    arguments = ['--length', '20000', '--sizes', '16', '--static-branches', '256', '--baseline', baseline,
+                 '--statistics-limit', '100']
+    assert benchmark.main(arguments + ['--save-baseline']) == 0
+
+    with open(baseline) as file:
+        report = json.load(file)
+    names = [result['name'] for result in report['results']]
+    assert names[:5] == ['generate/synthetic', 'load/getLines/cold', 'load/getLines/warm', 'load/Branch/cold',
+                         'load/Branch/warm']
+    assert all(f'predict/{cls.__name__}/16' in names for cls in benchmark.predictor_classes())
+    assert all(result['overhead'] >= -1 for result in report['results'] if result['name'].startswith('statistics/'))
+
+    output = str(tmp_path / 'report.json')
+    benchmark.main(arguments + ['--output', output])
+    with open(output) as file:
+        compared = [row['name'] for row in json.load(file)['comparison']]
+    # Statistics results hold an overhead, not a throughput, so they are not compared
+    assert compared == [name for name in names if not name.startswith('statistics/')]
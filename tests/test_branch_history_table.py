@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from src.models.BranchHistoryTable import DirectMappedPredictor, OneBitDirectMappedPredictor, SetAssociativePredictor
+from src.models.BranchStatistics import DEFAULT_CORRECT, MISPREDICTED, MISSED, PREDICTED
+
+# Addresses 8 and 12 share set 0 of a 4-set table, 9 has set 1 to itself
+ALIASING = [(8, 1), (8, 1), (8, 1), (12, 0), (8, 1), (9, 1), (8, 1)]
+
+
+@pytest.mark.parametrize('cls', [DirectMappedPredictor, SetAssociativePredictor])
+@pytest.mark.parametrize('size', [0, -4])
+def test_empty_tables_are_rejected(cls, size):
+    with pytest.raises(ValueError, match='at least one entry'):
+        cls(size)
+
+
+@pytest.mark.parametrize('size', [6, 12])
+def test_sets_must_be_a_power_of_two(size):
+    with pytest.raises(ValueError, match='power of two'):
+        SetAssociativePredictor(size)
+
+
+def test_small_tables_shrink_the_ways():
+    # A table smaller than the ways of its type is one fully associative set
+    predictor = SetAssociativePredictor(2)
+    assert (predictor.ways, predictor.sets) == (2, 1)
+
+
+def result_codes(predictor, branches):
+    # Result code of every branch through the batch kernel, checked against the predict/update path
+    addresses = sorted({address for address, _ in branches})
+    ids = np.array([addresses.index(address) for address, _ in branches], dtype=np.uint32)
+    taken = np.array([outcome for _, outcome in branches], dtype=np.uint8)
+    results = bytearray(len(branches))
+    predictor.simulate(ids, taken, addresses, results)
+
+    reference = type(predictor)(predictor.MAX_HISTORY_SIZE, predictor.ways)
+    codes = []
+    for address, outcome in branches:
+        prediction = reference.predict(address)
+        outcome = 'T' if outcome else 'N'
+        if prediction is None:
+            codes.append(DEFAULT_CORRECT if outcome == reference.default_prediction_state else MISSED)
+        else:
+            codes.append(PREDICTED if prediction == outcome else MISPREDICTED)
+        reference.update(address, outcome)
+    assert list(results) == codes
+    return codes
+
+
+def test_aliasing_branches_evict_each_other_from_a_direct_mapped_table():
+    # 8 trains its counter up to a right prediction, then 12 takes the entry over and 8 starts again from a
+    # miss, its counter back to weakly not taken
+    assert result_codes(DirectMappedPredictor(4), ALIASING) == \
+        [MISSED, MISPREDICTED, PREDICTED, DEFAULT_CORRECT, MISSED, MISSED, MISPREDICTED]
+
+
+def test_aliasing_branches_share_a_set_of_two_ways():
+    assert result_codes(SetAssociativePredictor(8, ways=2), ALIASING) == \
+        [MISSED, MISPREDICTED, PREDICTED, DEFAULT_CORRECT, PREDICTED, MISSED, PREDICTED]
+
+
+@pytest.mark.parametrize('cls, states', [
+    # A new entry starts at 0 and is updated once, then the counter saturates at either end
+    (DirectMappedPredictor, [1, 2, 3, 3, 2, 1, 0, 0, 1]),
+    (OneBitDirectMappedPredictor, [1, 1, 1, 1, 0, 0, 0, 0, 1]),
+])
+def test_counters_saturate(cls, states):
+    outcomes = [1, 1, 1, 1, 0, 0, 0, 0, 1]
+    batch = cls(1)
+    scalar = cls(1)
+    for outcome, state in zip(outcomes, states):
+        batch.simulate(np.zeros(1, dtype=np.uint32), np.array([outcome], dtype=np.uint8), [8])
+        scalar.update(8, 'T' if outcome else 'N')
+        assert batch.counters[0] == scalar.counters[0] == state
+        assert scalar.predict(8) == ('T' if state >> (scalar.counter_bits - 1) else 'N')
@@ -0,0 +1,57 @@
+import pytest
+
+from src.models.Branch import Branch
+from src.models.WindowedMetrics import WindowedMetrics
+from src.runner import PREDICTOR_TYPES
+from src.utils.checkpoint import checkpoint_path
+from src.utils.synthetic import generate_trace
+
+SIZES = (1, 16, 256)
+
+
+def test_checkpointed_runs_match_serial(trace_path, run_serial_and):
+    # The second checkpointed run resumes from the final snapshots of the first
+    run_serial_and([(trace_path, name, size) for name in PREDICTOR_TYPES for size in SIZES],
+                   dict(checkpoints=True), dict(checkpoints=True))
+
+
+@pytest.mark.parametrize('name', sorted(PREDICTOR_TYPES))
+def test_interrupted_checkpoint_resumes(trace_path, tmp_path, name):
+    # A run over the first part of the trace stands for one interrupted there; resuming it on the whole
+    # trace gives the result and windows of a run from the start
+    with open(trace_path) as source:
+        lines = source.readlines()
+    prefix = tmp_path / 'prefix.txt'
+    prefix.write_text(''.join(lines[:len(lines) * 2 // 3 + 7]))
+    checkpoint = str(tmp_path / f"{name}.ckpt")
+    branch = Branch(trace_path, progress_toggle=False)
+
+    for size in SIZES:
+        expected = WindowedMetrics(1000, half_life=4000)
+        serial = PREDICTOR_TYPES[name](size).predict_branch(branch, metrics=expected)
+
+        PREDICTOR_TYPES[name](size).predict_branch(Branch(str(prefix), progress_toggle=False), checkpoint_path=checkpoint,
+                                                   checkpoint_interval=5000, metrics=WindowedMetrics(1000, half_life=4000))
+        assert PREDICTOR_TYPES[name](size).resume(branch, checkpoint, WindowedMetrics(1000)) is not None
+        metrics = WindowedMetrics(1000, half_life=4000)
+        resumed = PREDICTOR_TYPES[name](size).predict_branch(branch, checkpoint_path=checkpoint, metrics=metrics)
+
+        assert resumed == serial, (name, size)
+        assert metrics.rows() == expected.rows(), (name, size)
+
+
+def test_checkpoint_of_another_trace_is_not_resumed(trace_path, tmp_path):
+    other = generate_trace(str(tmp_path / 'other.txt'), 5000, seed=9)
+    checkpoint = str(tmp_path / 'other.ckpt')
+    PREDICTOR_TYPES['Two Bit Predictor'](16).predict_branch(Branch(other, progress_toggle=False), checkpoint_path=checkpoint)
+    assert PREDICTOR_TYPES['Two Bit Predictor'](16).resume(Branch(trace_path, progress_toggle=False), checkpoint) is None
+    assert PREDICTOR_TYPES['Two Bit Predictor'](8).resume(Branch(other, progress_toggle=False), checkpoint) is None
+    assert PREDICTOR_TYPES['Two Bit Predictor'](16).resume(Branch(other, progress_toggle=False), checkpoint) is not None
+
+
+def test_traces_of_the_same_name_have_their_own_checkpoints(tmp_path):
+    first = tmp_path / 'a' / 'trace.txt'
+    second = tmp_path / 'b' / 'trace.txt'
+    predictor_class = PREDICTOR_TYPES['Two Bit Predictor']
+    assert checkpoint_path(str(first), predictor_class, 16) != checkpoint_path(str(second), predictor_class, 16)
+    assert checkpoint_path(str(first), predictor_class, 16) == checkpoint_path(str(first), predictor_class, 16)
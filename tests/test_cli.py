@@ -0,0 +1,140 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+from contextlib import closing
+
+import pytest
+
+from src import cli, runner
+from src.models.Branch import Branch
+from src.models.BranchHistoryTable import SetAssociativePredictor
+from src.models.GsharePredictor import GsharePredictor
+from src.models.TournamentPredictor import TournamentPredictor
+from src.utils import results_store, utils
+from src.utils.results_cache import ResultCache
+from tests.conftest import RUN_OPTIONS
+
+
+@pytest.mark.parametrize('predictor, size', [('gshare', 12), ('tournament', 0), ('direct-mapped', 6),
+                                             ('set-associative', 12), ('one-bit', 0)])
+def test_invalid_sizes_fail_before_any_work(trace_path, monkeypatch, capsys, predictor, size):
+    def run_cells(*args, **kwargs):
+        raise AssertionError("cells ran")
+    monkeypatch.setattr(runner, 'run_cells', run_cells)
+
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(['--traces', trace_path, '--predictors', 'two-bit', predictor, '--sizes', '4', str(size)])
+    assert exit_info.value.code == 2
+    assert f"of size {size}:" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('cls, size', [(GsharePredictor, 12), (TournamentPredictor, 0), (SetAssociativePredictor, 12)])
+def test_check_size_agrees_with_the_constructor(cls, size):
+    with pytest.raises(ValueError):
+        cls.check_size(size)
+    with pytest.raises(ValueError):
+        cls(size)
+    cls.check_size(16)
+    cls(16)
+
+
+def test_predictor_names_resolve_every_way_they_are_written():
+    assert cli.resolve_predictors(['two-bit', 'TwoBitPredictor', 'Two Bit Predictor', 'gshare'], runner.PREDICTOR_TYPES) \
+        == ['Two Bit Predictor', 'Gshare Predictor']
+    assert cli.resolve_predictors(['all'], runner.PREDICTOR_TYPES) == list(runner.PREDICTOR_TYPES)
+    with pytest.raises(ValueError, match='unknown predictor'):
+        cli.resolve_predictors(['three-bit'], runner.PREDICTOR_TYPES)
+
+
+def test_results_match_the_engine_and_options_override_the_config(trace_path, tmp_path):
+    config = tmp_path / 'config.json'
+    config.write_text(json.dumps({'predictors': ['two-bit', 'gshare'], 'sizes': [64], 'cache': False}))
+    output = tmp_path / 'results.csv'
+    assert cli.main(['--config', str(config), '--traces', trace_path, '--sizes', '4', '16', '--format', 'csv',
+                     '--output', str(output)]) == 0
+
+    with open(output, newline='') as file:
+        rows = list(csv.reader(file))
+    assert tuple(rows[0]) == cli.RESULT_FIELDS
+    cells = [(trace_path, name, size) for name in ('Two Bit Predictor', 'Gshare Predictor') for size in (4, 16)]
+    accuracies, _ = runner.run_cells(cells, **RUN_OPTIONS)
+    assert [(trace, name, int(size)) for trace, name, size, *_ in rows[1:]] == cells
+    assert [tuple(float(value) for value in row[3:6]) for row in rows[1:]] == [accuracies[cell] for cell in cells]
+
+
+def test_history_lengths_are_predictors_of_their_own(trace_path, tmp_path, monkeypatch):
+    # Every length is a cell of its own, cached and stored apart from the others, and reused by a later run
+    monkeypatch.setattr(runner, 'ResultCache', lambda: ResultCache(str(tmp_path / 'cache.json')))
+    monkeypatch.setattr(utils, 'csvFolder', str(tmp_path / 'csv'))
+    monkeypatch.setattr(utils, 'open_store', lambda: results_store.open_store(str(tmp_path / 'results.sqlite3')))
+    simulated = []
+    plan_jobs = runner.plan_jobs
+    monkeypatch.setattr(runner, 'plan_jobs', lambda branches, cells, *args: simulated.extend(cells) or
+                        plan_jobs(branches, cells, *args))
+
+    def run(*options):
+        output = tmp_path / 'results.json'
+        assert cli.main(['--traces', trace_path, '--predictors', 'gshare', 'two-bit', '--sizes', '256',
+                         '--output', str(output), *options]) == 0
+        return {(row['predictor'], row['size']): (row['pred_accuracy'], row['total_accuracy'],
+                                                  row['prediction_percentage'])
+                for row in json.loads(output.read_text())['results']}
+
+    results = run('--history-bits', '0', '8', '--save')
+    names = [runner.history_name('Gshare Predictor', history_bits) for history_bits in (0, 8)]
+    assert sorted(results) == sorted([(name, 256) for name in names] + [('Two Bit Predictor', 256)])
+    assert len(simulated) == 3
+    branch = Branch(trace_path, progress_toggle=False)
+    for name, history_bits in zip(names, (0, 8)):
+        assert results[(name, 256)] == GsharePredictor(256, history_bits).predict_branch(branch)
+    assert results[(names[0], 256)] != results[(names[1], 256)]
+    with closing(utils.results_store()) as connection:
+        assert sorted(results_store.stored_predictors(connection)) == sorted(names + ['Two Bit Predictor'])
+
+    # Cached by length: the other length and the default one are new cells
+    simulated.clear()
+    assert run('--history-bits', '8', '4') == {key: value for key, value in results.items() if key[0] != names[0]} | \
+        {(runner.history_name('Gshare Predictor', 4), 256): GsharePredictor(256, 4).predict_branch(branch)}
+    assert simulated == [(trace_path, runner.history_name('Gshare Predictor', 4), 256)]
+    simulated.clear()
+    assert run()[('Gshare Predictor', 256)] == results[(names[1], 256)]
+    assert simulated == [(trace_path, 'Gshare Predictor', 256)]
+
+
+@pytest.mark.parametrize('options, message', [(['--history-bits', '-1'], 'at least 0'),
+                                              (['--predictors', 'two-bit', '--history-bits', '4'], 'global history')])
+def test_invalid_history_lengths_are_rejected(trace_path, capsys, options, message):
+    with pytest.raises(SystemExit):
+        cli.main(['--traces', trace_path, '--sizes', '16', *options])
+    assert message in capsys.readouterr().err
+
+
+def test_unknown_config_keys_are_rejected(tmp_path, capsys):
+    config = tmp_path / 'config.json'
+    config.write_text(json.dumps({'sizs': [4]}))
+    with pytest.raises(SystemExit):
+        cli.main(['--config', str(config)])
+    assert 'unknown keys' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('module, absent', [
+    ('src.cli', ['numpy', 'src.runner', 'rich']),
+    ('src.runner', ['multiprocessing', 'concurrent.futures', 'socket', 'rich', 'src.utils.distributed',
+                    'src.utils.checkpoint', 'src.utils.sharding', 'src.models.Predictor']),
+])
+def test_startup_imports_stay_lazy(module, absent):
+    # What a cached batch run loads before it knows which machinery it needs
+    code = f"import sys, {module}; print([name for name in {absent!r} if name in sys.modules])"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == '[]'
+
+
+def test_package_script_starts_the_menu():
+    # python src/__init__.py runs the interactive menu, as it did before the menu moved to src.app
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, os.path.join(root, 'src', '__init__.py')], capture_output=True, text=True,
+                            stdin=subprocess.DEVNULL, env=dict(os.environ, PYTHONPATH=root), timeout=60)
+    assert 'Branch Prediction Analysis' in result.stdout
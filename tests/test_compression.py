@@ -0,0 +1,62 @@
+import bz2
+import gzip
+import lzma
+
+import pytest
+
+from src.models.Branch import Branch
+from src.models.BranchStream import BranchStream
+from src.utils.trace import open_source, trace_checksum
+
+COMPRESSORS = {'.gz': gzip.compress, '.xz': lzma.compress, '.bz2': bz2.compress}
+
+
+def compress(path, extension):
+    with open(path, 'rb') as file:
+        data = COMPRESSORS[extension](file.read())
+    target = path + extension
+    with open(target, 'wb') as file:
+        file.write(data)
+    return target
+
+
+@pytest.mark.parametrize('extension', sorted(COMPRESSORS))
+def test_compressed_trace_loads_like_the_text(trace_path, extension):
+    compressed = compress(trace_path, extension)
+    assert list(Branch(compressed, progress_toggle=False)) == list(Branch(trace_path, progress_toggle=False))
+    # The checksum is of the decoded text, so a compressed copy names the same results
+    assert trace_checksum(compressed) == trace_checksum(trace_path)
+
+
+@pytest.mark.parametrize('extension', sorted(COMPRESSORS))
+def test_compressed_trace_streams_in_compressed_bytes(trace_path, extension):
+    compressed = compress(trace_path, extension)
+    stream = BranchStream(compressed, chunk_size=4099)
+    chunks = list(stream.iter_chunks())
+    assert [pair for pairs, _, _ in chunks for pair in pairs] == list(Branch(trace_path, progress_toggle=False))
+    assert sum(consumed for _, _, consumed in chunks) == stream.progress_total
+
+
+def test_zstd_trace(trace_path):
+    zstandard = pytest.importorskip('zstandard')
+    with open(trace_path, 'rb') as file:
+        data = zstandard.ZstdCompressor().compress(file.read())
+    with open(trace_path + '.zst', 'wb') as file:
+        file.write(data)
+    assert list(Branch(trace_path + '.zst', progress_toggle=False)) == list(Branch(trace_path, progress_toggle=False))
+
+
+def test_corrupt_archive_raises_in_the_reader(tmp_path):
+    path = tmp_path / 'trace.txt.gz'
+    path.write_bytes(gzip.compress(b'4005d0 T\n' * 100000)[:-64])
+    with pytest.raises(EOFError):
+        with open_source(str(path), 4096) as file:
+            while file.read():
+                pass
+
+
+def test_closing_early_stops_the_decoder(trace_path):
+    reader = open_source(compress(trace_path, '.gz'), 1024)
+    assert reader.read()
+    reader.close()
+    assert not reader._thread.is_alive()
@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+
+import pytest
+
+from src.models.Branch import Branch
+from src.utils import distributed
+from src.utils.distributed import Scheduler, distribute, run_worker
+from src.utils.trace import TRACE_EXTENSION, trace_checksum
+
+KEY = 'test-key'
+_failed_once = set()
+
+
+def taken_count(branch, offset, counter):
+    return int(branch.taken_array().sum()) + offset
+
+
+def fails_once(branch, job, counter):
+    if job not in _failed_once:
+        _failed_once.add(job)
+        raise RuntimeError(f"job {job} fails the first time")
+    return job
+
+
+def test_jobs_are_handed_out_in_order_then_copied():
+    scheduler = Scheduler(2)
+    assert scheduler.next_job('a') == 0
+    assert scheduler.next_job('b') == 1
+    # Nothing is pending: c copies the oldest running job, a is not given its own job again
+    assert scheduler.next_job('c') == 0
+    assert scheduler.running == {0: ['a', 'c'], 1: ['b']}
+
+    assert scheduler.complete(0, 'c', 'first')
+    assert not scheduler.complete(0, 'a', 'second')
+    assert scheduler.complete(1, 'b', 'only')
+    assert scheduler.results == {0: 'first', 1: 'only'}
+    assert scheduler.finished() and scheduler.next_job('a') is None
+
+
+def test_failed_jobs_go_back_to_the_front_until_the_last_attempt():
+    scheduler = Scheduler(2, max_attempts=2)
+    assert scheduler.next_job('a') == 0
+    scheduler.fail(0, 'a', 'lost before it arrived', attempted=False)
+    assert scheduler.next_job('a') == 0
+    scheduler.fail(0, 'a', 'crashed')
+    assert scheduler.error is None
+    assert list(scheduler.pending) == [0, 1]
+
+    assert scheduler.next_job('b') == 0
+    scheduler.fail(0, 'b', 'crashed again')
+    assert scheduler.error == "job 0 failed 2 times, last: crashed again"
+    assert scheduler.next_job('c') is None
+
+
+def test_a_failed_copy_leaves_the_other_running():
+    scheduler = Scheduler(1)
+    scheduler.next_job('a')
+    scheduler.next_job('b')
+    scheduler.fail(0, 'a', 'crashed')
+    assert not scheduler.pending and scheduler.running == {0: ['b']}
+
+
+@pytest.fixture
+def coordinator(tmp_path, monkeypatch):
+    # Workers run as threads of the test, with their own trace store
+    monkeypatch.setenv(distributed.AUTHKEY_VARIABLE, KEY)
+    monkeypatch.setattr(distributed, 'storeFolder', str(tmp_path / 'store'))
+    errors = []
+
+    def run(jobs, traces, workers=2):
+        threads = []
+
+        def log(message):
+            match = re.search(r'listening on (\S+):(\d+)', message)
+            if match:
+                address = (match.group(1), int(match.group(2)))
+                for index in range(workers):
+                    threads.append(threading.Thread(target=worker, args=(address, f"worker{index}")))
+                    threads[-1].start()
+
+        def worker(address, name):
+            try:
+                run_worker(address, KEY.encode(), name=name)
+            except Exception as error:
+                errors.append(error)
+
+        try:
+            return distribute(jobs, traces, ('127.0.0.1', 0), log=log)
+        finally:
+            for thread in threads:
+                thread.join()
+
+    run.errors = errors
+    return run
+
+
+def test_workers_store_the_fetched_trace_and_return_every_result(coordinator, trace_path):
+    branch = Branch(trace_path, progress_toggle=False)
+    checksum = trace_checksum(trace_path)
+    jobs = [(taken_count, checksum, (offset,)) for offset in range(6)]
+
+    results = coordinator(jobs, {checksum: branch.trace.path})
+    expected = int(branch.taken_array().sum())
+    assert results == [expected + offset for offset in range(6)]
+    assert os.listdir(distributed.storeFolder) == [checksum + TRACE_EXTENSION]
+    assert not coordinator.errors
+
+
+def test_a_failed_job_is_retried(coordinator, trace_path):
+    checksum = trace_checksum(trace_path)
+    _failed_once.clear()
+    jobs = [(fails_once, checksum, (job,)) for job in range(3)]
+    assert coordinator(jobs, {checksum: Branch(trace_path, progress_toggle=False).trace.path}, workers=1) == [0, 1, 2]
+
+
+def test_a_trace_that_does_not_match_its_checksum_is_refused(coordinator, trace_path, tmp_path):
+    # The coordinator serves another trace under the checksum: every worker that fetches it gives up
+    other = str(tmp_path / 'other.txt')
+    with open(trace_path) as source, open(other, 'w') as file:
+        file.write(source.read().replace(' T', ' N', 1))
+    checksum = trace_checksum(trace_path)
+
+    with pytest.raises(RuntimeError, match='failed 3 times'):
+        coordinator([(taken_count, checksum, (0,))], {checksum: Branch(other, progress_toggle=False).trace.path},
+                    workers=3)
+    assert len(coordinator.errors) == 3
+    assert all('does not match checksum' in str(error) for error in coordinator.errors)
@@ -0,0 +1,52 @@
+from src.models.Branch import Branch
+from src.models.ImprovedPredictor import ImprovedPredictor
+from src.models.Predictor import Predictor
+
+SIZES = (1, 4, 16, 64)
+
+
+class BaselineImprovedPredictor(Predictor):
+    # The ImprovedPredictor algorithm as first written: every entry ages on every update, and eviction
+    # scans the table for the lowest accuracy / total_appearances, the oldest entry on ties
+    def __init__(self, size):
+        super().__init__(size)
+        self.taken_branches = 0
+        self.not_taken_branches = 0
+
+    def predict(self, address):
+        return self.history[address][0] if address in self.history else None
+
+    def update(self, address, outcome):
+        self.taken_branches += 1 if outcome == 'T' else 0
+        self.not_taken_branches += 1 if outcome == 'N' else 0
+        self.default_prediction_state = 'T' if self.taken_branches > self.not_taken_branches else 'N'
+
+        for key in self.history:
+            self.history[key] = (*self.history[key][:3], self.history[key][3] + 1)
+
+        if address in self.history:
+            prediction, accuracy, total_appearances, total_since_added = self.history[address]
+            correct_predictions = accuracy * total_appearances
+            total_appearances += 1
+            correct_predictions += 1 if outcome == prediction else 0
+            accuracy = correct_predictions / total_appearances
+            if prediction != outcome and accuracy < 0.5:
+                prediction = outcome
+            self.history[address] = (prediction, accuracy, total_appearances, total_since_added)
+        else:
+            if len(self.history) >= self.MAX_HISTORY_SIZE:
+                del self.history[min(self.history, key=lambda k: self.history[k][1] / self.history[k][2])]
+            self.history[address] = (outcome, 1, 1, 1)
+
+
+def test_improved_matches_baseline(trace_path):
+    branch = Branch(trace_path, progress_toggle=False)
+    for size in SIZES:
+        assert ImprovedPredictor(size).predict_branch(branch) == BaselineImprovedPredictor(size).predict_branch(branch), size
+
+
+def test_heap_stays_bounded(trace_path):
+    # Stale heap items are compacted away, so the heap does not grow with the trace
+    predictor = ImprovedPredictor(16)
+    predictor.predict_branch(Branch(trace_path, progress_toggle=False))
+    assert len(predictor.eviction_heap) <= 2 * len(predictor.history) + 64
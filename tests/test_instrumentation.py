@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from src.utils import instrumentation
+from src.utils.instrumentation import MEMORY_SAMPLE_INTERVAL
+
+
+class CountingProcess:
+    # Stands in for psutil.Process, counting the RSS reads
+    def __init__(self):
+        self.reads = 0
+
+    def memory_info(self):
+        self.reads += 1
+        return type('MemoryInfo', (), {'rss': self.reads << 20})
+
+
+@pytest.fixture
+def recorder():
+    recorder = instrumentation.enable()
+    recorder.process = CountingProcess()
+    yield recorder
+    instrumentation.disable()
+
+
+def test_nested_phases_are_taken_out_of_self_time(recorder):
+    with instrumentation.phase('outer'):
+        with instrumentation.phase('inner'):
+            time.sleep(0.02)
+
+    phases = recorder.report()['phases']
+    assert phases['outer']['calls'] == phases['inner']['calls'] == 1
+    assert phases['outer']['wall'] >= phases['inner']['wall'] >= 0.02
+    assert phases['outer']['self_wall'] < 0.02
+    assert phases['inner']['callers'] == {'outer': {'calls': 1, 'wall': phases['inner']['wall']}}
+
+
+def test_short_phases_share_one_rss_sample(recorder):
+    for _ in range(1000):
+        with instrumentation.phase('short'):
+            pass
+
+    assert recorder.process.reads < 1000 * 0.01
+    assert recorder.report()['phases']['short']['peak_rss_mb'] == recorder.process.reads
+
+
+def test_a_phase_longer_than_the_interval_reads_rss_when_it_ends(recorder):
+    with instrumentation.phase('short'):
+        pass
+    with instrumentation.phase('long'):
+        time.sleep(MEMORY_SAMPLE_INTERVAL)
+
+    phases = recorder.report()['phases']
+    assert recorder.process.reads == 2
+    assert phases['long']['peak_rss_mb'] > phases['short']['peak_rss_mb']
+
+
+def test_disabled_phases_are_one_shared_no_op():
+    assert instrumentation.active() is None
+    assert instrumentation.phase('a') is instrumentation.phase('b')
@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from src.models import kernels
+from src.models.Branch import Branch
+from src.models.BranchStatistics import BranchStatistics
+from src.models.BranchStream import BranchStream
+from src.models.Predictor import Predictor
+from src.models.WindowedMetrics import WindowedMetrics
+from src.runner import PREDICTOR_TYPES
+
+SIZES = (1, 4, 16, 64)
+LOOPS = {'One Bit Predictor': 'one_bit_lru', 'Two Bit Predictor': 'two_bit_lru'}
+
+
+@pytest.mark.parametrize('name', sorted(PREDICTOR_TYPES))
+def test_batch_matches_scalar(trace_path, name):
+    branch = Branch(trace_path, progress_toggle=False)
+    for size in SIZES:
+        batch = PREDICTOR_TYPES[name](size).predict_branch(branch, batch=True)
+        scalar = PREDICTOR_TYPES[name](size).predict_branch(branch, batch=False)
+        assert batch == scalar, (name, size)
+
+
+@pytest.mark.parametrize('name', sorted(PREDICTOR_TYPES))
+def test_batch_matches_scalar_on_hex_addresses(hex_trace_path, name):
+    branch = Branch(hex_trace_path, progress_toggle=False)
+    for size in SIZES:
+        assert PREDICTOR_TYPES[name](size).predict_branch(branch, batch=True) == \
+            PREDICTOR_TYPES[name](size).predict_branch(branch, batch=False), (name, size)
+
+
+@pytest.mark.parametrize('name', sorted(name for name, cls in PREDICTOR_TYPES.items() if cls.has_batch_kernel))
+def test_small_calls_match_one_call(trace_path, name):
+    # Kernels keep their state between calls, however short, such as the pieces of windowed metrics
+    branch = Branch(trace_path, progress_toggle=False)
+    for size in SIZES + (1024,):
+        whole = PREDICTOR_TYPES[name](size)
+        pieces = PREDICTOR_TYPES[name](size)
+        totals = [0, 0, 0, 0]
+        for ids, taken, _ in branch.iter_id_chunks():
+            for start in range(0, len(ids), 97):
+                piece = pieces.simulate(ids[start:start + 97], taken[start:start + 97], branch.static_addresses)
+                totals = [total + value for total, value in zip(totals, piece)]
+        expected = [0, 0, 0, 0]
+        for ids, taken, _ in branch.iter_id_chunks():
+            expected = [total + value for total, value in zip(expected, whole.simulate(ids, taken, branch.static_addresses))]
+        assert totals == expected, (name, size)
+
+
+@pytest.mark.parametrize('name', ['One Bit Predictor', 'Two Bit Predictor'])
+@pytest.mark.parametrize('compiled', [True, False])
+def test_small_calls_do_not_scan_the_table(name, compiled, monkeypatch):
+    # A table that never fills up over many static branches, simulated in pieces as windowed metrics do: no
+    # piece takes a pass over the stamps of every static branch
+    if compiled and kernels.numba is None:
+        pytest.skip("numba is not installed")
+    if not compiled:
+        monkeypatch.setattr(kernels, LOOPS[name], None)
+    passes = []
+    oldest_stamp = Predictor._oldest_stamp
+
+    def counting(self):
+        passes.append(len(self.batch_stamp))
+        return oldest_stamp(self)
+    monkeypatch.setattr(Predictor, '_oldest_stamp', counting)
+
+    rng = np.random.default_rng(0)
+    ids = rng.integers(0, 200000, 100000).astype(np.uint32)
+    taken = rng.integers(0, 2, len(ids)).astype(np.uint8)
+    whole = PREDICTOR_TYPES[name](1 << 20).simulate(ids, taken)
+
+    predictor = PREDICTOR_TYPES[name](1 << 20)
+    totals = [0, 0, 0, 0]
+    for start in range(0, len(ids), 100):
+        totals = [total + value for total, value in zip(totals, predictor.simulate(ids[start:start + 100], taken[start:start + 100]))]
+
+    assert tuple(totals) == whole
+    assert len(passes) <= len(ids) // Predictor.TRIM_SLACK
+
+
+@pytest.mark.parametrize('name', sorted(LOOPS))
+def test_python_loops_match_compiled_ones(trace_path, name, monkeypatch):
+    # Without numba the kernels run their loops in Python, which must leave the same results and state
+    if kernels.numba is None:
+        pytest.skip("numba is not installed")
+    branch = Branch(trace_path, progress_toggle=False)
+    for size in SIZES + (1024,):
+        compiled = PREDICTOR_TYPES[name](size)
+        compiled_results = [compiled.simulate(ids, taken) for ids, taken, _ in branch.iter_id_chunks()]
+        with monkeypatch.context() as patch:
+            patch.setattr(kernels, LOOPS[name], None)
+            python = PREDICTOR_TYPES[name](size)
+            python_results = [python.simulate(ids, taken) for ids, taken, _ in branch.iter_id_chunks()]
+        assert python_results == compiled_results, (name, size)
+        assert python.canonical_state() == compiled.canonical_state(), (name, size)
+
+
+def test_one_pass_matches_separate_runs(trace_path):
+    # Compare All: every predictor type side by side, of several sizes and gshare history lengths
+    configurations = [lambda name=name, size=size: PREDICTOR_TYPES[name](size)
+                      for name in sorted(PREDICTOR_TYPES) for size in (4, 64)]
+    configurations += [lambda bits=bits: PREDICTOR_TYPES['Gshare Predictor'](64, bits) for bits in (0, 3, 12)]
+    for branch in (Branch(trace_path, progress_toggle=False), BranchStream(trace_path, chunk_size=4099)):
+        together = Predictor.predict_together([make() for make in configurations], branch)
+        assert together == [make().predict_branch(branch) for make in configurations], type(branch).__name__
+
+
+def test_one_pass_collects_what_separate_runs_do(trace_path):
+    branch = Branch(trace_path, progress_toggle=False)
+    names = ['One Bit Predictor', 'Improved Predictor', 'Set Associative Predictor', 'Tournament Predictor']
+    statistics = [BranchStatistics() for _ in names]
+    metrics = [WindowedMetrics(5000, 20000) for _ in names]
+    Predictor.predict_together([PREDICTOR_TYPES[name](16) for name in names], branch, statistics=statistics,
+                               metrics=metrics)
+
+    for name, together_statistics, together_metrics in zip(names, statistics, metrics):
+        alone_statistics = BranchStatistics()
+        alone_metrics = WindowedMetrics(5000, 20000)
+        PREDICTOR_TYPES[name](16).predict_branch(branch, statistics=alone_statistics, metrics=alone_metrics)
+        assert np.array_equal(together_statistics.counts, alone_statistics.counts), name
+        assert together_metrics.rows() == alone_metrics.rows(), name
@@ -0,0 +1,28 @@
+import pickle
+
+from src.models.Branch import Branch
+from src.models.BranchStream import BranchStream
+
+
+def test_branch_pickles_as_a_reference_to_its_binary_trace(trace_path):
+    branch = Branch(trace_path, progress_toggle=False)
+    data = pickle.dumps(branch)
+    assert len(data) < 1024
+
+    copy = pickle.loads(data)
+    assert copy.trace.path == branch.trace.path
+    assert len(copy) == len(branch)
+    assert copy[:100] == branch[:100]
+    assert copy[-1] == branch[-1]
+
+
+def test_stream_pickles_as_its_path(trace_path):
+    copy = pickle.loads(pickle.dumps(BranchStream(trace_path, chunk_size=4099)))
+    assert (copy.filePath, copy.chunk_size) == (trace_path, 4099)
+    assert len(copy.static_addresses) == 0
+
+
+def test_process_pool_matches_threads(trace_path, run_serial_and):
+    cells = [(trace_path, name, size) for name in ('One Bit Predictor', 'Gshare Predictor', 'Tournament Predictor')
+             for size in (16, 256)]
+    run_serial_and(cells, dict(processes=True, max_workers=2))
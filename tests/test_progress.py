@@ -0,0 +1,54 @@
+import concurrent.futures
+import multiprocessing
+import os
+
+from rich.progress import Progress
+
+from src.utils.progress import BOARD_SLOTS, ProgressBoard, reporter
+
+
+def test_counters_add_up_per_task_across_blocks():
+    progress = Progress(disable=True)
+    loading = progress.add_task('load', total=None)
+    processing = progress.add_task('process', total=None)
+
+    with ProgressBoard(progress, interval=60) as board:
+        counters = [board.counter(loading if index % 3 else processing) for index in range(BOARD_SLOTS + 10)]
+        for index, counter in enumerate(counters):
+            counter.advance(index)
+        folder = board.folder
+        assert len(board.paths) == 2
+
+    completed = {task.id: task.completed for task in progress.tasks}
+    expected_processing = sum(index for index in range(BOARD_SLOTS + 10) if not index % 3)
+    assert completed[processing] == expected_processing
+    assert completed[loading] == sum(range(BOARD_SLOTS + 10)) - expected_processing
+    # The board takes its counter files with it
+    assert not os.path.exists(folder)
+
+
+def test_a_worker_process_advances_the_same_slot():
+    progress = Progress(disable=True)
+    task = progress.add_task('process', total=None)
+
+    with ProgressBoard(progress, interval=60) as board:
+        counter = board.counter(task)
+        counter.advance(5)
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            pool.submit(counter.advance, 37).result()
+        assert counter.counts[counter.slot] == 42
+
+    assert progress.tasks[0].completed == 42
+
+
+def test_reporter_prefers_the_counter():
+    progress = Progress(disable=True)
+    task = progress.add_task('load', total=None)
+    with ProgressBoard(progress, interval=60) as board:
+        counter = board.counter(task)
+        assert reporter(counter, progress, task) == counter.advance
+
+    advance = reporter(None, progress, task)
+    advance(3)
+    assert progress.tasks[0].completed == 3
+    assert reporter() is None
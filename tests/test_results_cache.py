@@ -0,0 +1,116 @@
+import functools
+import json
+import os
+import shutil
+
+import pytest
+
+from src import runner
+from src.utils.files import atomic_write
+from src.utils.results_cache import JOURNAL_MIN_LENGTH, ResultCache
+
+
+def test_atomic_write_keeps_the_old_file_when_interrupted(tmp_path):
+    path = tmp_path / 'file.txt'
+    with atomic_write(str(path), 'w') as file:
+        file.write('old')
+    with pytest.raises(KeyboardInterrupt):
+        with atomic_write(str(path), 'w') as file:
+            file.write('new')
+            raise KeyboardInterrupt
+    assert path.read_text() == 'old'
+    assert os.listdir(tmp_path) == ['file.txt']
+
+
+def test_saves_append_only_what_changed(tmp_path):
+    path = str(tmp_path / 'results.json')
+    cache = ResultCache(path)
+    for index in range(10):
+        cache.put(f"key{index}", (index, index, index))
+    cache.save()
+
+    cache = ResultCache(path)
+    assert cache.get('key3') == (3, 3, 3)
+    cache.put('key10', (10, 10, 10))
+    cache.save()
+
+    with open(path + '.journal') as file:
+        lines = [json.loads(line)[0] for line in file]
+    assert lines == [f"key{index}" for index in range(10)] + ['key3', 'key10']
+    reloaded = ResultCache(path)
+    assert len(reloaded) == 11
+    assert reloaded.clock == cache.clock
+    assert reloaded.entries['key3']['used'] > reloaded.entries['key9']['used']
+
+
+def test_an_unchanged_cache_writes_nothing(tmp_path):
+    path = str(tmp_path / 'results.json')
+    ResultCache(path).save()
+    assert os.listdir(tmp_path) == []
+
+
+def test_journal_is_compacted_into_the_file(tmp_path):
+    # Once the journal would hold more lines than there are entries, the file is rewritten instead
+    path = str(tmp_path / 'results.json')
+    cache = ResultCache(path)
+    for index in range(JOURNAL_MIN_LENGTH):
+        cache.put(f"key{index}", (index, index, index))
+    cache.save()
+    assert os.path.exists(path + '.journal')
+
+    cache.get('key0')
+    cache.save()
+    assert not os.path.exists(path + '.journal')
+    reloaded = ResultCache(path)
+    assert len(reloaded) == JOURNAL_MIN_LENGTH
+    assert reloaded.get('key0') == (0, 0, 0)
+
+
+def test_eviction_keeps_the_most_recently_used(tmp_path):
+    path = str(tmp_path / 'results.json')
+    cache = ResultCache(path, limit=3)
+    for index in range(3):
+        cache.put(f"key{index}", (index, index, index))
+    cache.save()
+    cache.get('key0')
+    cache.put('key3', (3, 3, 3))
+    cache.save()
+    assert sorted(ResultCache(path, limit=3).entries) == ['key0', 'key2', 'key3']
+
+
+def test_a_line_cut_short_is_skipped(tmp_path):
+    path = str(tmp_path / 'results.json')
+    cache = ResultCache(path)
+    cache.put('key0', (0, 0, 0))
+    cache.save()
+    with open(path + '.journal', 'a') as file:
+        file.write('["key1", {"result": [1,')
+    assert sorted(ResultCache(path).entries) == ['key0']
+
+
+def test_cached_cells_are_not_simulated_again(trace_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(runner, 'ResultCache', functools.partial(ResultCache, str(tmp_path / 'results.json')))
+    options = dict(show_progress=False, save=False)
+    cells = [(trace_path, name, size) for name in ('Two Bit Predictor', 'Gshare Predictor') for size in (4, 64)]
+    first, _ = runner.run_cells(cells, **options)
+
+    simulated = []
+    plan_jobs = runner.plan_jobs
+    def counting(branches, cells, *args, **kwargs):
+        simulated.extend(cells)
+        return plan_jobs(branches, cells, *args, **kwargs)
+    monkeypatch.setattr(runner, 'plan_jobs', counting)
+
+    # The cache is keyed by content: a renamed copy of the trace, looked up once its load has converted it,
+    # reuses the results too
+    copy = str(tmp_path / 'copy.txt')
+    shutil.copyfile(trace_path, copy)
+    again, _ = runner.run_cells(cells + [(copy, name, size) for _, name, size in cells], **options)
+    assert simulated == []
+    assert again == {**first, **{(copy, name, size): first[(trace_path, name, size)] for _, name, size in cells}}
+
+    # An edited trace is a new trace
+    with open(copy, 'a') as file:
+        file.write('3000000000 T\n')
+    runner.run_cells([(copy, 'Two Bit Predictor', 4)], **options)
+    assert simulated == [(copy, 'Two Bit Predictor', 4)]
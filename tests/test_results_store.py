@@ -0,0 +1,77 @@
+from contextlib import closing
+
+import pytest
+
+from src.utils import utils
+from src.utils.results_store import open_store, is_empty, add_run, upsert_results, query_results, stored_predictors, \
+    stored_traces
+
+ROWS = [('a.txt', 'Two Bit Predictor', 16, 90.0, 85.0, 95.0),
+        ('a.txt', 'Two Bit Predictor', 32, 91.0, 86.0, 95.0),
+        ('b.txt', 'Gshare Predictor', 16, 80.0, 75.0, 94.0)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    with closing(open_store(str(tmp_path / 'results.sqlite3'))) as connection:
+        yield connection
+
+
+def test_latest_run_of_each_cell_wins(store):
+    assert is_empty(store)
+    upsert_results(store, add_run(store, branches=100, wall_time=2.0), ROWS)
+    upsert_results(store, add_run(store), [('a.txt', 'Two Bit Predictor', 16, 92.0, 87.0, 95.0)])
+
+    assert query_results(store) == [ROWS[0][:3] + (92.0, 87.0, 95.0), ROWS[1], ROWS[2]]
+    assert store.execute('SELECT branches_per_second FROM runs ORDER BY id').fetchall() == [(50.0,), (None,)]
+
+
+def test_filters(store):
+    upsert_results(store, add_run(store), ROWS)
+    assert query_results(store, predictor='Two Bit Predictor', size=32) == [ROWS[1]]
+    assert query_results(store, trace='b.txt') == [ROWS[2]]
+    assert query_results(store, trace='c.txt') == []
+    assert stored_predictors(store) == ['Gshare Predictor', 'Two Bit Predictor']
+    assert stored_traces(store) == ['a.txt', 'b.txt']
+
+
+def test_a_run_rewriting_a_cell_keeps_one_row(store):
+    run = add_run(store)
+    upsert_results(store, run, ROWS)
+    upsert_results(store, run, [ROWS[0][:3] + (10.0, 10.0, 10.0)])
+    assert store.execute('SELECT COUNT(*) FROM results').fetchone() == (len(ROWS),)
+    assert query_results(store, size=16, predictor='Two Bit Predictor') == [ROWS[0][:3] + (10.0, 10.0, 10.0)]
+
+
+def test_exported_csv_imports_into_a_new_store(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'csvFolder', str(tmp_path / 'csv'))
+    upsert_results(store, add_run(store), ROWS)
+    for predictor in stored_predictors(store):
+        utils.export_results_csv(store, predictor)
+    assert sorted(path.name for path in (tmp_path / 'csv').iterdir()) == \
+        ['gshare_predictor_results.csv', 'two_bit_predictor_results.csv']
+
+    with closing(open_store(str(tmp_path / 'imported.sqlite3'))) as imported:
+        utils.import_csv_results(imported)
+        assert query_results(imported) == query_results(store)
+        assert [source for source, in imported.execute('SELECT source FROM runs ORDER BY source')] == \
+            ['gshare_predictor_results.csv', 'two_bit_predictor_results.csv']
+
+
+def test_viewing_saved_data_writes_no_csv(tmp_path, monkeypatch):
+    from src import app
+
+    monkeypatch.setattr(utils, 'csvFolder', str(tmp_path / 'csv'))
+    monkeypatch.setattr(utils, 'open_store', lambda: open_store(str(tmp_path / 'results.sqlite3')))
+    with closing(utils.results_store()) as connection:
+        upsert_results(connection, add_run(connection), ROWS)
+
+    answers = iter([{'action': 'View Saved Data'}, {'predictor': 'All Predictors'}])
+    monkeypatch.setattr(app.inquirer, 'prompt', lambda questions: next(answers))
+    action, table = app.get_user_selections()
+    assert action == 'view' and table.row_count == len(ROWS)
+    assert not (tmp_path / 'csv').exists()
+
+    monkeypatch.setattr(app.inquirer, 'prompt', lambda questions: {'action': 'Export Saved Data'})
+    action, predictors = app.get_user_selections()
+    assert (action, predictors) == ('export', ['Gshare Predictor', 'Two Bit Predictor'])
@@ -0,0 +1,143 @@
+import os
+
+import pytest
+
+from src import runner
+from src.models.Branch import Branch
+from src.models.BranchStream import BranchStream
+from src.utils.sharding import shard_ranges
+from src.utils.synthetic import generate_trace
+from tests.conftest import RUN_OPTIONS
+
+CELLS = [('One Bit Predictor', 4), ('One Bit Predictor', 16), ('One Bit Predictor', 64), ('Two Bit Predictor', 16),
+         ('Improved Predictor', 16)]
+
+
+def planned(jobs):
+    # (function name, progress units, cells) of every job
+    return [(function.__name__, units, cells) for function, _, units, cells in jobs]
+
+
+@pytest.fixture
+def cells(trace_path):
+    return [(trace_path, name, size) for name, size in CELLS]
+
+
+@pytest.fixture
+def sweeps(monkeypatch):
+    # One Bit cells of a trace share a sweep from 3 sizes on, whether numba is installed or not
+    monkeypatch.setattr(runner, 'sweep_min_sizes', lambda: 3)
+
+
+def test_cells_of_a_loaded_trace_share_a_pass_only_when_fused(trace_path, cells):
+    branch = Branch(trace_path, progress_toggle=False)
+    total = branch.progress_total
+    rest = [cell for cell in cells if cell[1] != 'One Bit Predictor']
+
+    assert planned(runner.plan_jobs({trace_path: branch}, rest)) == [('compare_file', total, rest)]
+    assert planned(runner.plan_jobs({trace_path: branch}, rest, fuse=False)) == \
+        [('process_file', total, [cell]) for cell in rest]
+    # Every job would parse a stream again, so its cells always share one
+    stream = BranchStream(trace_path)
+    assert planned(runner.plan_jobs({trace_path: stream}, rest, fuse=False)) == \
+        [('compare_file', stream.progress_total, rest)]
+
+
+def test_one_bit_cells_share_a_sweep_from_the_minimum_sizes_on(trace_path, cells, sweeps):
+    branch = Branch(trace_path, progress_toggle=False)
+    total = branch.progress_total
+    one_bit, rest = cells[:3], cells[3:]
+
+    assert planned(runner.plan_jobs({trace_path: branch}, cells)) == \
+        [('sweep_file', 3 * total, one_bit), ('compare_file', total, rest)]
+    assert planned(runner.plan_jobs({trace_path: branch}, cells, fuse=False)) == \
+        [('sweep_file', 3 * total, one_bit)] + [('process_file', total, [cell]) for cell in rest]
+    # Too few sizes, or windows a sweep does not count, leave the One Bit cells to the other jobs
+    assert planned(runner.plan_jobs({trace_path: branch}, cells[1:])) == [('compare_file', total, cells[1:])]
+    assert planned(runner.plan_jobs({trace_path: branch}, cells, windows=(1000, None))) == \
+        [('compare_file', total, cells)]
+
+
+def test_numba_leaves_one_bit_cells_to_the_batch_kernel(trace_path, cells, monkeypatch):
+    monkeypatch.setattr(runner, 'sweep_min_sizes', lambda: None)
+    branch = Branch(trace_path, progress_toggle=False)
+    assert planned(runner.plan_jobs({trace_path: branch}, cells)) == [('compare_file', branch.progress_total, cells)]
+
+
+def test_checkpoints_and_shards_split_the_cells(trace_path, cells, sweeps):
+    branch = Branch(trace_path, progress_toggle=False)
+    total = branch.progress_total
+
+    jobs = planned(runner.plan_jobs({trace_path: branch}, cells, checkpoints=True))
+    assert jobs == [('process_file', total, [cell]) for cell in cells]
+
+    # Shards of the predictors with a batch kernel, a whole-trace job for the others
+    jobs = planned(runner.plan_jobs({trace_path: branch}, cells, shards=4))
+    assert [cells for _, _, cells in jobs] == [[cell] for cell in cells[:4] for _ in range(4)] + [[cells[4]]]
+    assert [units for function, units, _ in jobs if function == 'shard_file'] == \
+        [stop - start for start, stop in shard_ranges(len(branch), 4)] * 4
+    assert jobs[-1] == ('process_file', total, [cells[4]])
+
+
+def test_an_observed_trace_is_one_pass_whatever_the_options(trace_path, cells, sweeps):
+    branch = Branch(trace_path, progress_toggle=False)
+    jobs = runner.plan_jobs({trace_path: branch}, cells, checkpoints=True, shards=4, observe=(True, 0, None))
+    assert planned(jobs) == [('observe_file', branch.progress_total, cells)]
+
+
+@pytest.fixture
+def traces(tmp_path):
+    # Traces of different lengths, listed out of order
+    return [generate_trace(str(tmp_path / f"trace{length}.txt"), length, static_branches=64, seed=length)
+            for length in (3000, 9000, 1000, 6000, 12000)]
+
+
+def recording_loads(monkeypatch, traces, cells_per_trace):
+    # Records, whenever a trace starts loading, the traces loaded but with jobs still to finish, this one included
+    loads = []
+    open_traces = {}
+    paths = {}
+
+    def loading(path, counter, load_file=runner.load_file):
+        open_traces[path] = cells_per_trace
+        loads.append((path, sorted(path for path, cells in open_traces.items() if cells)))
+        branch = load_file(path, counter)
+        paths[id(branch)] = path
+        return branch
+
+    def job(function):
+        def run(branch, *args):
+            result = function(branch, *args)
+            open_traces[paths[id(branch)]] -= len(result) if isinstance(result, list) else 1
+            return result
+        return run
+
+    monkeypatch.setattr(runner, 'load_file', loading)
+    for name in ('process_file', 'compare_file', 'sweep_file'):
+        monkeypatch.setattr(runner, name, job(getattr(runner, name)))
+    return loads
+
+
+def test_traces_load_largest_first_one_at_a_time(traces, monkeypatch, sweeps):
+    monkeypatch.setattr(runner, 'MAX_RESIDENT_TRACES', 1)
+    loads = recording_loads(monkeypatch, traces, len(CELLS))
+    cells = [(path, name, size) for path in traces for name, size in CELLS]
+    started = []
+    for name in ('sweep_file', 'compare_file'):
+        function = getattr(runner, name)
+        monkeypatch.setattr(runner, name, lambda branch, *args, function=function, name=name:
+                            started.append(name) or function(branch, *args))
+
+    accuracies, _ = runner.run_cells(cells, max_workers=1, **RUN_OPTIONS)
+    assert [path for path, _ in loads] == sorted(traces, key=os.path.getsize, reverse=True)
+    assert [resident for _, resident in loads] == [[path] for path, _ in loads]
+    # The jobs of a trace start largest first: its sweep of three sizes, then the pass over the others
+    assert started == ['sweep_file', 'compare_file'] * len(traces)
+    assert sorted(accuracies) == sorted(cells)
+
+
+def test_no_more_than_the_resident_traces_are_loaded(traces, monkeypatch):
+    loads = recording_loads(monkeypatch, traces, 1)
+    runner.run_cells([(path, 'Two Bit Predictor', 16) for path in traces], max_workers=1, **RUN_OPTIONS)
+    assert sorted(path for path, _ in loads) == sorted(traces)
+    assert max(len(resident) for _, resident in loads) <= runner.MAX_RESIDENT_TRACES
@@ -0,0 +1,45 @@
+import pytest
+
+from src.models.Branch import Branch
+from src.models.WindowedMetrics import WindowedMetrics
+from src.runner import PREDICTOR_TYPES
+from src.utils.sharding import shard_ranges, run_shard, reconcile_shards
+
+SIZES = (1, 16, 256)
+SHARDED = [name for name, cls in PREDICTOR_TYPES.items() if cls.has_batch_kernel]
+
+
+def test_sharded_matches_serial(trace_path, run_serial_and):
+    run_serial_and([(trace_path, name, size) for name in PREDICTOR_TYPES for size in SIZES], dict(shards=4))
+
+
+@pytest.mark.parametrize('name', SHARDED)
+def test_reconciled_shards_match_serial(trace_path, name):
+    # Short warm-ups and blocks, so that reconciliation has to repair shards and converge within them
+    branch = Branch(trace_path, progress_toggle=False)
+    for size in SIZES:
+        expected = WindowedMetrics(1000)
+        serial = PREDICTOR_TYPES[name](size).predict_branch(branch, metrics=expected)
+        shards = [run_shard(PREDICTOR_TYPES[name], size, branch, start, stop, warmup=200, block=500, window=20000,
+                            metrics_window=1000) for start, stop in shard_ranges(len(branch), 5)]
+        metrics = WindowedMetrics(1000, expected_branches=len(branch))
+        totals, report = reconcile_shards(PREDICTOR_TYPES[name], size, branch, shards, metrics)
+
+        assert report['exact'], (name, size)
+        assert PREDICTOR_TYPES[name].accuracies(*totals, len(branch)) == serial, (name, size)
+        assert metrics.rows() == expected.rows(), (name, size)
+
+
+@pytest.mark.parametrize('name', SHARDED)
+def test_unconverged_shards_stay_bounded(trace_path, name):
+    # Without a warm-up or enough repair window the result may be approximate, but its counts stay whole
+    branch = Branch(trace_path, progress_toggle=False)
+    shards = [run_shard(PREDICTOR_TYPES[name], 256, branch, start, stop, warmup=0, block=100, window=200,
+                        metrics_window=1000) for start, stop in shard_ranges(len(branch), 5)]
+    metrics = WindowedMetrics(1000, expected_branches=len(branch))
+    totals, report = reconcile_shards(PREDICTOR_TYPES[name], 256, branch, shards, metrics)
+
+    assert report['exact'] == (report['error_bound'] == 0)
+    assert report['error_bound'] <= len(branch)
+    assert tuple(metrics.counts[1:, :len(metrics)].sum(axis=1)) == totals
+    assert metrics.counts[0, :len(metrics)].sum() == len(branch)
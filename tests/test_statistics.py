@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from src.models.Branch import Branch
+from src.models.BranchStatistics import (BranchStatistics, COUNT_FIELDS, DEFAULT_CORRECT, MISPREDICTED, PREDICTED,
+                                         STATISTICS_FIELDS)
+from src.models.Predictor import Predictor
+from src.runner import PREDICTOR_TYPES
+
+
+def reference_counts(branch, predictor):
+    # COUNT_FIELDS per static ID from the result codes of one run, counted branch by branch
+    counts = {}
+    last_outcome = {}
+    for ids, taken, _ in branch.iter_id_chunks():
+        results = bytearray(len(ids))
+        predictor.simulate(ids, taken, branch.static_addresses, results)
+        for address, outcome, code in zip(ids.tolist(), taken.tolist(), results):
+            row = counts.setdefault(address, [0] * len(COUNT_FIELDS))
+            row[0] += 1
+            row[1] += outcome
+            row[2] += code >= MISPREDICTED
+            row[3] += code == PREDICTED
+            row[4] += code < MISPREDICTED and address not in last_outcome
+            row[5] += code == DEFAULT_CORRECT
+            row[6] += address in last_outcome and last_outcome[address] != outcome
+            last_outcome[address] = outcome
+    return counts
+
+
+@pytest.mark.parametrize('name', sorted(PREDICTOR_TYPES))
+def test_counts_match_reference(trace_path, name):
+    branch = Branch(trace_path, progress_toggle=False)
+    statistics = BranchStatistics()
+    PREDICTOR_TYPES[name](16).predict_branch(branch, statistics=statistics)
+    expected = reference_counts(branch, PREDICTOR_TYPES[name](16))
+
+    counts = statistics.counts
+    assert len(statistics) == len(branch.static_addresses)
+    assert {address: counts[:, address].tolist() for address in range(len(statistics))} == expected
+
+
+@pytest.mark.parametrize('name', ['One Bit Predictor', 'Two Bit Predictor', 'Improved Predictor'])
+def test_kernel_result_codes_match_reference_path(trace_path, name):
+    # The fallback simulate() drives predict/update, the codes the kernels write must be the same
+    branch = Branch(trace_path, progress_toggle=False)
+    for size in (1, 16, 1024):
+        kernel = PREDICTOR_TYPES[name](size)
+        fallback = PREDICTOR_TYPES[name](size)
+        for ids, taken, _ in branch.iter_id_chunks():
+            kernel_results = bytearray(len(ids))
+            fallback_results = bytearray(len(ids))
+            kernel.simulate(ids, taken, branch.static_addresses, kernel_results)
+            Predictor.simulate(fallback, ids, taken, branch.static_addresses, fallback_results)
+            assert kernel_results == fallback_results, (name, size)
+
+
+@pytest.mark.parametrize('name', ['One Bit Predictor', 'Two Bit Predictor'])
+def test_covered_runs_match_runs_counting_every_branch(trace_path, name):
+    # A run over the whole trace takes its hits from the outcome pairs, chunks added on their own cannot
+    branch = Branch(trace_path, progress_toggle=False)
+    covered = BranchStatistics()
+    PREDICTOR_TYPES[name](16).predict_branch(branch, statistics=covered)
+    every = BranchStatistics()
+    predictor = PREDICTOR_TYPES[name](16)
+    for ids, taken, _ in branch.iter_id_chunks():
+        predictor.simulate_chunk(ids, taken, branch.static_addresses, every)
+    every.attach(branch)
+    assert np.array_equal(covered.counts, every.counts)
+
+
+def test_chunks_add_up_wherever_they_split(trace_path):
+    branch = Branch(trace_path, progress_toggle=False)
+    whole = BranchStatistics()
+    pieces = BranchStatistics()
+    predictor = PREDICTOR_TYPES['Gshare Predictor'](64)
+    for ids, taken, _ in branch.iter_id_chunks():
+        results = bytearray(len(ids))
+        predictor.simulate(ids, taken, branch.static_addresses, results)
+        whole.add(ids, taken, results)
+        for start in range(0, len(ids), 997):
+            pieces.add(ids[start:start + 997], taken[start:start + 997], results[start:start + 997])
+    assert np.array_equal(whole.counts, pieces.counts)
+
+
+def test_rows_put_the_most_wrongly_predicted_first(trace_path):
+    branch = Branch(trace_path, progress_toggle=False)
+    statistics = BranchStatistics()
+    PREDICTOR_TYPES['Two Bit Predictor'](16).predict_branch(branch, statistics=statistics)
+    rows = statistics.rows()
+    fields = [dict(zip(STATISTICS_FIELDS, row)) for row in rows]
+
+    assert sum(row['executions'] for row in fields) == len(branch)
+    static_ids = {format(address, branch.address_format): static_id
+                  for static_id, address in enumerate(branch.static_addresses)}
+    order = [(row['correct_predictions'] + row['default_correct'] - row['executions'], static_ids[row['address']])
+             for row in fields]
+    assert order == sorted(order)
+    for row in fields:
+        assert row['mispredictions'] == row['predictions'] - row['correct_predictions']
+        assert row['cold_misses'] + row['eviction_misses'] == row['executions'] - row['predictions']
+        assert row['accuracy'] == pytest.approx(
+            (row['correct_predictions'] + row['default_correct']) / row['executions'] * 100)
+    assert statistics.top(5) == rows[:5]
@@ -0,0 +1,36 @@
+from src.models.Branch import Branch
+from src.models.BranchStream import BranchStream
+from src.runner import PREDICTOR_TYPES
+
+
+def test_streamed_matches_serial(trace_path, run_serial_and):
+    run_serial_and([(trace_path, name, size) for name in PREDICTOR_TYPES for size in (1, 16, 256)], dict(streaming=True))
+
+
+def test_stream_matches_loaded_trace(hex_trace_path):
+    branch = Branch(hex_trace_path, progress_toggle=False)
+    stream = BranchStream(hex_trace_path)
+    for name in PREDICTOR_TYPES:
+        assert PREDICTOR_TYPES[name](16).predict_branch(stream) == PREDICTOR_TYPES[name](16).predict_branch(branch), name
+
+
+def test_small_chunks_match_one_chunk(trace_path):
+    # Chunk boundaries fall anywhere in a line and IDs are interned across chunks
+    branch = Branch(trace_path, progress_toggle=False)
+    stream = BranchStream(trace_path, chunk_size=4099)
+    assert sum(count for _, count, _ in stream.iter_chunks()) == len(branch)
+    assert stream.static_addresses.tolist() == branch.static_addresses.tolist()
+    for name in ('Two Bit Predictor', 'Improved Predictor'):
+        assert PREDICTOR_TYPES[name](16).predict_branch(stream) == PREDICTOR_TYPES[name](16).predict_branch(branch), name
+
+
+def test_published_addresses_grow_as_prefixes(trace_path):
+    # Every chunk sees a table covering its IDs, and earlier tables are never rewritten
+    stream = BranchStream(trace_path, chunk_size=4099)
+    tables = []
+    for ids, _, _ in stream.iter_id_chunks():
+        assert int(ids.max()) < len(stream.static_addresses)
+        tables.append(stream.static_addresses)
+    final = stream.static_addresses.tolist()
+    assert all(table.tolist() == final[:len(table)] for table in tables)
+    assert final == Branch(trace_path, progress_toggle=False).static_addresses.tolist()
@@ -0,0 +1,11 @@
+from src.models.Branch import Branch
+from src.models.OneBitPredictor import OneBitPredictor
+
+
+def test_sweep_matches_each_size(trace_path):
+    branch = Branch(trace_path, progress_toggle=False)
+    sizes = [1, 2, 3, 5, 8, 16, 33, 64, 100, 1000]
+    results = OneBitPredictor.sweep(branch, sizes)
+    assert sorted(results) == sizes
+    for size in sizes:
+        assert results[size] == OneBitPredictor(size).predict_branch(branch, batch=False), size
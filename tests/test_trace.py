@@ -0,0 +1,59 @@
+import io
+
+import numpy as np
+import pytest
+
+from src.models.Branch import Branch
+from src.utils.trace import parse_trace_chunks
+
+
+def write_trace(path, addresses, outcomes='TN'):
+    with open(path, 'w') as file:
+        for index, address in enumerate(addresses):
+            file.write(f"{address} {outcomes[index % len(outcomes)]}\n")
+    return str(path)
+
+
+def test_hex_letters_after_the_first_lines_make_the_trace_hexadecimal(tmp_path):
+    # Hexadecimal addresses without a prefix, of which the first few thousand happen to have no letter
+    text = [str(400000 + index) for index in range(3000)] + ['4ffffa', '4ffffb']
+    branch = Branch(write_trace(tmp_path / 'hex.txt', text), progress_toggle=False)
+    assert branch.address_format == 'x'
+    assert np.array_equal(np.asarray(branch.static_addresses, dtype=np.uint64), [int(address, 16) for address in text])
+
+
+@pytest.mark.parametrize('text, expected', [(['4005d0', '3000000001'], 'x'), (['0x4005d0', '0x10'], '#x'),
+                                            (['3000000001', '3000000002'], 'd')])
+def test_address_formats(tmp_path, text, expected):
+    assert Branch(write_trace(tmp_path / 'trace.txt', text), progress_toggle=False).address_format == expected
+
+
+def test_chunks_that_disagree_are_rejected():
+    # Once chunks were read as decimal, a later one with hex digits cannot be read the same way
+    text = b''.join(b"%d T\n" % (400000 + index) for index in range(1000)) + b"4ffffa N\n"
+    with pytest.raises(ValueError, match='Ambiguous trace'):
+        list(parse_trace_chunks(io.BytesIO(text), chunk_size=1024))
+
+
+def test_decimal_chunks_after_hexadecimal_ones_stay_hexadecimal():
+    text = b"4ffffa N\n" + b''.join(b"%d T\n" % (400000 + index) for index in range(1000))
+    chunks = list(parse_trace_chunks(io.BytesIO(text), chunk_size=1024))
+    assert len(chunks) > 1
+    assert {address_format for address_format, _, _, _ in chunks} == {'x'}
+    assert np.concatenate([addresses for _, addresses, _, _ in chunks]).tolist() == \
+        [0x4ffffa] + [int(str(400000 + index), 16) for index in range(1000)]
+
+
+@pytest.mark.parametrize('index', [slice(None), slice(3, 50, 7), slice(-20, None), slice(None, None, -3),
+                                   slice(100, 5, -2), slice(5, 5), slice(-10 ** 6, 10 ** 9)])
+def test_slices_match_a_list_of_pairs(trace_path, index):
+    branch = Branch(trace_path, progress_toggle=False)
+    pairs = list(branch)
+    assert branch[index] == pairs[index]
+    assert branch[-1] == pairs[-1]
+
+
+@pytest.mark.parametrize('index', [1.0, '1', None])
+def test_other_indices_raise_type_error(trace_path, index):
+    with pytest.raises(TypeError):
+        Branch(trace_path, progress_toggle=False)[index]
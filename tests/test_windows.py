@@ -0,0 +1,83 @@
+import csv
+
+import pytest
+
+from src.models.Branch import Branch
+from src.models.OneBitPredictor import OneBitPredictor
+from src.models.WindowedMetrics import WINDOW_FIELDS, WindowedMetrics
+from src.utils import utils
+
+# Two branches through a One Bit table of one entry, which misses whenever the other branch came between,
+# and a miss is predicted not taken: windows of 3 branches, the last one holding a single branch
+TRACE = ['100 T', '100 N', '100 N', '200 T', '100 T', '100 T', '200 N']
+COUNTS = [(3, 2, 1, 1),  # wrong default, wrong then right prediction
+          (3, 1, 1, 1),  # two wrong defaults, a right prediction
+          (1, 0, 0, 1)]  # right default
+
+
+@pytest.fixture
+def branch_path(tmp_path):
+    path = tmp_path / 'windows.txt'
+    path.write_text(''.join(f"{line}\n" for line in TRACE))
+    return str(path)
+
+
+@pytest.fixture
+def branch(branch_path):
+    return Branch(branch_path, progress_toggle=False)
+
+
+def percentages(branches, predictions, correct_predictions, correct):
+    return (100 * predictions / branches, 100 * correct_predictions / predictions if predictions else 0,
+            100 * correct / branches)
+
+
+def test_windows_match_hand_computed_counts(branch):
+    metrics = WindowedMetrics(3)
+    result = OneBitPredictor(1).predict_branch(branch, metrics=metrics)
+
+    assert metrics.fields() == WINDOW_FIELDS
+    rows = metrics.rows()
+    assert [row[:6] for row in rows] == [(window, 3 * window, *counts) for window, counts in enumerate(COUNTS)]
+    assert [row[6:] for row in rows] == [pytest.approx(percentages(*counts)) for counts in COUNTS]
+    assert result == OneBitPredictor(1).predict_branch(branch)
+
+
+def test_decayed_windows_follow_the_half_life(branch):
+    # With a half life of one window every window weighs half the one after it
+    metrics = WindowedMetrics(3, half_life=3)
+    OneBitPredictor(1).predict_branch(branch, metrics=metrics)
+
+    decayed = []
+    total = (0, 0, 0, 0)
+    for counts in COUNTS:
+        total = tuple(0.5 * old + new for old, new in zip(total, counts))
+        decayed.append(total)
+    assert decayed[-1] == (3.25, 1, 0.75, 1.75)
+    assert [row[9:] for row in metrics.rows()] == [pytest.approx(percentages(*counts)) for counts in decayed]
+
+
+def test_csv_round_trip(branch, branch_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'csvFolder', str(tmp_path / 'csv'))
+    metrics = WindowedMetrics(3, half_life=3)
+    OneBitPredictor(1).predict_branch(branch, metrics=metrics)
+
+    path = utils.save_windowed_metrics(metrics, branch_path, OneBitPredictor, 1)
+    assert path == str(tmp_path / 'csv' / 'windows' / 'windows.txt.OneBitPredictor.1.csv')
+    with open(path, newline='') as file:
+        header, *rows = csv.reader(file)
+    assert tuple(header) == metrics.fields()
+    assert [tuple(int(value) for value in row[:6]) for row in rows] == [row[:6] for row in metrics.rows()]
+    assert [[float(value) for value in row[6:]] for row in rows] == \
+        [pytest.approx(row[6:], abs=0.005) for row in metrics.rows()]
+
+
+def test_plot_is_written(branch, tmp_path):
+    series = {}
+    for half_life in (None, 3):
+        series[f"half life {half_life}"] = metrics = WindowedMetrics(3, half_life)
+        OneBitPredictor(1).predict_branch(branch, metrics=metrics)
+
+    path = utils.plot_windowed_metrics(series, 'windows.txt', str(tmp_path / 'plots' / 'windows.png'))
+    with open(path, 'rb') as file:
+        assert file.read(8) == b'\x89PNG\r\n\x1a\n'